@@ -1,4 +1,4 @@
-import { Command, Response, isCommandSystem, isCommandUI, CommandUI, CommandSystem } from './types/commands'
+import { Command, Response, isCommandSystem, isCommandUI, CommandUI, CommandSystem, CommandBatch, isCommandBatch } from './types/commands'
 import { CommandHandler, System, VisualisationEngine } from './types/modules'
 
 export default class CommandRouter implements CommandHandler {
@@ -16,6 +16,8 @@ export default class CommandRouter implements CommandHandler {
         this.onCommandSystem(command, resolve)
       } else if (isCommandUI(command)) {
         this.onCommandUI(command, resolve)
+      } else if (isCommandBatch(command)) {
+        this.onCommandBatch(command, resolve)
       } else {
         reject(new TypeError('Unknown command' + JSON.stringify(command)))
       }
@@ -27,6 +29,17 @@ export default class CommandRouter implements CommandHandler {
     resolve({ __type__: 'Response', command, payload: { __type__: 'PayloadVoid', value: undefined } })
   }
 
+  onCommandBatch (command: CommandBatch, resolve: (response: Response) => void): void {
+    // donations are sent in order, a render comes last and its response answers the batch
+    const render = command.commands.find(isCommandUI)
+    command.commands.filter(isCommandSystem).forEach((c) => this.system.send(c))
+    if (render !== undefined) {
+      this.onCommandUI(render, resolve)
+    } else {
+      resolve({ __type__: 'Response', command, payload: { __type__: 'PayloadVoid', value: undefined } })
+    }
+  }
+
   onCommandUI (command: CommandUI, reject: (reason?: any) => void): void {
     this.visualisationEngine.render(command).then(
       (response) => { reject(response) },
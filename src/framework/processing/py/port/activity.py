@@ -0,0 +1,167 @@
+"""
+Contains the aggregation of activity over time per alter
+
+The timestamped messages and likes are read from the events of the
+extraction, see port.events. All grouped counts (per alter, per period,
+per kind) are computed in a single vectorized pass, from which several
+consent tables are built without a second scan of the messages or likes.
+Only the (alter, period) pairs that occur are counted, memory grows with
+the number of events and not with the number of alters times periods.
+"""
+
+from array import array
+import logging
+
+import numpy as np
+import pandas as pd
+
+from port.events import LIKED_COMMENT as EVENT_LIKED_COMMENT, LIKED_POST as EVENT_LIKED_POST
+from port.events import NO_TIMESTAMP, RECEIVED, EventTable
+
+logger = logging.getLogger(__name__)
+
+# kinds of activity
+MESSAGE_SENT = 0
+MESSAGE_RECEIVED = 1
+LIKED_POST = 2
+LIKED_COMMENT = 3
+N_KINDS = 4
+
+# kinds of media files, see media_table
+MEDIA_POST = 0
+MEDIA_STORY = 1
+MEDIA_REEL = 2
+MEDIA_KINDS = {"posts": MEDIA_POST, "stories": MEDIA_STORY, "reels": MEDIA_REEL}
+MEDIA_LABELS = ["Berichten", "Verhalen", "Reels"]
+
+MS_PER_DAY = 86_400_000
+
+
+def _period_codes(timestamps: np.ndarray, period: str) -> tuple[np.ndarray, list[str]]:
+    """
+    Maps timestamps in ms to compact period codes and their labels
+    period is "M" (month) or "W" (week, starting on monday)
+    """
+    if period == "M":
+        absolute = timestamps.astype("datetime64[ms]").astype("datetime64[M]").astype(np.int64)
+        values, codes = np.unique(absolute, return_inverse=True)
+        labels = [str(v) for v in values.astype("datetime64[M]")]
+    elif period == "W":
+        # 1970-01-01 was a thursday, shift by 3 days so weeks start on monday
+        absolute = (timestamps // MS_PER_DAY + 3) // 7
+        values, codes = np.unique(absolute, return_inverse=True)
+        labels = [str(v) for v in (values * 7 - 3).astype("datetime64[D]")]
+    else:
+        raise ValueError(f"Unknown period: {period}")
+
+    return codes.reshape(-1), labels
+
+
+def _activity_kinds(events: EventTable) -> np.ndarray:
+    """
+    The kind of activity of every event
+    """
+    kinds = events.column("kind").astype(np.int64)
+    received = events.column("direction") == RECEIVED
+    return np.select(
+        [kinds == EVENT_LIKED_POST, kinds == EVENT_LIKED_COMMENT, received],
+        [LIKED_POST, LIKED_COMMENT, MESSAGE_RECEIVED],
+        MESSAGE_SENT,
+    )
+
+
+def count_activity(events: EventTable, period: str = "M") -> tuple[np.ndarray, np.ndarray, np.ndarray, list[str]]:
+    """
+    Counts activity per (alter, period, kind) in a single pass, events without timestamp are skipped
+
+    Returns the alter and period codes of the (alter, period) pairs with activity,
+    an (n_pairs, N_KINDS) array of their counts and the period labels
+    """
+    timestamps = events.column("timestamp")
+    timed = timestamps != NO_TIMESTAMP
+    if not timed.any():
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros((0, N_KINDS), dtype=np.int64), []
+
+    timestamps = timestamps[timed]
+    alters = events.column("alter")[timed].astype(np.int64)
+    kinds = _activity_kinds(events)[timed]
+
+    period_codes, labels = _period_codes(timestamps, period)
+    n_periods = len(labels)
+
+    pairs, index = np.unique(alters * n_periods + period_codes, return_inverse=True)
+    counts = np.bincount(index.reshape(-1) * N_KINDS + kinds, minlength=len(pairs) * N_KINDS)
+
+    return pairs // n_periods, pairs % n_periods, counts.reshape(len(pairs), N_KINDS), labels
+
+
+def _table(events, alters, periods, counts, labels, kinds, columns) -> pd.DataFrame:
+    selected = counts[:, kinds]
+    rows = np.flatnonzero(selected.sum(axis=1))
+
+    df = pd.DataFrame({
+        columns[0]: events.pool.take(alters[rows]),
+        columns[1]: events.pool.take_hashes(alters[rows]),
+        columns[2]: np.array(labels, dtype=object)[periods[rows]],
+    })
+    for i, column in enumerate(columns[3:]):
+        df[column] = selected[rows, i]
+
+    return df.sort_values([columns[0], columns[2]]).reset_index(drop=True)
+
+
+def activity_tables(events: EventTable, period: str = "M") -> dict[str, pd.DataFrame]:
+    """
+    Builds the activity over time tables from a single aggregation pass
+    Empty tables are omitted
+    """
+    out: dict[str, pd.DataFrame] = {}
+
+    try:
+        alters, periods, counts, labels = count_activity(events, period)
+
+        messages = _table(
+            events, alters, periods, counts, labels, [MESSAGE_SENT, MESSAGE_RECEIVED],
+            ["Profielnaam", "Hashed Profielnaam", "Periode", "Verzonden berichten", "Ontvangen berichten"],
+        )
+        if not messages.empty:
+            out["messages"] = messages
+
+        likes = _table(
+            events, alters, periods, counts, labels, [LIKED_POST, LIKED_COMMENT],
+            ["Gebruikersnaam", "Hashed Gebruikersnaam", "Periode", "Berichten met likes", "Reacties met likes"],
+        )
+        if not likes.empty:
+            out["likes"] = likes
+
+    except Exception as e:
+        logger.error("Exception was caught:  %s", e)
+
+    return out
+
+
+def media_table(kinds: array, timestamps: array, sizes: array, period: str = "M") -> pd.DataFrame:
+    """
+    Number of media files and their total size per period and kind of media
+    kinds, timestamps in ms and sizes in bytes are columns of one row per file
+    """
+    columns = ["Periode", "Soort", "Aantal bestanden", "Grootte (MB)"]
+    if len(timestamps) == 0:
+        return pd.DataFrame(columns=columns)
+
+    period_codes, labels = _period_codes(np.frombuffer(timestamps, dtype=np.int64), period)
+    n_kinds = len(MEDIA_LABELS)
+    key = period_codes * n_kinds + np.frombuffer(kinds, dtype=np.int8).astype(np.int64)
+    n_cells = len(labels) * n_kinds
+
+    counts = np.bincount(key, minlength=n_cells)
+    total = np.bincount(key, weights=np.frombuffer(sizes, dtype=np.int64), minlength=n_cells)
+    cells = np.nonzero(counts)[0]
+
+    return pd.DataFrame({
+        columns[0]: np.array(labels, dtype=object)[cells // n_kinds],
+        columns[1]: np.array(MEDIA_LABELS, dtype=object)[cells % n_kinds],
+        columns[2]: counts[cells],
+        columns[3]: np.round(total[cells] / 1e6, 1),
+    })
@@ -24,3 +24,20 @@ class CommandSystemDonate:
         dict["key"] = self.key
         dict["json_string"] = self.json_string
         return dict
+
+
+class CommandBatch:
+    """
+    Several commands in one round-trip: donations, optionally followed by one render
+    The host handles them in order and responds with the response to the render
+    """
+    __slots__ = "commands"
+
+    def __init__(self, commands):
+        self.commands = commands
+
+    def toDict(self):
+        dict = {}
+        dict["__type__"] = "CommandBatch"
+        dict["commands"] = [command.toDict() for command in self.commands]
+        return dict
@@ -1,38 +1,192 @@
-class PropsUIHeader:
-    __slots__ = "title"
+"""
+Props are the building blocks of the pages rendered by the host
+
+Props are immutable and identified by their content, so an identical page that
+is rendered again (a repeated retry prompt or consent form) resolves its toDict()
+from a cache instead of being rebuilt. DataFrames are identified by object identity
+and a version, so a consent table is serialized with to_json() only once.
+
+The cache is keyed by the frozen content of the props, which holds a token of every
+DataFrame instead of the DataFrame. Its values hold the serialized consent tables,
+so every session has its own cache (port.session.Session.props_cache) and clears it
+when it ends, see port.session.Session.close.
+"""
+
+from collections import OrderedDict
+from contextvars import ContextVar
+from itertools import count
+from typing import Any
+import threading
+import weakref
+
+import pandas as pd
+
+TODICT_CACHE_SIZE = 128
+
+# (type of the props, frozen content of the props) -> toDict(),
+# (pd.DataFrame, token of the DataFrame) -> to_json()
+PropsCache = OrderedDict
+# the cache of code run outside a session
+DEFAULT_CACHE: "PropsCache[tuple[Any, ...], Any]" = OrderedDict()
+_CURRENT_CACHE: "ContextVar[PropsCache[tuple[Any, ...], Any]]" = ContextVar("port_props", default=DEFAULT_CACHE)
+# sessions may run in threads
+_CACHE_LOCK = threading.Lock()
+
+# id(data_frame) -> [weakref, serial, version]
+_FRAMES: dict[int, list[Any]] = {}
+_FRAME_SERIAL = count()
+
+
+def use_cache(cache: "PropsCache[tuple[Any, ...], Any]") -> None:
+    """
+    Props rendered in the calling context are cached in cache, see port.session
+    """
+    _CURRENT_CACHE.set(cache)
+
+
+def clear_cache() -> None:
+    """
+    Empties the cache of the calling context
+    """
+    with _CACHE_LOCK:
+        _CURRENT_CACHE.get().clear()
+
+
+def _cached(key: tuple[Any, ...], build: Any) -> Any:
+    cache = _CURRENT_CACHE.get()
+    with _CACHE_LOCK:
+        out = cache.get(key)
+        if out is not None:
+            cache.move_to_end(key)
+            return out
+
+    out = build()
+    with _CACHE_LOCK:
+        cache[key] = out
+        if len(cache) > TODICT_CACHE_SIZE:
+            cache.popitem(last=False)
+    return out
+
+
+def _frame_entry(data_frame: pd.DataFrame) -> list[Any]:
+    key = id(data_frame)
+    entry = _FRAMES.get(key)
+    if entry is None or entry[0]() is not data_frame:
+        entry = [weakref.ref(data_frame), next(_FRAME_SERIAL), 0]
+        _FRAMES[key] = entry
+        weakref.finalize(data_frame, _forget_frame, key, entry[1])
+    return entry
+
+
+def _forget_frame(key: int, serial: int) -> None:
+    entry = _FRAMES.get(key)
+    if entry is not None and entry[1] == serial:
+        del _FRAMES[key]
+
+
+def _frame_token(data_frame: pd.DataFrame) -> tuple[int, int, tuple[int, ...]]:
+    entry = _frame_entry(data_frame)
+    return entry[1], entry[2], data_frame.shape
+
+
+def _frame_json(data_frame: pd.DataFrame) -> str:
+    """
+    Serializes a DataFrame once per (identity, version)
+    """
+    return _cached((pd.DataFrame, _frame_token(data_frame)), data_frame.to_json)
+
+
+def mark_frame_changed(data_frame: pd.DataFrame) -> None:
+    """
+    Call after mutating a DataFrame in place that was already rendered,
+    so that its cached serialization is not reused
+    """
+    _frame_entry(data_frame)[2] += 1
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, pd.DataFrame):
+        return _frame_token(value)
+    if isinstance(value, _Props):
+        return type(value), value._key()
+    if isinstance(value, dict):
+        return tuple((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class _Props:
+    """
+    Base class for props: immutable after __init__, hashable by content
+    and with a memoized toDict()
+
+    The dict returned by toDict() is shared between renders and must not be mutated
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if hasattr(self, name):
+            raise AttributeError(f"{type(self).__name__} is immutable")
+        object.__setattr__(self, name, value)
+
+    def _key(self) -> tuple[Any, ...]:
+        return tuple(_freeze(getattr(self, slot)) for slot in self.__slots__)
+
+    def __hash__(self) -> int:
+        return hash((type(self), self._key()))
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) is type(other) and self._key() == other._key()  # type: ignore
+
+    def toDict(self) -> dict[str, Any]:
+        return _cached((type(self), self._key()), self._toDict)
+
+    def _toDict(self) -> dict[str, Any]:
+        raise NotImplementedError
+
+
+class PropsUIHeader(_Props):
+    __slots__ = ("title",)
 
     def __init__(self, title):
         self.title = title
 
-    def toDict(self):
+    def _toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIHeader"
         dict["title"] = self.title.toDict()
         return dict
 
 
-class PropsUIFooter:
-    __slots__ = "progress_percentage"
+class PropsUIFooter(_Props):
+    """
+    eta_seconds: estimated duration of the extraction, shown next to the progress bar
+    """
+    __slots__ = ("progress_percentage", "eta_seconds")
 
-    def __init__(self, progress_percentage):
+    def __init__(self, progress_percentage, eta_seconds=None):
         self.progress_percentage = progress_percentage
+        self.eta_seconds = eta_seconds
 
-    def toDict(self):
+    def _toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIFooter"
         dict["progressPercentage"] = self.progress_percentage
+        if self.eta_seconds is not None:
+            dict["etaSeconds"] = self.eta_seconds
         return dict
 
 
-class PropsUIPromptConfirm:
-    __slots__ = "text", "ok", "cancel"
+class PropsUIPromptConfirm(_Props):
+    __slots__ = ("text", "ok", "cancel")
 
     def __init__(self, text, ok, cancel):
         self.text = text
         self.ok = ok
         self.cancel = cancel
 
-    def toDict(self):
+    def _toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptConfirm"
         dict["text"] = self.text.toDict()
@@ -41,8 +195,25 @@ class PropsUIPromptConfirm:
         return dict
 
 
-class PropsUIPromptConsentForm:
-    __slots__ = "tables", "meta_tables"
+class PropsUIPromptProgress(_Props):
+    """
+    Shows text while the script works, the host answers it as soon as it is shown
+    so the page stays on screen until the next render
+    """
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def _toDict(self):
+        dict = {}
+        dict["__type__"] = "PropsUIPromptProgress"
+        dict["text"] = self.text.toDict()
+        return dict
+
+
+class PropsUIPromptConsentForm(_Props):
+    __slots__ = ("tables", "meta_tables")
 
     def __init__(self, tables, meta_tables):
         self.tables = tables
@@ -60,7 +231,7 @@ class PropsUIPromptConsentForm:
             output.append(table.toDict())
         return output
 
-    def toDict(self):
+    def _toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptConsentForm"
         dict["tables"] = self.translate_tables()
@@ -68,8 +239,8 @@ class PropsUIPromptConsentForm:
         return dict
 
 
-class PropsUIPromptConsentFormTable:
-    __slots__ = "id", "title", "data_frame", "adjustable"
+class PropsUIPromptConsentFormTable(_Props):
+    __slots__ = ("id", "title", "data_frame", "adjustable")
 
     def __init__(self, id, title, data_frame, adjustable=True):
         self.id = id
@@ -77,24 +248,24 @@ class PropsUIPromptConsentFormTable:
         self.data_frame = data_frame
         self.adjustable = adjustable
 
-    def toDict(self):
+    def _toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptConsentFormTable"
         dict["id"] = self.id
         dict["title"] = self.title.toDict()
-        dict["data_frame"] = self.data_frame.to_json()
+        dict["data_frame"] = _frame_json(self.data_frame)
         dict["adjustable"] = self.adjustable
         return dict
 
 
-class PropsUIPromptFileInput:
-    __slots__ = "description", "extensions"
+class PropsUIPromptFileInput(_Props):
+    __slots__ = ("description", "extensions")
 
     def __init__(self, description, extensions):
         self.description = description
         self.extensions = extensions
 
-    def toDict(self):
+    def _toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptFileInput"
         dict["description"] = self.description.toDict()
@@ -102,15 +273,15 @@ class PropsUIPromptFileInput:
         return dict
 
 
-class PropsUIPromptRadioInput:
-    __slots__ = "title", "description", "items"
+class PropsUIPromptRadioInput(_Props):
+    __slots__ = ("title", "description", "items")
 
     def __init__(self, title, description, items):
         self.title = title
         self.description = description
         self.items = items
 
-    def toDict(self):
+    def _toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptRadioInput"
         dict["title"] = self.title.toDict()
@@ -119,8 +290,8 @@ class PropsUIPromptRadioInput:
         return dict
 
 
-class PropsUIPageDonation:
-    __slots__ = "platform", "header", "body", "footer"
+class PropsUIPageDonation(_Props):
+    __slots__ = ("platform", "header", "body", "footer")
 
     def __init__(self, platform, header, body, footer):
         self.platform = platform
@@ -128,7 +299,7 @@ class PropsUIPageDonation:
         self.body = body
         self.footer = footer
 
-    def toDict(self):
+    def _toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPageDonation"
         dict["platform"] = self.platform
@@ -138,20 +309,22 @@ class PropsUIPageDonation:
         return dict
 
 
-class PropsUIPageEnd:
-    def toDict(self):
+class PropsUIPageEnd(_Props):
+    __slots__ = ()
+
+    def _toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPageEnd"
         return dict
 
 
-class Translatable:
-    __slots__ = "translations"
+class Translatable(_Props):
+    __slots__ = ("translations",)
 
     def __init__(self, translations):
         self.translations = translations
 
-    def toDict(self):
+    def _toDict(self):
         dict = {}
         dict["translations"] = self.translations
         return dict
@@ -0,0 +1,142 @@
+"""
+Wire encodings of commands
+
+By default ScriptWrapper.send returns command.toDict(), which the worker converts
+to a JavaScript object dict by dict. The encodings below serialize a command to a
+single buffer instead. Values that are JSON documents already (the data_frame of
+a consent table) are embedded as is, not as escaped strings.
+
+json:   the command as one UTF-8 JSON document
+binary: MAGIC, the number of segments and then every segment as a uint32 length
+        followed by its bytes (little endian). Segment 0 is the command as UTF-8
+        JSON, with every embedded document replaced by {"__segment__": i};
+        segment i is that document. The host parses the tables only when needed.
+"""
+
+from typing import Any
+import json
+import struct
+
+DICT = "dict"
+JSON = "json"
+BINARY = "binary"
+MODES = (DICT, JSON, BINARY)
+
+MAGIC = b"PCB1"
+
+# keys whose string values are JSON documents
+RAW_JSON_KEYS = frozenset({"data_frame"})
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _extract_raw(value: Any, raw: list[str]) -> Any:
+    """
+    Copies value with every embedded JSON document replaced by {"__segment__": i}
+    and appended to raw. The dicts of toDict() are cached and shared, so they are not modified
+    """
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            if k in RAW_JSON_KEYS and isinstance(v, str):
+                raw.append(v)
+                out[k] = {"__segment__": len(raw)}
+            else:
+                out[k] = _extract_raw(v, raw)
+        return out
+    if isinstance(value, list):
+        return [_extract_raw(v, raw) for v in value]
+    return value
+
+
+def _write_json(value: Any, out: list[str]) -> None:
+    """
+    Writes the containers of a command, values under RAW_JSON_KEYS are written as is
+    The containers of a command are few, the bulk of the data is in the embedded documents
+    """
+    if isinstance(value, dict):
+        out.append("{")
+        for i, (k, v) in enumerate(value.items()):
+            if i:
+                out.append(",")
+            out.append(_dumps(k))
+            out.append(":")
+            if k in RAW_JSON_KEYS and isinstance(v, str):
+                out.append(v)
+            else:
+                _write_json(v, out)
+        out.append("}")
+    elif isinstance(value, list):
+        out.append("[")
+        for i, v in enumerate(value):
+            if i:
+                out.append(",")
+            _write_json(v, out)
+        out.append("]")
+    else:
+        out.append(_dumps(value))
+
+
+def encode_json(command: Any) -> bytes:
+    """
+    The command as one UTF-8 JSON document with the embedded documents inlined
+    """
+    out: list[str] = []
+    _write_json(command.toDict(), out)
+    return "".join(out).encode("utf8")
+
+
+def encode_binary(command: Any) -> bytes:
+    """
+    The command as a segmented buffer, see the module docstring
+    """
+    raw: list[str] = []
+    skeleton = _extract_raw(command.toDict(), raw)
+    segments = [_dumps(skeleton).encode("utf8")]
+    segments.extend(document.encode("utf8") for document in raw)
+
+    out = [MAGIC, struct.pack("<I", len(segments))]
+    for segment in segments:
+        out.append(struct.pack("<I", len(segment)))
+        out.append(segment)
+    return b"".join(out)
+
+
+def decode_binary(buffer: bytes) -> dict[str, Any]:
+    """
+    Inverse of encode_binary, the embedded documents are parsed
+    """
+    if buffer[:4] != MAGIC:
+        raise ValueError("Not a binary command")
+
+    (n,) = struct.unpack_from("<I", buffer, 4)
+    offset = 8
+    segments = []
+    for _ in range(n):
+        (size,) = struct.unpack_from("<I", buffer, offset)
+        offset += 4
+        segments.append(buffer[offset:offset + size])
+        offset += size
+
+    def resolve(value: Any) -> Any:
+        if isinstance(value, dict):
+            if value.keys() == {"__segment__"}:
+                return json.loads(segments[value["__segment__"]])
+            return {k: resolve(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [resolve(v) for v in value]
+        return value
+
+    return resolve(json.loads(segments[0]))
+
+
+def encode(command: Any, mode: str = DICT) -> Any:
+    if mode == DICT:
+        return command.toDict()
+    if mode == JSON:
+        return encode_json(command)
+    if mode == BINARY:
+        return encode_binary(command)
+    raise ValueError(f"Unknown wire mode: {mode}")
@@ -0,0 +1,124 @@
+"""
+Contains the virtual archive over multi-part DDPs
+
+Large exports are delivered as several zip parts. VirtualArchive combines the
+parts into a single member namespace with a merged index, and offers the part
+of the zipfile.ZipFile interface the extraction uses (infolist, namelist, read,
+open), so code that reads a zip works unchanged on a multi-part export.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any
+import logging
+import threading
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# maximum number of central directories scanned at once
+MAX_SCAN_WORKERS = 8
+
+
+def _scan_part(part: str | Path) -> list[zipfile.ZipInfo]:
+    with zipfile.ZipFile(part, "r") as zf:
+        return zf.infolist()
+
+
+def scan_parts(parts: list[str | Path]) -> list[list[zipfile.ZipInfo]]:
+    """
+    Reads the central directories of the parts concurrently
+    Falls back to one part at a time where threads are not available (Pyodide)
+    Raises zipfile.BadZipFile if one of the parts is not a zip
+    """
+    if len(parts) > 1:
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(parts), MAX_SCAN_WORKERS)) as executor:
+                return list(executor.map(_scan_part, parts))
+        except RuntimeError as e:
+            logger.debug("Scanning parts sequentially: %s", e)
+
+    return [_scan_part(part) for part in parts]
+
+
+class VirtualArchive:
+    """
+    The members of several zip parts as a single archive
+
+    Members are listed part by part, in the order of the parts. A member present in
+    more than one part is taken from the first part that contains it.
+    The index is built once; the parts are opened on first read and closed by close(),
+    after which the archive can be read again.
+    """
+
+    def __init__(self, parts: list[str | Path]) -> None:
+        self.parts = list(parts)
+        self._infos: list[zipfile.ZipInfo] = []
+        self._index: dict[str, tuple[int, zipfile.ZipInfo]] = {}
+        self._open: dict[int, zipfile.ZipFile] = {}
+        # members are read from several threads when the extraction reads ahead
+        self._lock = threading.Lock()
+
+        for i, infos in enumerate(scan_parts(self.parts)):
+            for info in infos:
+                if info.filename in self._index:
+                    logger.debug("Duplicate member in part %s: %s", i, info.filename)
+                    continue
+                self._index[info.filename] = (i, info)
+                self._infos.append(info)
+
+        logger.info("Merged %s members from %s parts", len(self._infos), len(self.parts))
+
+    def infolist(self) -> list[zipfile.ZipInfo]:
+        return list(self._infos)
+
+    def namelist(self) -> list[str]:
+        return [info.filename for info in self._infos]
+
+    def _lookup(self, name: str) -> tuple[int, zipfile.ZipInfo]:
+        try:
+            return self._index[name]
+        except KeyError:
+            raise KeyError(f"There is no item named {name!r} in the archive")
+
+    def getinfo(self, name: str) -> zipfile.ZipInfo:
+        return self._lookup(name)[1]
+
+    def _part_of(self, member: str | zipfile.ZipInfo) -> tuple[zipfile.ZipFile, zipfile.ZipInfo]:
+        name = member.filename if isinstance(member, zipfile.ZipInfo) else member
+        i, info = self._lookup(name)
+        with self._lock:
+            if i not in self._open:
+                self._open[i] = zipfile.ZipFile(self.parts[i], "r")
+            return self._open[i], info
+
+    def open(self, member: str | zipfile.ZipInfo, mode: str = "r") -> IO[bytes]:
+        zf, info = self._part_of(member)
+        return zf.open(info, mode)
+
+    def read(self, member: str | zipfile.ZipInfo) -> bytes:
+        zf, info = self._part_of(member)
+        return zf.read(info)
+
+    def close(self) -> None:
+        for zf in self._open.values():
+            zf.close()
+        self._open = {}
+
+    def __enter__(self) -> "VirtualArchive":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+def open_archive(zfile: str | Path | list[str | Path] | VirtualArchive) -> zipfile.ZipFile | VirtualArchive:
+    """
+    Opens a DDP for reading: a path to a zip, a list of paths to the parts
+    of a multi-part export, or an already indexed VirtualArchive
+    """
+    if isinstance(zfile, VirtualArchive):
+        return zfile
+    if isinstance(zfile, (list, tuple)):
+        return VirtualArchive(zfile)
+    return zipfile.ZipFile(zfile, "r")
@@ -0,0 +1,177 @@
+"""
+Benchmarks to run on CPython against a real or generated DDP
+
+Usage: python -m port.benchmark path/to/instagram.zip
+"""
+
+from typing import Any
+import io
+import json
+import logging
+import statistics
+import sys
+import time
+import zipfile
+
+from port.api import wire
+import port.api.props as props
+import port.instagram as instagram
+import port.unzipddp as unzipddp
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(fun, repeat: int) -> float:
+    """
+    Median wall time of fun in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fun()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def json_decoders(zfile: str, n_members: int = 10, repeat: int = 5) -> list[dict[str, Any]]:
+    """
+    Compares the available json decoders on the n_members largest json members of zfile
+    Returns one row per (member, decoder) with the median decode time and throughput
+    """
+    out = []
+
+    with zipfile.ZipFile(zfile, "r") as zf:
+        infos = [i for i in zf.infolist() if i.filename.endswith(".json")]
+        infos = sorted(infos, key=lambda i: i.file_size, reverse=True)[:n_members]
+        members = [(i.filename, zf.read(i)) for i in infos]
+
+    decoders = unzipddp.available_json_decoders()
+    try:
+        for name, json_bytes in members:
+            for decoder in decoders:
+                unzipddp.set_json_decoder(decoder)
+                seconds = _timed(lambda: unzipddp._read_json(json_bytes, unzipddp._json_reader_bytes), repeat)
+                out.append({
+                    "member": name,
+                    "bytes": len(json_bytes),
+                    "decoder": decoder.name,
+                    "seconds": seconds,
+                    "mb_per_second": len(json_bytes) / seconds / 1e6 if seconds else float("inf"),
+                })
+    finally:
+        unzipddp.set_json_decoder(None)
+
+    return out
+
+
+FOLLOWER_COUNTS = {
+    "followers_1.json": (
+        instagram.count_followers,
+        lambda b: instagram.followers_to_list(unzipddp.read_json_from_bytes(io.BytesIO(b))),
+    ),
+    "following.json": (
+        instagram.count_following,
+        lambda b: instagram.following_to_list(unzipddp.read_json_from_bytes(io.BytesIO(b))),
+    ),
+    "followers_1.html": (instagram.count_followers_html, lambda b: instagram.followers_to_list_html(io.BytesIO(b))),
+    "following.html": (instagram.count_followers_html, lambda b: instagram.following_to_list_html(io.BytesIO(b))),
+}
+
+
+def follower_counts(zfile: str, repeat: int = 5) -> list[dict[str, Any]]:
+    """
+    Compares the count-only functions for followers and following with the parsing
+    functions they replace; "equal" reports whether both return the same count
+    """
+    out = []
+
+    with zipfile.ZipFile(zfile, "r") as zf:
+        members = [(i.filename, zf.read(i)) for i in zf.infolist() if i.filename.rsplit("/", 1)[-1] in FOLLOWER_COUNTS]
+
+    for name, data in members:
+        count, parse = FOLLOWER_COUNTS[name.rsplit("/", 1)[-1]]
+        out.append({
+            "member": name,
+            "bytes": len(data),
+            "count": count(data),
+            "equal": count(data) == parse(data),
+            "count_seconds": _timed(lambda: count(data), repeat),
+            "parse_seconds": _timed(lambda: parse(data), repeat),
+        })
+
+    return out
+
+
+def _to_js(value: Any) -> Any:
+    """
+    Stand-in for toJs(dict_converter=Object.fromEntries) in the worker: every dict
+    is converted entry by entry, and the host parses the data_frame strings again
+    """
+    if isinstance(value, dict):
+        return dict([(k, json.loads(v) if k in wire.RAW_JSON_KEYS else _to_js(v)) for k, v in value.items()])
+    if isinstance(value, list):
+        return [_to_js(v) for v in value]
+    return value
+
+
+def command_encodings(zfile: str, repeat: int = 5) -> list[dict[str, Any]]:
+    """
+    Compares the wire modes of ScriptWrapper.send on the consent form of zfile
+
+    Every repetition starts from empty props caches, so the DataFrames are serialized again.
+    "decode" is the cost of turning the output into objects on the host side, measured
+    with the CPython json module, so it only indicates the relative cost in the browser.
+    """
+    from port.script import extract_instagram, prompt_consent, render_donation_page
+
+    _, data = extract_instagram(zfile)
+    command = render_donation_page("Instagram", prompt_consent("Instagram", data), 50)
+
+    decoders = {
+        wire.DICT: _to_js,
+        wire.JSON: json.loads,
+        wire.BINARY: wire.decode_binary,
+    }
+
+    out = []
+    for mode in wire.MODES:
+        def encode() -> Any:
+            props.clear_cache()
+            return wire.encode(command, mode)
+
+        encoded = encode()
+        size = len(json.dumps(encoded).encode()) if mode == wire.DICT else len(encoded)
+        out.append({
+            "mode": mode,
+            "bytes": size,
+            "encode_seconds": _timed(encode, repeat),
+            "decode_seconds": _timed(lambda: decoders[mode](encoded), repeat),
+        })
+
+    return out
+
+
+def print_rows(rows: list[dict[str, Any]]) -> None:
+    if not rows:
+        print("no rows")
+        return
+    columns = list(rows[0])
+    print("\t".join(columns))
+    for row in rows:
+        print("\t".join(f"{row[c]:.4f}" if isinstance(row[c], float) else str(row[c]) for c in columns))
+
+
+def main(argv: list[str]) -> None:
+    if len(argv) != 2:
+        print(__doc__)
+        return
+    logging.disable(logging.ERROR)
+    print_rows(json_decoders(argv[1]))
+    print()
+    print_rows(command_encodings(argv[1]))
+    print()
+    print_rows(follower_counts(argv[1]))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
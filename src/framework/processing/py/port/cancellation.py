@@ -0,0 +1,73 @@
+"""
+Contains the tokens for cooperative cancellation of an extraction
+
+A CancellationToken is cancelled by the host, for example when the participant
+skips while an extraction is running. Every extractor runs with its own Budget,
+which is cancelled with the host token or once the extractor has spent its
+time budget. Long running loops call token.check(), which raises
+ExtractionCancelledError when the token is cancelled; the scheduler stops
+feeding the extractor and keeps its partial results.
+"""
+
+from contextlib import contextmanager
+from typing import Iterator
+import time
+
+from port.my_exceptions import ExtractionCancelledError
+
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+
+
+class CancellationToken:
+    """
+    Token the host cancels, safe to cancel from another thread
+    """
+
+    def __init__(self) -> None:
+        self.reason: str | None = None
+
+    def cancel(self, reason: str = CANCELLED) -> None:
+        if self.reason is None:
+            self.reason = reason
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def check(self) -> None:
+        if self.reason is not None:
+            raise ExtractionCancelledError(self.reason)
+
+
+class Budget(CancellationToken):
+    """
+    Token of a single extractor
+
+    Only the time spent inside running() counts against the budget, the
+    extractors of a single pass are fed in turns. seconds=None is no limit.
+    """
+
+    def __init__(self, seconds: float | None = None, parent: CancellationToken | None = None) -> None:
+        super().__init__()
+        self.seconds = seconds
+        self.parent = parent
+        self.spent = 0.0
+        self._started: float | None = None
+
+    @contextmanager
+    def running(self) -> Iterator[None]:
+        self._started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.spent += time.monotonic() - self._started
+            self._started = None
+
+    def check(self) -> None:
+        if self.parent is not None and self.parent.cancelled:
+            self.cancel(self.parent.reason or CANCELLED)
+        if self.seconds is not None and self._started is not None:
+            if self.spent + time.monotonic() - self._started > self.seconds:
+                self.cancel(TIMED_OUT)
+        super().check()
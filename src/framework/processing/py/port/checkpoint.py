@@ -0,0 +1,192 @@
+"""
+Contains classes to checkpoint partial extraction results
+
+During extraction of a large DDP the partial aggregates of the extractors
+are written to a CheckpointStore after every batch of members read, keyed by
+a fingerprint of the archive. When the same archive is offered again after an
+interruption, extraction continues from the last checkpoint instead of
+starting over.
+
+State that only grows during an extraction, such as the events of the
+messages and likes, is saved in parts: every save stores only what was added
+since the previous save, under a key of its own, so a checkpoint is not
+serialized again as a whole every batch.
+"""
+
+from pathlib import Path
+from typing import Any, Callable
+import hashlib
+import logging
+import json
+import os
+
+from port.archive import VirtualArchive, open_archive
+
+logger = logging.getLogger(__name__)
+
+# number of members read between two checkpoints
+MEMBER_BATCH_SIZE = 50
+# bumped when the layout of a checkpoint changes, checkpoints of another format are not resumed from
+FORMAT = 2
+
+
+class CheckpointStore:
+    """
+    Interface for checkpoint stores
+    A checkpoint is a json serializable dict
+    """
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        raise NotImplementedError
+
+    def save(self, key: str, state: dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def clear(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    """
+    Keeps checkpoints in memory, survives a retry within the same interpreter
+    """
+
+    def __init__(self) -> None:
+        self._states: dict[str, str] = {}
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        state = self._states.get(key)
+        return json.loads(state) if state is not None else None
+
+    def save(self, key: str, state: dict[str, Any]) -> None:
+        # stored serialized, so later mutation by the caller does not leak into the checkpoint
+        self._states[key] = json.dumps(state)
+
+    def clear(self, key: str) -> None:
+        self._states.pop(key, None)
+
+
+class FileCheckpointStore(CheckpointStore):
+    """
+    Keeps checkpoints as json files in a directory, survives a restart of the interpreter
+    Writes are atomic: a checkpoint is either the previous or the new state
+    """
+
+    def __init__(self, directory: str | Path) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        try:
+            with open(self._path(key), "r", encoding="utf8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error("Could not read checkpoint: %s", e)
+            return None
+
+    def save(self, key: str, state: dict[str, Any]) -> None:
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def clear(self, key: str) -> None:
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+DEFAULT_STORE: CheckpointStore = MemoryCheckpointStore()
+
+
+class Checkpoint:
+    """
+    The checkpoint of a single archive: the completed stages and their partial results
+    """
+
+    def __init__(self, store: CheckpointStore, key: str) -> None:
+        self.store = store
+        self.key = key
+        self.state: dict[str, Any] = store.load(key) or {}
+        if self.state and self.state.get("format") != FORMAT:
+            logger.info("Checkpoint of format %s is not resumed from", self.state.get("format"))
+            self.state = {}
+        self._tracked: dict[str, Callable[[], Any]] = {}
+        self._tracked_parts: dict[str, Callable[[], Any]] = {}
+
+        if self.state:
+            logger.info("Resuming extraction from checkpoint, stages found: %s", list(self.state))
+
+    def get(self, stage: str, default: Any = None) -> Any:
+        return self.state.get(stage, default)
+
+    def track(self, stage: str, get_state: Callable[[], Any]) -> None:
+        """
+        State that is saved along with every stage, so it is consistent with the completed stages
+        """
+        self._tracked[stage] = get_state
+
+    def track_parts(self, stage: str, get_part: Callable[[], Any]) -> None:
+        """
+        Growing state that is saved along with every stage in parts
+        get_part returns what was added since it was called last, None when nothing was added
+        """
+        self._tracked_parts[stage] = get_part
+
+    def _part_key(self, stage: str, i: int) -> str:
+        return f"{self.key}-{stage}-{i}"
+
+    def get_parts(self, stage: str) -> list[Any] | None:
+        """
+        The parts of a stage tracked with track_parts, in the order in which they were saved
+        None when a part is missing from the store, the checkpoint can not be resumed from
+        """
+        n = self.state.get("parts", {}).get(stage, 0)
+        parts = [self.store.load(self._part_key(stage, i)) for i in range(n)]
+        if any(part is None for part in parts):
+            logger.error("Checkpoint misses parts of stage: %s", stage)
+            return None
+        return parts
+
+    def save(self, stage: str, value: Any) -> None:
+        self.state["format"] = FORMAT
+        self.state[stage] = value
+        for tracked_stage, get_state in self._tracked.items():
+            self.state[tracked_stage] = get_state()
+        # the parts are stored before the state that counts them
+        n_parts = self.state.setdefault("parts", {})
+        for tracked_stage, get_part in self._tracked_parts.items():
+            part = get_part()
+            if part is not None:
+                n = n_parts.get(tracked_stage, 0)
+                self.store.save(self._part_key(tracked_stage, n), part)
+                n_parts[tracked_stage] = n + 1
+        self.store.save(self.key, self.state)
+        logger.debug("Checkpoint saved for stage: %s", stage)
+
+    def clear(self) -> None:
+        for stage, n in self.state.get("parts", {}).items():
+            for i in range(n):
+                self.store.clear(self._part_key(stage, i))
+        self.state = {}
+        self.store.clear(self.key)
+
+
+def archive_fingerprint(zfile: str | Path | list[str | Path] | VirtualArchive) -> str:
+    """
+    Fingerprint of a zip, or of the merged parts of a multi-part export,
+    based on its central directory (names, crc's and sizes)
+    No member data is read
+    """
+    h = hashlib.sha256()
+    with open_archive(zfile) as zf:
+        for info in sorted(zf.infolist(), key=lambda i: i.filename):
+            h.update(f"{info.filename}\0{info.CRC}\0{info.file_size}\n".encode())
+    return h.hexdigest()
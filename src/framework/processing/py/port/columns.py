@@ -0,0 +1,68 @@
+"""
+Contains the string pool of an extraction
+
+Strings are stored once in a StringPool shared by everything an extraction
+collects and referenced by an integer code, so an alter name that appears in
+many events (see port.events) is kept in memory once. take and take_hashes
+build whole DataFrame columns from columns of codes, without a Python object
+per row, and the sha256 of a string is computed once.
+"""
+
+from array import array
+from typing import Any, Iterable
+import hashlib
+
+import numpy as np
+
+import port.metrics as metrics
+
+HASHES = metrics.counter("port_hash_cache", "Lookups of the sha256 of a pooled string", ("result",))
+
+
+class StringPool:
+    """
+    Interns strings: every distinct string is stored once and identified by its code
+    The sha256 of a string is computed once, when a column of hashes is first taken
+    """
+
+    def __init__(self) -> None:
+        self.strings: list[Any] = []
+        self._codes: dict[Any, int] = {}
+        self._hashes: dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def code(self, value: Any) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.strings)
+            self._codes[value] = code
+            self.strings.append(value)
+        return code
+
+    def codes(self, values: Iterable[Any]) -> array:
+        return array("i", [self.code(value) for value in values])
+
+    def sha256(self, code: int) -> str:
+        """
+        The hex digest of the string with code, "" for values that are not strings
+        """
+        digest = self._hashes.get(code)
+        if digest is not None:
+            HASHES.inc(result="hit")
+            return digest
+
+        HASHES.inc(result="miss")
+        value = self.strings[code]
+        digest = hashlib.sha256(value.encode()).hexdigest() if isinstance(value, str) else ""
+        self._hashes[code] = digest
+        return digest
+
+    def take(self, codes: np.ndarray) -> np.ndarray:
+        return np.array(self.strings, dtype=object)[codes]
+
+    def take_hashes(self, codes: np.ndarray) -> np.ndarray:
+        unique, inverse = np.unique(codes, return_inverse=True)
+        digests = np.array([self.sha256(int(code)) for code in unique], dtype=object)
+        return digests[inverse.reshape(-1)]
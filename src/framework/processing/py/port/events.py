@@ -0,0 +1,248 @@
+"""
+Contains the interaction events of an extraction and their aggregations
+
+The parsers of the message and like files, JSON as well as HTML, emit one
+event per message or like into a single EventTable: the kind of event, the
+alter, the timestamp, the direction and the length and number of words of
+the text. The tables built from messages and likes (the summary per chat,
+the likes per account and the activity over time, see port.activity) are
+vectorized aggregations over these columns, written once for both formats.
+
+Alter names are pool codes, see port.columns. The chats are numbered in the
+order in which they are extracted; a message refers to its chat, so a chat
+without a counted message still has a row in the summary.
+
+Per-alter counts of several sources, such as the liked posts and liked
+comments of an account, are joined on the alter codes in one pass
+(join_counts), not by merging tables on the names, and ranked with a partial
+selection of the top rows (rank) instead of a full sort. Messages are not
+joined with likes: a message names its alter by the title of the chat, a
+display name, and a like names the account by its username.
+"""
+
+from array import array
+from typing import Any, Iterable
+import logging
+
+import numpy as np
+import pandas as pd
+
+from port.columns import StringPool
+
+logger = logging.getLogger(__name__)
+
+# kinds of events
+MESSAGE = 0
+LIKED_POST = 1
+LIKED_COMMENT = 2
+LIKE_KINDS = (LIKED_POST, LIKED_COMMENT)
+
+# directions of a message, a like is SENT
+SENT = 0
+RECEIVED = 1
+
+# the chat of a like, the timestamp of an event without one and the text length of a message without text
+NO_THREAD = -1
+NO_TIMESTAMP = -1
+NO_TEXT = -1
+
+# array typecode of every column
+COLUMNS = {
+    "kind": "b",
+    "thread": "i",
+    "alter": "i",
+    "timestamp": "q",
+    "direction": "b",
+    "text_length": "i",
+    "word_count": "i",
+}
+DTYPES = {"b": np.int8, "i": np.int32, "q": np.int64}
+
+
+class EventTable:
+    """
+    Messages and likes as rows of array columns, see COLUMNS
+    threads holds the alter code of every chat
+    """
+
+    def __init__(self, pool: StringPool | None = None) -> None:
+        self.pool = pool if pool is not None else StringPool()
+        self.threads = array("i")
+        self._data = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        # the number of events and chats returned by get_state so far
+        self._saved = (0, 0)
+
+    def __len__(self) -> int:
+        return len(self._data["kind"])
+
+    @property
+    def n_threads(self) -> int:
+        return len(self.threads)
+
+    def column(self, name: str, start: int = 0) -> np.ndarray:
+        column = self._data[name]
+        # copied, a numpy view would lock the size of the array
+        return np.array(column[start:] if start else column, dtype=DTYPES[column.typecode])
+
+    def add_thread(
+        self,
+        name: str,
+        timestamps: array,
+        directions: array,
+        text_lengths: array,
+        word_counts: array,
+    ) -> int:
+        """
+        Adds a chat with alter name and the columns of its messages, returns the number of the chat
+        """
+        thread = len(self.threads)
+        alter = self.pool.code(name)
+        self.threads.append(alter)
+
+        n = len(timestamps)
+        self._data["timestamp"].extend(timestamps)
+        self._data["kind"].extend([MESSAGE] * n)
+        self._data["thread"].extend([thread] * n)
+        self._data["alter"].extend([alter] * n)
+        self._data["direction"].extend(directions)
+        self._data["text_length"].extend(text_lengths)
+        self._data["word_count"].extend(word_counts)
+        return thread
+
+    def add_likes(self, kind: int, alters: array, timestamps: Iterable[int]) -> None:
+        """
+        Adds likes of kind, a like of the account with the pool code in alters at the timestamp at the same position
+        """
+        n = len(alters)
+        self._data["alter"].extend(alters)
+        self._data["timestamp"].extend(timestamps)
+        self._data["kind"].extend([kind] * n)
+        self._data["thread"].extend([NO_THREAD] * n)
+        self._data["direction"].extend([SENT] * n)
+        self._data["text_length"].extend([NO_TEXT] * n)
+        self._data["word_count"].extend([0] * n)
+
+    def get_state(self) -> dict[str, Any] | None:
+        """
+        The events and chats added since the previous call, None when none were added
+
+        A checkpoint holds these states as parts, so every event is serialized
+        once instead of at every save. The state holds the names, not their
+        codes, so it does not depend on the pool, and the chats relative to
+        the first chat of the state.
+        """
+        start, thread_start = self._saved
+        self._saved = (len(self), self.n_threads)
+        if self._saved == (start, thread_start):
+            return None
+
+        codes, alters = np.unique(self.column("alter", start), return_inverse=True)
+        strings = self.pool.strings
+        state: dict[str, Any] = {
+            "names": [strings[code] for code in codes.tolist()],
+            "threads": [strings[code] for code in self.threads[thread_start:]],
+        }
+        for name in COLUMNS:
+            column = self.column(name, start)
+            if name == "alter":
+                column = alters.reshape(-1)
+            elif name == "thread":
+                column = np.where(column != NO_THREAD, column - thread_start, NO_THREAD)
+            state[name] = column.tolist()
+        return state
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        """
+        Adds the events and chats of a state of get_state
+        The events added are not returned by the next get_state, they are in the checkpoint already
+        """
+        offset = len(self.threads)
+        self.threads.extend(self.pool.codes(state["threads"]))
+        codes = self.pool.codes(state["names"])
+        for name in COLUMNS:
+            values = state[name]
+            if name == "alter":
+                values = [codes[alter] for alter in values]
+            elif name == "thread" and offset:
+                values = [thread + offset if thread != NO_THREAD else thread for thread in values]
+            self._data[name].extend(values)
+        self._saved = (len(self), self.n_threads)
+
+
+def message_summary(events: EventTable) -> pd.DataFrame:
+    """
+    The number of sent messages with text and their words and characters per chat, in order of the chats
+    """
+    threads = np.array(events.threads, dtype=np.int64)
+    n = len(threads)
+
+    sent = (events.column("kind") == MESSAGE) & (events.column("direction") == SENT)
+    sent &= events.column("text_length") != NO_TEXT
+    thread = events.column("thread")[sent]
+    words, characters = events.column("word_count")[sent], events.column("text_length")[sent]
+
+    return pd.DataFrame({
+        "Profielnaam": events.pool.take(threads),
+        "Hashed Profielnaam": events.pool.take_hashes(threads),
+        "Aantal berichten": np.bincount(thread, minlength=n),
+        "Aantal woorden": np.bincount(thread, weights=words, minlength=n).astype(np.int64),
+        "Aantal karakters": np.bincount(thread, weights=characters, minlength=n).astype(np.int64),
+    })
+
+
+def join_counts(sources: list[tuple[np.ndarray, np.ndarray | None]]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Joins per-alter counts of any number of sources in one pass
+
+    A source is a column of alter codes and a column of their counts, or None
+    to count every code once. Returns the codes of the alters in any source,
+    in ascending order, and an (n_alters, n_sources) array of their counts.
+    """
+    codes = np.concatenate([np.asarray(alters, dtype=np.int64) for alters, _ in sources])
+    source = np.repeat(np.arange(len(sources)), [len(alters) for alters, _ in sources])
+    weights = np.concatenate([
+        np.ones(len(alters), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        for alters, counts in sources
+    ])
+
+    alters, index = np.unique(codes, return_inverse=True)
+    key = index.reshape(-1) * len(sources) + source
+    counts = np.bincount(key, weights=weights, minlength=len(alters) * len(sources))
+    return alters, counts.astype(np.int64).reshape(len(alters), len(sources))
+
+
+def rank(scores: np.ndarray, names: np.ndarray, n: int | None = None) -> np.ndarray:
+    """
+    Positions of the n highest scores, highest first, equal scores in alphabetical order of names
+
+    Only the rows that can be among the first n are sorted: the n-th highest
+    score is found with a partial selection and lower scores are dropped.
+    n None ranks all rows.
+    """
+    if n is not None and n < len(scores):
+        if n <= 0:
+            return np.empty(0, dtype=np.intp)
+        threshold = np.partition(scores, len(scores) - n)[len(scores) - n]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((names[candidates].astype(str), -scores[candidates]))
+    return candidates[order[:n]]
+
+
+def likes_summary(events: EventTable) -> pd.DataFrame:
+    """
+    The number of liked posts and liked comments per account, most liked posts first
+    Accounts with the same number of liked posts are in alphabetical order
+    """
+    kinds, alters = events.column("kind"), events.column("alter")
+    codes, counts = join_counts([(alters[kinds == kind], None) for kind in LIKE_KINDS])
+    names = events.pool.take(codes)
+    order = rank(counts[:, 0], names)
+
+    return pd.DataFrame({
+        "Gebruikersnaam": names[order],
+        "Hashed Gebruikersnaam": events.pool.take_hashes(codes[order]),
+        "Berichten met likes": counts[order, 0],
+        "Reacties met likes": counts[order, 1],
+    })
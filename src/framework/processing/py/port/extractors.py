@@ -0,0 +1,445 @@
+"""
+Contains the extractor registry and the single pass member scheduler
+
+An extractor declares the archive members it consumes (fnmatch patterns on the
+member path) and the tables it produces. The scheduler walks the archive once,
+decompresses every member that at least one extractor wants exactly once and
+feeds it to all interested extractors. The cost of an extraction grows with the
+number of members read, not with the number of extractors.
+
+Every extractor runs under its own time budget (port.cancellation). An
+extractor that overruns its budget is no longer fed and returns the results
+it collected so far, its status records the overrun. When the host cancels,
+the pass stops after the current member and no tables are returned.
+An extractor that raises is no longer fed either, its status is "failed"
+and its tables are not stored in the result store.
+
+A large member that all its extractors stream (see port.planner) is never
+held in memory as a whole: it is decompressed chunk by chunk, once for every
+extractor that consumes it.
+
+Extractors that only need the central directory declare index_patterns: the
+ZipInfo of every matching member is given to feed_info before the pass, the
+members themselves are never read.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Iterator
+import logging
+import time
+import zipfile
+
+import pandas as pd
+
+from port.columns import StringPool
+from port.events import EventTable
+from port.archive import open_archive
+from port.cancellation import Budget, CancellationToken, CANCELLED
+from port.checkpoint import Checkpoint, MemoryCheckpointStore
+import port.checkpoint as checkpoint
+import port.metrics as metrics
+from port.filters import ExtractionFilters, DEFAULT_FILTERS
+from port.my_exceptions import ExtractionCancelledError
+from port.planner import Plan
+from port.result_store import ResultStore
+from port.validate import DDPFiletype, matches
+
+logger = logging.getLogger(__name__)
+
+MEMBERS_READ = metrics.counter("port_members_read", "Archive members read by run_extractors")
+BYTES_DECOMPRESSED = metrics.counter("port_bytes_decompressed", "Uncompressed bytes of the members read")
+EXTRACTIONS_RUNNING = metrics.gauge("port_extractions_running", "Extractions in progress")
+EXTRACTOR_SECONDS = metrics.histogram("port_extractor_seconds", "Seconds per extractor step", ("extractor", "step"))
+
+
+@dataclass
+class ExtractionContext:
+    """
+    State shared by the extractors of a single extraction
+    """
+    filters: ExtractionFilters = DEFAULT_FILTERS
+    # the strings of the extraction, see port.columns
+    strings: StringPool = field(default_factory=StringPool)
+    # the messages and likes of the extraction, see port.events; created on the strings pool when not given
+    events: EventTable = None  # type: ignore[assignment]
+    # "M" for activity per month, "W" for activity per week
+    activity_period: str = "M"
+    # number of counters of the top accounts extractors,
+    # exact_counts counts all accounts instead
+    top_k: int = 100
+    exact_counts: bool = False
+    # cancelled by the host to stop the extraction
+    token: CancellationToken = field(default_factory=CancellationToken)
+    # seconds an extractor may run, None is no limit; time_budgets overrides it per extractor name
+    time_budget: float | None = None
+    time_budgets: dict[str, float] = field(default_factory=dict)
+    # extractor name -> "ok", "timed_out", "cancelled" or "failed", filled by run_extractors
+    statuses: dict[str, str] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        if self.events is None:
+            self.events = EventTable(self.strings)
+
+    def key(self) -> str:
+        """
+        Identifies the settings that change the results of the extractors
+        """
+        return f"{self.filters.key()}-{self.activity_period}-{self.top_k}-{int(self.exact_counts)}"
+
+
+class Extractor:
+    """
+    Base class for extractors
+
+    name: identifies the extractor, its state is checkpointed under this name
+    ddp_filetype: the DDP filetype the extractor applies to
+    patterns: fnmatch patterns of the members the extractor consumes, patterns without
+              a "/" are matched against the file name, others against the full member path
+    index_patterns: patterns of the members of which the extractor only needs the ZipInfo, see feed_info
+    tables: table key -> (title key, adjustable) of the tables the extractor produces
+    cost_per_byte, cost_per_member: estimated seconds per uncompressed byte and per member, see port.planner
+    streamable: the extractor can consume a member as a stream of chunks, see feed_stream
+    version: part of the key of stored results, bump it when the output of the extractor changes
+    depends_on: names of the extractors that fill shared state the extractor reads, see port.result_store
+
+    Long running loops in feed should call self.token.check()
+    """
+    name: str = ""
+    ddp_filetype: DDPFiletype = DDPFiletype.JSON
+    patterns: tuple[str, ...] = ()
+    index_patterns: tuple[str, ...] = ()
+    tables: dict[str, tuple[str, bool]] = {}
+    cost_per_byte: float = 1 / 50e6
+    cost_per_member: float = 0.001
+    streamable: bool = False
+    # set by the planner: members this extractor consumes alone are streamed
+    streaming: bool = False
+    version: str = "1"
+    depends_on: tuple[str, ...] = ()
+
+    def __init__(self, context: ExtractionContext) -> None:
+        self.context = context
+        seconds = context.time_budgets.get(self.name, context.time_budget)
+        self.token = Budget(seconds, context.token)
+
+    def wants(self, member: str) -> bool:
+        return any(matches(member, pattern) for pattern in self.patterns)
+
+    def indexes(self, member: str) -> bool:
+        return any(matches(member, pattern) for pattern in self.index_patterns)
+
+    def feed(self, member: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def feed_info(self, info: zipfile.ZipInfo) -> None:
+        """
+        Consumes the central directory entry of a member matching index_patterns
+        Runs on every run, also when the extraction resumes, state built from it is not checkpointed
+        """
+        raise NotImplementedError
+
+    def feed_stream(self, member: str, chunks: Iterator[bytes]) -> None:
+        """
+        Consumes a member chunk by chunk, streamable extractors override it
+        """
+        self.feed(member, b"".join(chunks))
+
+    def finish(self) -> dict[str, pd.DataFrame]:
+        """
+        Returns the produced tables, keys are keys of self.tables
+        """
+        raise NotImplementedError
+
+    def get_state(self) -> Any:
+        """
+        Json serializable partial results, used for checkpointing
+        """
+        return None
+
+    def set_state(self, state: Any) -> None:
+        pass
+
+
+class FirstMemberExtractor(Extractor):
+    """
+    Extractor that consumes only the first member matching each of its patterns
+    """
+
+    def __init__(self, context: ExtractionContext) -> None:
+        super().__init__(context)
+        self.seen: list[str] = []
+
+    def wants(self, member: str) -> bool:
+        return any(matches(member, p) for p in self.patterns if p not in self.seen)
+
+    def pattern_of(self, member: str) -> str:
+        return next(p for p in self.patterns if p not in self.seen and matches(member, p))
+
+    def feed(self, member: str, data: bytes) -> None:
+        pattern = self.pattern_of(member)
+        self.seen.append(pattern)
+        self.feed_pattern(pattern, data)
+
+    def feed_stream(self, member: str, chunks: Iterator[bytes]) -> None:
+        pattern = self.pattern_of(member)
+        self.seen.append(pattern)
+        self.feed_pattern_stream(pattern, chunks)
+
+    def feed_pattern(self, pattern: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def feed_pattern_stream(self, pattern: str, chunks: Iterator[bytes]) -> None:
+        self.feed_pattern(pattern, b"".join(chunks))
+
+
+REGISTRY: list[type[Extractor]] = []
+
+
+def register(extractor: type[Extractor]) -> type[Extractor]:
+    """
+    Class decorator that adds an extractor to the registry
+    Extractors run, and their tables are returned, in order of registration
+    """
+    REGISTRY.append(extractor)
+    return extractor
+
+
+def extractors_for(ddp_filetype: DDPFiletype, context: ExtractionContext) -> list[Extractor]:
+    return [extractor(context) for extractor in REGISTRY if extractor.ddp_filetype == ddp_filetype]
+
+
+# bytes per chunk of a streamed member
+STREAM_CHUNK_SIZE = 1 << 20
+
+# central directory entries indexed between two cancellation checks
+MEMBER_CHECK_EVERY = 4096
+
+
+def _stream(zf: Any, info: zipfile.ZipInfo) -> Iterator[bytes]:
+    with zf.open(info) as f:
+        while chunk := f.read(STREAM_CHUNK_SIZE):
+            yield chunk
+
+
+def _read_ahead(zf: Any, infos: list[zipfile.ZipInfo], workers: int) -> Iterator[tuple[zipfile.ZipInfo, bytes]]:
+    """
+    Yields the members in order, with workers > 1 they are decompressed ahead in threads
+    """
+    if workers <= 1:
+        for info in infos:
+            yield info, zf.read(info)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = iter(infos)
+        window = deque((info, executor.submit(zf.read, info)) for info in islice(pending, 2 * workers))
+        while window:
+            info, future = window.popleft()
+            following = next(pending, None)
+            if following is not None:
+                window.append((following, executor.submit(zf.read, following)))
+            yield info, future.result()
+
+
+def _feed_index(infos: list[zipfile.ZipInfo], extractors: list[Extractor], failed: set[str]) -> None:
+    """
+    Gives the extractors with index_patterns the ZipInfo of the members they index
+    Extractors that raise are added to failed
+    """
+    for extractor in extractors:
+        if not extractor.index_patterns:
+            continue
+        try:
+            with extractor.token.running(), EXTRACTOR_SECONDS.time(extractor=extractor.name, step="index"):
+                for i, info in enumerate(infos):
+                    if i % MEMBER_CHECK_EVERY == 0:
+                        extractor.token.check()
+                    if not info.is_dir() and extractor.indexes(info.filename):
+                        extractor.feed_info(info)
+        except ExtractionCancelledError as e:
+            logger.warning("Extractor %s stopped in the index: %s", extractor.name, e)
+        except Exception as e:
+            logger.error("Extractor %s failed in the index: %s", extractor.name, e)
+            failed.add(extractor.name)
+
+
+def run_extractors(
+    zfile: str,
+    extractors: list[Extractor],
+    cp: Checkpoint | None = None,
+    plan: Plan | None = None,
+    results: ResultStore | None = None,
+) -> dict[str, pd.DataFrame]:
+    """
+    Walks the archive once and feeds every member to the extractors that want it
+
+    The members read, the state of the extractors and the events added to
+    context.events since the previous checkpoint are checkpointed every
+    MEMBER_BATCH_SIZE members, members read in an earlier run are skipped
+    The status of every extractor is recorded in context.statuses; an extractor
+    that raises is no longer fed and produces no tables, and neither do the
+    extractors that depend on it, their tables would hold truncated counts
+    With a plan, members are decompressed ahead by plan.workers threads and the
+    estimated and actual timings are logged
+    With a result store, extractors whose results are stored are not run, their
+    tables are taken from the store; the results of the others are stored
+    """
+    if cp is None:
+        cp = Checkpoint(MemoryCheckpointStore(), "")
+
+    keys: dict[str, str] = {}
+    found: dict[str, dict[str, pd.DataFrame]] = {}
+    if results is not None:
+        try:
+            with open_archive(zfile) as zf:
+                keys, found = results.lookup(zf.infolist(), extractors)
+        except zipfile.BadZipFile as e:
+            logger.error("BadZipFile:  %s", e)
+        for extractor in extractors:
+            if extractor.name in found:
+                extractor.context.statuses[extractor.name] = "cached"
+        extractors = [e for e in extractors if e.name not in found]
+
+    start = time.perf_counter()
+    workers = plan.workers if plan is not None else 1
+
+    token = extractors[0].context.token if extractors else CancellationToken()
+    failed: set[str] = set()
+
+    # the events are checkpointed in parts, see port.checkpoint
+    if extractors:
+        events = extractors[0].context.events
+        parts = cp.get_parts("events")
+        if parts is None:
+            cp.clear()
+        for part in parts or []:
+            events.set_state(part)
+        cp.track_parts("events", events.get_state)
+
+    for extractor in extractors:
+        state = cp.get(extractor.name)
+        if state is not None:
+            extractor.set_state(state)
+        cp.track(extractor.name, extractor.get_state)
+
+    done = cp.get("members_done", [])
+    skip = set(done)
+    n_read = 0
+    EXTRACTIONS_RUNNING.inc()
+
+    try:
+        with open_archive(zfile) as zf:
+            _feed_index(zf.infolist(), extractors, failed)
+            # an extractor that failed is no longer fed
+            feeding = [e for e in extractors if e.name not in failed]
+            candidates = [
+                info for info in zf.infolist()
+                if not info.is_dir() and info.filename not in skip and any(e.wants(info.filename) for e in feeding)
+            ]
+            # members that all their extractors stream are not read ahead
+            streamed = {
+                info.filename for info in candidates
+                if all(e.streaming for e in feeding if e.wants(info.filename))
+            }
+            in_memory = _read_ahead(zf, [i for i in candidates if i.filename not in streamed], workers)
+
+            try:
+                for info in candidates:
+                    if token.cancelled:
+                        break
+
+                    # wants is asked again, the state of the extractors changed since the candidates were chosen
+                    interested = [
+                        e for e in extractors
+                        if e.name not in failed and not e.token.cancelled and e.wants(info.filename)
+                    ]
+                    data = None
+                    if info.filename not in streamed:
+                        _, data = next(in_memory)
+                        MEMBERS_READ.inc()
+                        BYTES_DECOMPRESSED.inc(len(data))
+                    if not interested:
+                        continue
+
+                    for extractor in interested:
+                        try:
+                            timer = EXTRACTOR_SECONDS.time(extractor=extractor.name, step="feed")
+                            with extractor.token.running(), timer:
+                                extractor.token.check()
+                                if data is None:
+                                    extractor.feed_stream(info.filename, _stream(zf, info))
+                                else:
+                                    extractor.feed(info.filename, data)
+                        except ExtractionCancelledError as e:
+                            logger.warning("Extractor %s stopped on %s: %s", extractor.name, info.filename, e)
+                        except Exception as e:
+                            logger.error("Extractor %s failed on a member: %s", extractor.name, e)
+                            failed.add(extractor.name)
+
+                    # a member cancelled halfway is read again when the extraction resumes
+                    if token.cancelled:
+                        break
+
+                    if data is None:
+                        MEMBERS_READ.inc()
+                        BYTES_DECOMPRESSED.inc(info.file_size)
+                    done.append(info.filename)
+                    n_read += 1
+                    if n_read % checkpoint.MEMBER_BATCH_SIZE == 0:
+                        cp.save("members_done", done)
+            finally:
+                # stops the threads reading ahead
+                in_memory.close()
+
+    except zipfile.BadZipFile as e:
+        logger.error("BadZipFile:  %s", e)
+    except KeyboardInterrupt:
+        # raised by the interrupt buffer of Pyodide when the host interrupts the worker
+        token.cancel(CANCELLED)
+
+    # after a cancellation the last checkpoint is kept, it is consistent with the members done
+    if not token.cancelled:
+        cp.save("members_done", done)
+    logger.info("Read %s members for %s extractors", n_read, len(extractors))
+    EXTRACTIONS_RUNNING.dec()
+
+    out: dict[str, pd.DataFrame] = {}
+    if not token.cancelled:
+        for extractor in extractors:
+            failed_inputs = [name for name in extractor.depends_on if name in failed]
+            if failed_inputs:
+                logger.error("Extractor %s skipped, it depends on failed extractors: %s", extractor.name, failed_inputs)
+                failed.add(extractor.name)
+            if extractor.name in failed:
+                continue
+            try:
+                with EXTRACTOR_SECONDS.time(extractor=extractor.name, step="finish"):
+                    out.update(extractor.finish())
+            except ExtractionCancelledError as e:
+                logger.warning("Extractor %s stopped: %s", extractor.name, e)
+            except Exception as e:
+                logger.error("Extractor %s failed: %s", extractor.name, e)
+                failed.add(extractor.name)
+
+    for extractor in extractors:
+        status = "failed" if extractor.name in failed else token.reason or extractor.token.reason or "ok"
+        extractor.context.statuses[extractor.name] = status
+        if status != "ok":
+            logger.warning("Extractor %s: %s after %.1fs", extractor.name, status, extractor.token.spent)
+
+    if plan is not None:
+        plan.log_actual(time.perf_counter() - start, {e.name: e.token.spent for e in extractors})
+
+    if results is not None:
+        for extractor in extractors:
+            if extractor.context.statuses[extractor.name] == "ok" and extractor.name in keys:
+                results.save(keys[extractor.name], {k: out[k] for k in extractor.tables if k in out})
+        results.evict()
+        for tables in found.values():
+            out.update(tables)
+        logger.info("Results taken from the store: %s, %s", list(found), results.stats)
+
+    return out
@@ -0,0 +1,74 @@
+"""
+Contains the declarative filters that are applied during extraction
+
+Filters are pushed down as far as possible: threads are rejected on their
+participants before the full thread is decoded, messages and likes outside the
+date range are dropped before any text processing, and extraction stops
+reading threads once max_threads threads have been accepted.
+
+The date range only applies to JSON DDPs; HTML DDPs have no machine readable timestamps.
+"""
+
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+import hashlib
+import json
+
+
+@dataclass(frozen=True)
+class ExtractionFilters:
+    """
+    start_ms, end_ms: date range on timestamp_ms (inclusive, in ms since epoch)
+    min_participants, max_participants: participant count of a thread, defaults to one-to-one chats
+    min_messages: minimum number of messages (within the date range) in a thread
+    max_threads: maximum number of threads that are extracted
+    """
+    start_ms: int | None = None
+    end_ms: int | None = None
+    min_participants: int | None = 2
+    max_participants: int | None = 2
+    min_messages: int = 0
+    max_threads: int | None = None
+
+    @classmethod
+    def last_months(cls, months: int, now: datetime | None = None, **kwargs) -> "ExtractionFilters":
+        """
+        Filters that keep the last number of months, a month is counted as 30 days
+        """
+        now = now or datetime.now()
+        start = now - timedelta(days=30 * months)
+        return cls(start_ms=int(start.timestamp() * 1000), **kwargs)
+
+    @property
+    def has_date_range(self) -> bool:
+        return self.start_ms is not None or self.end_ms is not None
+
+    def in_date_range(self, timestamp_ms: int | float | None) -> bool:
+        """
+        Items without a timestamp are excluded when a date range is set
+        """
+        if not self.has_date_range:
+            return True
+        if timestamp_ms is None:
+            return False
+        if self.start_ms is not None and timestamp_ms < self.start_ms:
+            return False
+        if self.end_ms is not None and timestamp_ms > self.end_ms:
+            return False
+        return True
+
+    def accepts_participants(self, n_participants: int) -> bool:
+        if self.min_participants is not None and n_participants < self.min_participants:
+            return False
+        if self.max_participants is not None and n_participants > self.max_participants:
+            return False
+        return True
+
+    def key(self) -> str:
+        """
+        Short identifier of these filters, results extracted with different filters differ
+        """
+        return hashlib.sha256(json.dumps(asdict(self), sort_keys=True).encode()).hexdigest()[:16]
+
+
+DEFAULT_FILTERS = ExtractionFilters()
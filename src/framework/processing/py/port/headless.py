@@ -0,0 +1,420 @@
+"""
+Headless host for port.start
+
+Plays the role of py_worker.js and the host: answers every CommandUIRender
+with a scripted payload, collects CommandSystemDonate output and measures
+per command latency and payload size. run_load runs many sessions at once
+against generated exports to load test the full flow on a single machine.
+check_isolation runs the same sessions one by one, interleaved in one thread
+and in a thread pool, and checks that every session donates the same.
+
+Usage: python -m port.headless [--sessions N] [--concurrency N] [--threads] [--metrics]
+                              [--isolation] [--batch] [zip ...]
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Iterator
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+import zipfile
+
+from port.session import SessionConfig
+
+logger = logging.getLogger(__name__)
+
+
+def payload(type: str, value: Any = None) -> SimpleNamespace:
+    """
+    A payload as the host sends it to the script, script.process reads __type__ and value
+    """
+    return SimpleNamespace(__type__=type, value=value)
+
+
+@dataclass
+class HostScript:
+    """
+    The answers of a simulated participant
+
+    zip_path: file to select, None skips the file prompt
+    consent: donate after reviewing the consent form
+    retry: answer to the retry prompt, True tries again with the same file
+    max_retries: guards against endless retry loops
+    """
+    zip_path: str | None
+    consent: bool = True
+    retry: bool = False
+    max_retries: int = 1
+
+
+@dataclass
+class CommandTiming:
+    command: str
+    seconds: float
+    payload_bytes: int
+
+
+@dataclass
+class SessionReport:
+    session_id: str
+    seconds: float = 0.0
+    commands: list[CommandTiming] = field(default_factory=list)
+    donations: dict[str, str] = field(default_factory=dict)
+    # snapshot of the metrics of the session, see port.metrics
+    metrics: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+
+def consent_payload(page: dict[str, Any]) -> SimpleNamespace:
+    """
+    Donates all tables of a consent form as the consent form in the browser serializes them
+    """
+    out: list[Any] = []
+    for table in page["body"]["tables"]:
+        columns = json.loads(table["data_frame"])
+        index = next(iter(columns.values()), {}).keys()
+        rows = [{column: values.get(i) for column, values in columns.items()} for i in index]
+        out.append({table["id"]: rows})
+    out.append({"user_omissions": json.dumps([])})
+    return payload("PayloadJSON", json.dumps(out))
+
+
+def answer(page: dict[str, Any], host: HostScript, retries: int) -> SimpleNamespace:
+    body_type = page.get("body", {}).get("__type__")
+
+    if body_type == "PropsUIPromptFileInput":
+        if host.zip_path is None:
+            return payload("PayloadFalse", False)
+        return payload("PayloadString", host.zip_path)
+    if body_type == "PropsUIPromptConfirm":
+        if host.retry and retries < host.max_retries:
+            return payload("PayloadTrue", True)
+        return payload("PayloadFalse", False)
+    if body_type == "PropsUIPromptProgress":
+        # the browser answers it as soon as it is shown
+        return payload("PayloadVoid")
+    if body_type == "PropsUIPromptConsentForm":
+        if host.consent:
+            return consent_payload(page)
+        return payload("PayloadFalse", False)
+
+    return payload("PayloadVoid")
+
+
+def session_steps(
+    session_id: str,
+    host: HostScript,
+    report: SessionReport,
+    batch: bool = False,
+    config: SessionConfig | None = None,
+) -> Iterator[None]:
+    """
+    Runs one session through port.start with config until the end page is rendered,
+    yields after every command so sessions can be interleaved
+    """
+    import port
+
+    start = time.perf_counter()
+    retries = 0
+    script = None
+
+    try:
+        script = port.start(session_id, config=config, batch=batch)
+        response: Any = None
+
+        while True:
+            t = time.perf_counter()
+            try:
+                command = script.send(response)
+            except StopIteration:
+                break
+            seconds = time.perf_counter() - t
+
+            size = len(json.dumps(command).encode())
+            report.commands.append(CommandTiming(command["__type__"], seconds, size))
+
+            # a batch holds donations, optionally followed by a render
+            page = None
+            for c in command["commands"] if command["__type__"] == "CommandBatch" else [command]:
+                if c["__type__"] == "CommandSystemDonate":
+                    report.donations[c["key"]] = c["json_string"]
+                else:
+                    page = c["page"]
+
+            if page is None:
+                response = payload("PayloadVoid")
+                yield
+                continue
+
+            if page["__type__"] == "PropsUIPageEnd":
+                break
+
+            response = answer(page, host, retries)
+            if page["body"]["__type__"] == "PropsUIPromptConfirm":
+                retries += 1
+            yield
+
+    except Exception as e:
+        logger.error("Session %s failed: %s", session_id, e)
+        report.error = repr(e)
+
+    if script is not None:
+        report.metrics = script.session.metrics.snapshot()
+    report.seconds = time.perf_counter() - start
+
+
+def run_session(
+    session_id: str, host: HostScript, batch: bool = False, config: SessionConfig | None = None
+) -> SessionReport:
+    report = SessionReport(session_id)
+    for _ in session_steps(session_id, host, report, batch, config):
+        pass
+    return report
+
+
+def run_interleaved(hosts: list[HostScript], config: SessionConfig | None = None) -> list[SessionReport]:
+    """
+    Runs a session per host script in this thread, one command of every session in turn
+    """
+    reports = [SessionReport(f"{i}") for i in range(len(hosts))]
+    running = [
+        session_steps(report.session_id, host, report, config=config)
+        for report, host in zip(reports, hosts)
+    ]
+    while running:
+        running = [steps for steps in running if next(steps, StopIteration) is not StopIteration]
+    return reports
+
+
+# the seconds in log lines, such as "took 0.01s", differ from run to run
+SECONDS = re.compile(r"\d+\.\d+")
+# the config of the sessions of check_isolation: log lines and metrics are what sessions could leak to each other
+ISOLATION_CONFIG = SessionConfig(capture_logs=True, attach_metrics=True)
+
+
+def _counts(metrics: dict[str, Any]) -> dict[str, Any]:
+    """
+    The counters of a metrics snapshot and the counts of its histograms
+    """
+    counts = {}
+    for name, metric in metrics.items():
+        for value in metric["values"]:
+            key = f"{name}{sorted(value['labels'].items())}"
+            counts[key] = value["count"] if metric["type"] == "histogram" else value["value"]
+    return counts
+
+
+def _log_lines(json_string: str) -> list[Any]:
+    """
+    The lines of a tracking donation without their times: the timestamp of
+    every line is dropped, seconds are masked and an attached metrics snapshot
+    is reduced to its counts
+    """
+    lines: list[Any] = []
+    for line in json.loads(json_string):
+        if line.startswith("metrics "):
+            lines.append(_counts(json.loads(line[len("metrics "):])))
+        elif line:
+            lines.append(SECONDS.sub("#", line.split(" --- ", 1)[-1]))
+    return lines
+
+
+def _outcome(report: SessionReport) -> dict[str, Any]:
+    """
+    What a session should produce regardless of the other sessions: its donations,
+    the tracking donation without its times, and its counters and the counts of its histograms
+    """
+    donations = {
+        k: _log_lines(v) if k.endswith("-tracking") else v
+        for k, v in report.donations.items()
+    }
+    return {"error": report.error, "donations": donations, "metrics": _counts(report.metrics)}
+
+
+def check_isolation(hosts: list[HostScript], concurrency: int = 4) -> dict[str, Any]:
+    """
+    Runs the sessions one by one, interleaved in one thread and in a thread pool,
+    with the logs captured and the metrics attached to the tracking donation
+    Returns the ids of the sessions whose outcome differs from running them one by one
+    """
+    config = ISOLATION_CONFIG
+    reference = [_outcome(run_session(f"{i}", host, config=config)) for i, host in enumerate(hosts)]
+    interleaved = [_outcome(r) for r in run_interleaved(hosts, config)]
+    threaded = [_outcome(r) for r in run_load(hosts, concurrency, threads=True, config=config).sessions]
+
+    return {
+        "sessions": len(hosts),
+        "interleaved_differs": [i for i, (a, b) in enumerate(zip(reference, interleaved)) if a != b],
+        "threaded_differs": [i for i, (a, b) in enumerate(zip(reference, threaded)) if a != b],
+    }
+
+
+def generate_export(path: str, n_threads: int = 50, n_messages: int = 200, n_likes: int = 1000, seed: int = 0) -> str:
+    """
+    Writes a synthetic Instagram json export to path
+    Text is escaped the way Instagram escapes it
+    """
+    r = random.Random(seed)
+
+    def text(s: str) -> str:
+        return s.encode("utf8").decode("latin1")
+
+    def like(n_accounts: int) -> dict[str, Any]:
+        timestamp = 1_600_000_000 + r.randint(0, 10**8)
+        return {
+            "title": f"account{r.randint(0, n_accounts)}",
+            "string_list_data": [{"href": "", "value": "", "timestamp": timestamp}],
+        }
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        pinfo = {"profile_user": [{"string_map_data": {
+            "Username": {"value": f"user{seed}"},
+            "Name": {"value": text("Gebruikér")},
+            "Gender": {"value": "unspecified"},
+            "Private Account": {"value": "False"},
+        }}]}
+        zf.writestr("personal_information/personal_information.json", json.dumps(pinfo))
+        followers = [{"string_list_data": [{"value": f"follower{i}"}]} for i in range(r.randint(10, 1000))]
+        zf.writestr("followers_and_following/followers_1.json", json.dumps(followers))
+        following = {
+            "relationships_following": [{"string_list_data": [{"value": f"f{i}"}]} for i in range(r.randint(10, 500))]
+        }
+        zf.writestr("followers_and_following/following.json", json.dumps(following))
+
+        for t in range(n_threads):
+            alter = text(f"alter{t} ë")
+            participants = [{"name": alter}, {"name": "me"}]
+            messages = [
+                {
+                    "sender_name": alter if r.random() < 0.5 else "me",
+                    "timestamp_ms": 1_600_000_000_000 + r.randint(0, 10**11),
+                    "content": text(f"message {m} with a few wörds"),
+                }
+                for m in range(r.randint(1, 2 * n_messages))
+            ]
+            thread = {
+                "participants": participants,
+                "messages": messages,
+                "title": alter,
+                "thread_path": f"inbox/alter{t}_{t}",
+            }
+            zf.writestr(f"messages/inbox/alter{t}_{t}/message_1.json", json.dumps(thread))
+
+        zf.writestr("likes/liked_posts.json", json.dumps({"likes_media_likes": [like(100) for _ in range(n_likes)]}))
+        comment_likes = [like(50) for _ in range(n_likes // 5)]
+        zf.writestr("likes/liked_comments.json", json.dumps({"likes_comment_likes": comment_likes}))
+
+    return path
+
+
+@dataclass
+class LoadReport:
+    sessions: list[SessionReport]
+    seconds: float
+
+    def summary(self) -> dict[str, Any]:
+        timings = [c for s in self.sessions for c in s.commands]
+        by_command: dict[str, list[CommandTiming]] = {}
+        for c in timings:
+            by_command.setdefault(c.command, []).append(c)
+
+        def percentile(values: list[float], p: float) -> float:
+            values = sorted(values)
+            return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+        return {
+            "sessions": len(self.sessions),
+            "failed": sum(1 for s in self.sessions if s.error),
+            "seconds": self.seconds,
+            "sessions_per_second": len(self.sessions) / self.seconds if self.seconds else 0.0,
+            "session_seconds_median": statistics.median(s.seconds for s in self.sessions) if self.sessions else 0.0,
+            "round_trips_per_session": len(timings) / len(self.sessions) if self.sessions else 0.0,
+            "commands": {
+                name: {
+                    "count": len(cs),
+                    "seconds_median": statistics.median(c.seconds for c in cs),
+                    "seconds_p95": percentile([c.seconds for c in cs], 0.95),
+                    "bytes_median": statistics.median(c.payload_bytes for c in cs),
+                    "bytes_max": max(c.payload_bytes for c in cs),
+                }
+                for name, cs in by_command.items()
+            },
+        }
+
+
+def _run_session_args(args: tuple[str, HostScript, bool, SessionConfig | None]) -> SessionReport:
+    return run_session(*args)
+
+
+def run_load(
+    hosts: list[HostScript],
+    concurrency: int = 4,
+    threads: bool = False,
+    batch: bool = False,
+    config: SessionConfig | None = None,
+) -> LoadReport:
+    """
+    Runs a session per host script with config, concurrency sessions at a time
+    Sessions run in separate processes, or in threads of this interpreter with threads=True
+    """
+    executor_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    jobs = [(f"{i}", host, batch, config) for i, host in enumerate(hosts)]
+
+    start = time.perf_counter()
+    with executor_class(max_workers=concurrency) as executor:
+        sessions = list(executor.map(_run_session_args, jobs))
+
+    return LoadReport(sessions, time.perf_counter() - start)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Load test port.start with a headless host")
+    parser.add_argument("zips", nargs="*", help="exports to use, generated when omitted")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", action="store_true", help="run sessions in threads instead of processes")
+    parser.add_argument("--threads-per-export", type=int, default=50, help="message threads of generated exports")
+    parser.add_argument("--metrics", action="store_true", help="print the metrics of all sessions as OpenMetrics text")
+    parser.add_argument(
+        "--isolation", action="store_true", help="check that concurrent sessions do not affect each other"
+    )
+    parser.add_argument("--batch", action="store_true", help="coalesce the tracking donations into command batches")
+    args = parser.parse_args(argv)
+
+    if args.isolation:
+        # the isolation check compares the captured log lines: keep the records, only keep them off stderr
+        logging.getLogger().addHandler(logging.NullHandler())
+    else:
+        logging.disable(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        zips = args.zips or [
+            generate_export(os.path.join(tmp, f"export{i}.zip"), n_threads=args.threads_per_export, seed=i)
+            for i in range(args.sessions)
+        ]
+        hosts = [HostScript(zips[i % len(zips)]) for i in range(args.sessions)]
+        if args.isolation:
+            print(json.dumps(check_isolation(hosts, args.concurrency), indent=2))
+            return
+        report = run_load(hosts, args.concurrency, args.threads, args.batch)
+
+    print(json.dumps(report.summary(), indent=2))
+
+    if args.metrics:
+        from port.metrics import Registry
+        registry = Registry()
+        for session in report.sessions:
+            registry.merge(session.metrics)
+        print(registry.openmetrics(), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Contains counters for the most frequent items in a stream
+
+SpaceSaving keeps approximate counts of the top items in a fixed number of
+counters, its memory does not grow with the length of the stream.
+ExactCounter has the same interface and keeps exact counts of all items.
+"""
+
+from collections import Counter
+from typing import Any
+import heapq
+
+
+class SpaceSaving:
+    """
+    Space-Saving algorithm (Metwally et al., 2005) with capacity counters
+
+    Every item with a true count above n / capacity is guaranteed to be tracked.
+    A reported count is an upper bound, the true count is at least count - error.
+    """
+
+    def __init__(self, capacity: int = 100) -> None:
+        self.capacity = capacity
+        self.n = 0
+        self.counts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        # lazy min-heap of (count, item); entries are refreshed when they are found outdated
+        self._heap: list[tuple[int, str]] = []
+
+    def add(self, item: str) -> None:
+        self.n += 1
+
+        if item in self.counts:
+            self.counts[item] += 1
+            return
+
+        if len(self.counts) < self.capacity:
+            self.counts[item] = 1
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (1, item))
+            return
+
+        # replace the item with the minimum count
+        while True:
+            count, smallest = heapq.heappop(self._heap)
+            if self.counts[smallest] == count:
+                break
+            heapq.heappush(self._heap, (self.counts[smallest], smallest))
+
+        del self.counts[smallest]
+        del self.errors[smallest]
+        self.counts[item] = count + 1
+        self.errors[item] = count
+        heapq.heappush(self._heap, (count + 1, item))
+
+    def top(self, n: int | None = None) -> list[tuple[str, int, int]]:
+        """
+        Returns (item, count, error) tuples, ordered by count descending
+        """
+        ranked = sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))[:n]
+        return [(item, count, self.errors[item]) for item, count in ranked]
+
+    def get_state(self) -> dict[str, Any]:
+        return {"n": self.n, "counts": {item: [c, self.errors[item]] for item, c in self.counts.items()}}
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        self.n = state["n"]
+        self.counts = {item: c for item, (c, _) in state["counts"].items()}
+        self.errors = {item: e for item, (_, e) in state["counts"].items()}
+        self._heap = [(c, item) for item, c in self.counts.items()]
+        heapq.heapify(self._heap)
+
+
+class ExactCounter:
+    """
+    Exact counts, memory grows with the number of distinct items
+    """
+
+    def __init__(self, capacity: int | None = None) -> None:
+        self.n = 0
+        self.counts: Counter[str] = Counter()
+
+    def add(self, item: str) -> None:
+        self.n += 1
+        self.counts[item] += 1
+
+    def top(self, n: int | None = None) -> list[tuple[str, int, int]]:
+        ranked = sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))[:n]
+        return [(item, count, 0) for item, count in ranked]
+
+    def get_state(self) -> dict[str, Any]:
+        return {"n": self.n, "counts": dict(self.counts)}
+
+    def set_state(self, state: dict[str, Any]) -> None:
+        self.n = state["n"]
+        self.counts = Counter(state["counts"])
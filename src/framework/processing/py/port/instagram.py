@@ -4,13 +4,12 @@ DDP Instagram module
 This module contains functions to handle *.jons files contained within an instagram ddp
 """
 
-from typing import Any
+from typing import Any, Iterable, Iterator
 from pathlib import Path
 import logging
 import zipfile
 import re
 import string
-import pandas as pd
 import hashlib
 import io
 import json
@@ -18,15 +17,25 @@ import numpy as np
 
 from datetime import datetime
 
-from collections import Counter
+from array import array
+from itertools import chain
 from lxml import etree
 
+import port.unzipddp as unzipddp
+from port.archive import open_archive
+from port.cancellation import CancellationToken
+from port.events import NO_TEXT, NO_TIMESTAMP, RECEIVED, SENT, EventTable
+import port.metrics as metrics
+from port.filters import ExtractionFilters, DEFAULT_FILTERS
 from port.validate import (
     DDPCategory,
+    MemberSchema,
     StatusCode,
     ValidateInput,
     Language,
     DDPFiletype,
+    DEEP_VALIDATION_BYTES,
+    deep_validate,
 )
 
 logger = logging.getLogger(__name__)
@@ -49,8 +58,28 @@ DDP_CATEGORIES = [
 STATUS_CODES = [
     StatusCode(id=0, description="Valid zip", message="Valid zip"),
     StatusCode(id=1, description="Bad zipfile", message="Bad zipfile"),
+    StatusCode(id=2, description="Unexpected schema", message="The key files do not have a known format"),
 ]
 
+# The start of the key members as the extractors read them ("current"), and known older layouts
+MEMBER_SCHEMAS = {
+    DDPFiletype.JSON: [
+        MemberSchema("personal_information.json", "current", b"{", (b'"profile_user"',)),
+        MemberSchema("followers_1.json", "current", b"["),
+        MemberSchema("followers_1.json", "legacy", b"{", (b'"relationships_followers"',)),
+        MemberSchema("*messages/inbox/*/message_1.json", "current", b"{", (b'"participants"',), samples=3),
+        MemberSchema("liked_posts.json", "current", b"{", (b'"likes_media_likes"',)),
+    ],
+    DDPFiletype.HTML: [
+        MemberSchema("personal_information.html", "current", b"<", (b"_2pin _a6_q",), after=b"</head>"),
+        MemberSchema(
+            "followers_1.html", "current", b"<", (b"pam _3-95 _2ph- _a6-g uiBoxWhite noborder",), after=b"</head>"
+        ),
+        MemberSchema("*message_1.html*", "current", b"<", (b"_3-8y _3-95 _a70a",), samples=2, after=b"</head>"),
+        MemberSchema("liked_posts.html", "current", b"<", (b"_3-95 _2pim _a6-h _a6-i",), after=b"</head>"),
+    ],
+}
+
 
 def private_account_bool_to_str(value: str | bool) -> str:
     """
@@ -69,24 +98,35 @@ def private_account_bool_to_str(value: str | bool) -> str:
     return out
 
 
-def validate_zip(zfile: Path) -> ValidateInput:
+def validate_zip(zfile: Path, byte_budget: int = DEEP_VALIDATION_BYTES) -> ValidateInput:
     """
     Validates the input of an Instagram zipfile
+
+    The file names determine the DDP category, after which the start of the key
+    members is checked against MEMBER_SCHEMAS, reading at most byte_budget bytes.
+    byte_budget=0 skips the deep validation.
     """
 
     validate = ValidateInput(STATUS_CODES, DDP_CATEGORIES)
 
     try:
         paths = []
-        with zipfile.ZipFile(zfile, "r") as zf:
+        with open_archive(zfile) as zf:
             for f in zf.namelist():
                 p = Path(f)
                 if p.suffix in (".html", ".json"):
                     logger.debug("Found: %s in zip", p.name)
                     paths.append(p.name)
 
-        validate.set_status_code(0)
-        validate.infer_ddp_category(paths)
+            validate.set_status_code(0)
+            validate.infer_ddp_category(paths)
+
+            if validate.ddp_category is not None and byte_budget > 0:
+                schemas = MEMBER_SCHEMAS[validate.ddp_category.ddp_filetype]
+                validate.deep_validation = deep_validate(zf, schemas, byte_budget)
+                if validate.deep_validation.failed:
+                    validate.set_status_code(2)
+
     except zipfile.BadZipFile:
         validate.set_status_code(1)
 
@@ -102,6 +142,8 @@ def fix_string_encoding(input: str) -> str:
 
     Returns:
         str: The fixed string after encoding and decoding, or the original string if an exception occurs.
+
+    Note: json read with port.unzipddp is already repaired at decode time, see unzipddp.repair_mojibake
     """
     try:
         fixed_string = input.encode("latin1").decode()
@@ -144,7 +186,7 @@ def pinfo_dictionary_create(input_dict: dict[Any, Any]) -> str:
                 infoDictionary[key] = value['value']
             # this is either a username or display name, hash it!
             else:
-                name = fix_string_encoding(value['value'])
+                name = value['value']
                 hname = name.encode()
                 infoDictionary[key] = hashlib.sha256(hname).hexdigest()
         except:
@@ -211,9 +253,8 @@ def personal_information_to_list(dict_with_pinfo: dict[Any, Any] | Any) -> list[
             private_account = dict_with_pinfo["profile_user"][0]["string_map_data"]["Private Account"]["value"]
             private_account = private_account_bool_to_str(private_account)
 
-
-        elif dict_with_pinfo["profile_user"][0]["string_map_data"].get(u'PrivÃ©account') is not None:
-            private_account = dict_with_pinfo["profile_user"][0]["string_map_data"][u"PrivÃ©account"]["value"]
+        elif dict_with_pinfo["profile_user"][0]["string_map_data"].get('Privéaccount') is not None:
+            private_account = dict_with_pinfo["profile_user"][0]["string_map_data"]["Privéaccount"]["value"]
             private_account = private_account_bool_to_str(private_account)
 
         out.append(username)
@@ -371,81 +412,239 @@ def following_to_list_html(html) -> str:
     return followers_to_list_html(html)
 
 
-def process_message_json(messages_list_dict: list[Any] | Any) -> list[str]:
+FOLLOWS_DIV_PATTERN = re.compile(
+    rb"""<div\s[^>]*?class\s*=\s*["']pam _3-95 _2ph- _a6-g uiBoxWhite noborder["']""",
+    re.IGNORECASE,
+)
+
+
+# bytes of a member that count_json_array processes at once
+COUNT_CHUNK_SIZE = 1 << 20
+
+
+def _json_chunks(json_bytes: bytes, size: int) -> Iterator[bytes]:
     """
-    This function extracts instagram your_topics from a dict
-    This dict should be obtained from your_topics.json
+    Chunks that end after a comma, so a key is never split over two chunks
+    """
+    start = 0
+    while start < len(json_bytes):
+        end = json_bytes.find(b",", start + size)
+        end = len(json_bytes) if end < 0 else end + 1
+        yield json_bytes[start:end]
+        start = end
 
-    This function should be rewritten as your_topics.json changes
+
+def count_json_array(json_bytes: bytes, key: str | None = None, chunk_size: int = COUNT_CHUNK_SIZE) -> int | None:
     """
-    out = []
-    printable = set(string.printable)
+    Counts the elements of the top-level json array, or of the array under key
+    of the top-level object, without building the elements
+
+    The member is processed in chunks. In every chunk strings are collapsed to a
+    single byte and whitespace is removed, after which the nesting depth follows
+    from a cumulative sum: the elements are the commas at the depth of the array
+    plus one. Returns None if the array is not found or not closed, or if the
+    member contains escaped quotes; callers then parse the member instead.
+    """
+    try:
+        json_bytes = json_bytes.lstrip(b"\xef\xbb\xbf \t\r\n")
+        if b'\\"' in json_bytes:
+            return None
+        if not json_bytes.startswith(b"[" if key is None else b"{"):
+            return None
+        marker = None if key is None else b'"' + key.encode() + b'"'
+
+        in_string = False
+        depth = 0
+        # depth of the elements of the counted array, None until the array is found
+        level: int | None = None
+        commas = 0
+        empty: bool | None = None
+
+        for chunk in _json_chunks(json_bytes, chunk_size):
+            if marker is not None:
+                chunk = chunk.replace(marker, b"k")
+
+            # without escaped quotes every quote opens or closes a string
+            parts = chunk.split(b'"')
+            compact = b"s".join(parts[1 if in_string else 0::2]).translate(None, b" \t\r\n")
+            if in_string:
+                # the rest of a string that started in an earlier chunk
+                compact = b"s" + compact
+            in_string = in_string != (len(parts) % 2 == 0)
+
+            a = np.frombuffer(compact, dtype=np.uint8)
+            opens = ((a == ord("[")) | (a == ord("{"))).view(np.int8)
+            delta = opens - ((a == ord("]")) | (a == ord("}"))).view(np.int8)
+            # depth after every byte
+            depths = depth + np.cumsum(delta, dtype=np.int32)
+
+            begin = 0
+            if level is None:
+                if key is None:
+                    found = 0
+                else:
+                    found = next((m.end() - 1 for m in re.finditer(rb"k:\[", compact) if depths[m.start()] == 1), None)
+                if found is None:
+                    depth = int(depths[-1]) if len(depths) else depth
+                    continue
+                level = int(depths[found])
+                begin = found + 1
+
+            if empty is None and begin < len(compact):
+                empty = compact[begin] == ord("]")
+
+            closed = np.flatnonzero(depths[begin:] < level)
+            end = begin + int(closed[0]) if len(closed) else len(compact)
+            commas += int(np.count_nonzero((a[begin:end] == ord(",")) & (depths[begin:end] == level)))
+            if len(closed):
+                return 0 if empty else commas + 1
+
+            depth = int(depths[-1]) if len(depths) else depth
+
+        return None
+
+    except Exception as e:
+        logger.debug("Could not count the json array: %s", e)
+        return None
+
+
+def count_followers(json_bytes: bytes) -> int:
+    """
+    followers_to_list on followers_1.json without decoding the followers
+    """
+    n = count_json_array(json_bytes)
+    if n is None:
+        return followers_to_list(unzipddp.read_json_from_bytes(io.BytesIO(json_bytes)))
+    return n
+
 
+def count_following(json_bytes: bytes) -> int:
+    """
+    following_to_list on following.json without decoding the accounts
+    """
+    n = count_json_array(json_bytes, "relationships_following")
+    if n is None:
+        return following_to_list(unzipddp.read_json_from_bytes(io.BytesIO(json_bytes)))
+    return n
+
+
+def count_followers_html(html: bytes) -> str:
+    """
+    followers_to_list_html without building the DOM, counts the follower divs by their class
+    """
+    # followers_to_list_html returns "" for a document without content
+    if not html.strip():
+        return ""
+    return str(len(FOLLOWS_DIV_PATTERN.findall(html)))
+
+
+def peek_participants(message_bytes: bytes, prefix_size: int = 65536) -> int | None:
+    """
+    Counts the participants of a message_1.json thread without decoding the whole thread
+    Only the "participants" array at the start of the file is decoded
+
+    Returns None if the participants could not be found in the prefix
+    """
+    try:
+        prefix = message_bytes[:prefix_size].decode("utf-8-sig", errors="ignore")
+        start = prefix.find('"participants"')
+        if start < 0:
+            return None
+        start = prefix.index("[", start)
+        participants, _ = json.JSONDecoder().raw_decode(prefix, start)
+        return len(participants)
+    except Exception:
+        return None
+
+
+THREADS_PROCESSED = metrics.counter("port_threads_processed", "Message threads summarized", ("format",))
+MESSAGES_PROCESSED = metrics.counter("port_messages_processed", "Messages of the summarized threads", ("format",))
+
+# characters removed from a message before its characters and words are counted
+NOT_PRINTABLE = re.compile(f"[^{re.escape(string.printable)}]+")
+WORD = re.compile(r"\w+")
+
+
+def text_stats(text: str) -> tuple[int, int]:
+    """
+    The number of characters and words of a message
+    Non-ascii characters are removed and white space is collapsed before counting
+    """
+    text = NOT_PRINTABLE.sub("", text)
+    return len(" ".join(text.split())), len(WORD.findall(text))
+
+
+def message_events_json(
+    thread: dict[Any, Any] | Any,
+    events: EventTable,
+    filters: ExtractionFilters = DEFAULT_FILTERS,
+    token: CancellationToken | None = None,
+) -> bool:
+    """
+    Adds a chat of a message_1.json and its messages to events, returns whether the chat was added
+
+    Chats and messages are filtered with filters before any text processing
+    token is checked for every message, see port.cancellation
+    A message without content is added with text length NO_TEXT
+    """
     try:
-        if not isinstance(messages_list_dict, list):
-            raise TypeError("The input to this function was not list")
-        # loop through every dict
-        for mes in messages_list_dict:
-            alter_username = mes["title"]
-            # alter_insta = mes["thread_path"][6:mes["thread_path"].rfind("_")]
-            alter_husername = ''
-            # alter_hinsta = ''
-
-            num_chars = 0
-            num_words = 0
-            num_messages = 0
-            #print(mes["title"],mes["thread_path"],mes["thread_path"][6:mes["thread_path"].rfind("_")])
-            #print('Chats with ', alter_username,alter_insta)
-
-            #skipping all the group chats
-            if(len(mes["participants"])==2):
-                for m in mes["messages"]:
-
-                    if(m["sender_name"] != alter_username and m.get("content") is not None):
-                        num_messages = num_messages + 1
-                        # removing potential non-ascii characters
-                        sender_mes = ''.join(filter(lambda x: x in printable, m["content"]))
-                        # removing potential extra white spaces
-                        sender_mes = " ".join(sender_mes.split())
-                        # counting the words
-                        num_words = num_words + len(re.findall(r'\w+', sender_mes))
-                        # counting the chars
-                        num_chars = num_chars + len(sender_mes)
-                        # Comment out if you want to see message details
-                        #print(m["sender_name"], sender_mes, num_words, num_chars)
-
-                        #print(m["content"],''.join(filter(lambda x: x in #printable, m["content"])),m["sender_name"])
-                #print(alter_username, alter_insta, num_messages, num_words, num_chars)
-                alter_username = fix_string_encoding(alter_username)
-                alter_husername = alter_username.encode()
-                # alter_hinsta = alter_insta.encode()
-
-                out.append((alter_username,hashlib.sha256(alter_husername).hexdigest(), num_messages, num_words, num_chars))
+        if not isinstance(thread, dict):
+            raise TypeError("The input to this function was not dict")
+
+        alter_username = thread["title"]
+        #skipping all the group chats
+        if not filters.accepts_participants(len(thread["participants"])):
+            return False
+
+        messages = thread["messages"]
+        if filters.has_date_range:
+            messages = [m for m in messages if filters.in_date_range(m.get("timestamp_ms"))]
+        if len(messages) < filters.min_messages:
+            return False
+
+        timestamps, directions, lengths, words = array("q"), array("b"), array("i"), array("i")
+        for m in messages:
+            if token is not None:
+                token.check()
+
+            timestamp_ms = m.get("timestamp_ms")
+            timestamps.append(int(timestamp_ms) if timestamp_ms is not None else NO_TIMESTAMP)
+            directions.append(RECEIVED if m.get("sender_name") == alter_username else SENT)
+            content = m.get("content")
+            n_chars, n_words = text_stats(content) if content is not None else (NO_TEXT, 0)
+            lengths.append(n_chars)
+            words.append(n_words)
 
     except TypeError as e:
         logger.error("TypeError: %s", e)
+        return False
     except KeyError as e:
         logger.error("The a dict did not contain the key: %s", e)
+        return False
     except Exception as e:
         logger.error("Exception was caught:  %s", e)
+        return False
 
-    finally:
-        return out
+    # the chat is added as a whole, a cancelled chat leaves no events
+    events.add_thread(alter_username, timestamps, directions, lengths, words)
+    THREADS_PROCESSED.inc(format="json")
+    MESSAGES_PROCESSED.inc(len(messages), format="json")
+    return True
 
 
-def process_messages(html: bytes) -> list[Any] | None:
-    """
-    Extracts the relevant characteristics from an html
-    containing messages (message_1.html)
+def message_events_html(
+    html: bytes,
+    events: EventTable,
+    filters: ExtractionFilters = DEFAULT_FILTERS,
+    token: CancellationToken | None = None,
+) -> bool:
     """
-    printable = set(string.printable)
-
-    num_chars = 0
-    num_words = 0
-    num_messages = 0
-    alter_username = ""
-    alter_husername = ""
+    Adds a chat of a message_1.html and its messages to events, returns whether the chat was added
 
+    The date range of filters is not applied, html messages have no machine readable timestamp
+    The text of a message is in its plain divs, a message without them has text length 0
+    token is checked for every message, see port.cancellation
+    """
     try:
         tree = etree.HTML(html)
 
@@ -454,163 +653,175 @@ def process_messages(html: bytes) -> list[Any] | None:
         r = tree.xpath(f"//div[@class='{alter_div_class}']//div[@class='_a70e']")
         alter_username = r[0].text
 
-        # Filter out group chats
+        # Filter out group chats, their title reads "a, b and c"
         pattern = r'^.*?,.*?and.*'
-        if re.match(pattern, alter_username):
-            return None
-
-        alter_husername = hashlib.sha256(alter_username.encode()).hexdigest()
-
-        # Loop through all messages that are not send by the alter
-        # and all plain text components from those messages
-        messages = []
+        n_participants = alter_username.count(",") + 2 if re.match(pattern, alter_username) else 2
+        if not filters.accepts_participants(n_participants):
+            return False
 
         message_class="pam _3-95 _2ph- _a6-g uiBoxWhite noborder"
         r = tree.xpath(f"//div[@class='{message_class}']")
+        if len(r) < filters.min_messages:
+            return False
 
+        directions, lengths, words = array("b"), array("i"), array("i")
         for e in r:
-            children = e.getchildren()
-            sender_name = children[0].text
-            if alter_username != sender_name:
-                num_messages += 1
-
-                # Text is stored in plain divs look for all plain divs
-                plain_divs = e.xpath("div//div")
-                for e in plain_divs:
-                    if e.text:
-                        messages.append(e.text)
-
-        # Extract meta data from the messages
-        for message in messages:
-            sender_mes = ''.join(filter(lambda x: x in printable, message))
-            # removing potential extra white spaces
-            sender_mes = " ".join(sender_mes.split())
-            # counting the words
-            num_words = num_words + len(re.findall(r'\w+', sender_mes))
-            # counting the chars
-            num_chars = num_chars + len(sender_mes)
+            if token is not None:
+                token.check()
+            sender_name = e.getchildren()[0].text
+            directions.append(RECEIVED if sender_name == alter_username else SENT)
+
+            # Text is stored in plain divs look for all plain divs
+            n_chars = n_words = 0
+            for div in e.xpath("div//div"):
+                if div.text:
+                    chars, words_ = text_stats(div.text)
+                    n_chars += chars
+                    n_words += words_
+            lengths.append(n_chars)
+            words.append(n_words)
 
     except Exception as e:
         logger.error("Error: %s", e)
+        return False
 
-    return [alter_username, alter_husername, num_messages, num_words, num_chars]
-
-
-
-def process_message_html(path_to_zip) -> list[list[Any]]:
-    """
-    Reads all files with message_1.html in the file name
-    processes those htmls with process_messages
-    """
-
-    out = []
-
-    try:
-        with zipfile.ZipFile(path_to_zip, 'r') as zf:
-            for filename in zf.namelist():
-                if 'message_1.html' in filename:
-                    with zf.open(filename, 'r') as f:
-                        html_with_messages = f.read()
-                        processed_message = process_messages(html_with_messages)
-                        if processed_message:
-                            out.append(processed_message)
+    events.add_thread(alter_username, array("q", [NO_TIMESTAMP]) * len(r), directions, lengths, words)
+    THREADS_PROCESSED.inc(format="html")
+    MESSAGES_PROCESSED.inc(len(r), format="html")
+    return True
 
-    except Exception as e:
-        logger.error("Error: %s", e)
 
-    return out
+# Matches the author of an entry in posts_viewed.json and videos_watched.json
+AUTHOR_PATTERN = re.compile(rb'"(?:Author|Auteur)"\s*:\s*\{\s*"value"\s*:\s*"((?:[^"\\]|\\.)*)"')
+# Matches an entry of liked_posts.json or liked_comments.json: the account and the
+# timestamp of the first item of its string_list_data, if any
+LIKE_PATTERN = re.compile(
+    rb'"title"\s*:\s*"([^"\\]*(?:\\.[^"\\]*)*)"'
+    rb'(?:\s*,\s*"string_list_data"\s*:\s*\[\s*\{(?:[^{}"]|"[^"\\]*(?:\\.[^"\\]*)*")*?"timestamp"\s*:\s*(\d+))?'
+)
 
+# bytes of a chunk scanned again with the next chunk, a match split over two chunks is found if it is shorter
+STREAM_OVERLAP_BYTES = 4096
+# likes scanned between two cancellation checks
+LIKES_CHECK_EVERY = 4096
 
-def liked_posts_comments_to_df(liked_posts_dict: dict[Any, Any], liked_comments_dict: dict[Any, Any] | Any) -> pd.DataFrame:
 
+def _json_string(raw: bytes) -> str:
+    """
+    Decodes the bytes between the quotes of a json string
+    """
+    raw = unzipddp.repair_mojibake(raw)
+    return json.loads(b'"' + raw + b'"') if b"\\" in raw else raw.decode("utf8")
 
 
-    if len(liked_posts_dict) == 0:
-        df_posts = pd.DataFrame(columns = ['alter_username', 'nliked_posts'])
-    else:
-        df_posts = pd.DataFrame(liked_posts_dict["likes_media_likes"])
-        df_posts = df_posts.groupby('title').count().reset_index()
-        df_posts.columns = ['alter_username', 'nliked_posts']
-
-    if len(liked_comments_dict) == 0:
-        df_comments = pd.DataFrame(columns = ['alter_username', 'nliked_comments'])
-    else:
-        df_comments = pd.DataFrame(liked_comments_dict["likes_comment_likes"])
-        df_comments = df_comments.groupby('title').count().reset_index()
-        df_comments.columns = ['alter_username', 'nliked_comments']
-
-    print('df_posts,df_comments',df_posts,df_comments)
-
-    df_likes = pd.merge(df_posts, df_comments, on="alter_username", how="outer")
-    df_likes = df_likes.fillna(0)
-    df_likes = df_likes.sort_values("nliked_posts",ascending=False)
-    df_likes['alter_username'] = df_likes['alter_username'].astype(str)
-    # Apply hashing function to the column
-    df_likes['hashed_alter_username'] = df_likes['alter_username'].apply(
-        lambda x:
-            hashlib.sha256(x.encode()).hexdigest()
-    )
+def iter_json_string_values(json_bytes: bytes, pattern: re.Pattern) -> Iterator[str]:
+    """
+    Yields the json strings captured by pattern, in order of appearance
+    The document is scanned, not parsed, so no objects are built for the entries
+    """
+    for m in pattern.finditer(json_bytes):
+        try:
+            yield _json_string(m.group(1))
+        except Exception:
+            continue
 
-    df_likes.columns = ['Gebruikersnaam', 'Berichten met likes', 'Reacties met likes', 'Hashed Gebruikersnaam']
-    df_likes = df_likes[['Gebruikersnaam', 'Hashed Gebruikersnaam', 'Berichten met likes', 'Reacties met likes']]
-    #print('df_likes df_posts df_commentsshape', df_likes.shape,df_posts.shape,df_comments.shape)
-    #print('df.duplicated ',df_likes[df_likes.duplicated(['alter_username'])])
-    return df_likes
 
+def iter_json_matches_stream(chunks: Iterable[bytes], pattern: re.Pattern) -> Iterator[re.Match]:
+    """
+    Yields the matches of pattern in a document that arrives in chunks
 
-def extract_likes_html(html_in: io.BytesIO) -> pd.DataFrame:
+    A match that ends in the last STREAM_OVERLAP_BYTES of the bytes read so far may
+    be incomplete, it is scanned again with the next chunk. The bytes after the last
+    match are scanned again as well, at most STREAM_OVERLAP_BYTES of them, so a match
+    split over two chunks is found if it is shorter
     """
-    Works for liked_posts.html and liked_comments.html
+    carry = b""
+    for chunk in chain(chunks, [None]):
+        final = chunk is None
+        buffer = carry + chunk if chunk is not None else carry
+        limit = len(buffer) if final else len(buffer) - STREAM_OVERLAP_BYTES
+        end, resume = 0, None
+        for m in pattern.finditer(buffer):
+            if m.end() > limit:
+                resume = m.start()
+                break
+            end = m.end()
+            yield m
+        carry = buffer[resume if resume is not None else max(end, limit, 0):]
+
+
+def iter_json_string_values_stream(chunks: Iterable[bytes], pattern: re.Pattern) -> Iterator[str]:
     """
-    html = html_in.read()
+    iter_json_string_values over a document that arrives in chunks, see iter_json_matches_stream
+    """
+    for m in iter_json_matches_stream(chunks, pattern):
+        try:
+            yield _json_string(m.group(1))
+        except Exception:
+            continue
+
+
+def like_events_json(
+    chunks: Iterable[bytes],
+    kind: int,
+    events: EventTable,
+    filters: ExtractionFilters = DEFAULT_FILTERS,
+    token: CancellationToken | None = None,
+) -> None:
+    """
+    Adds the likes of liked_posts.json or liked_comments.json to events as kind
 
-    out = pd.DataFrame()
+    The document is scanned chunk by chunk for LIKE_PATTERN, not parsed, so memory
+    does not grow with the size of the document but with the number of likes.
+    Like timestamps are in seconds, likes outside the date range of filters are dropped
+    token is checked every LIKES_CHECK_EVERY likes, see port.cancellation
+    """
+    alters, timestamps = array("i"), array("q")
+    # account names repeat, each is decoded once
+    codes: dict[bytes, int] = {}
+    for i, m in enumerate(iter_json_matches_stream(chunks, LIKE_PATTERN)):
+        if token is not None and i % LIKES_CHECK_EVERY == 0:
+            token.check()
+        raw, timestamp = m.groups()
+        timestamp_ms = int(timestamp) * 1000 if timestamp is not None else None
+        if filters.has_date_range and not filters.in_date_range(timestamp_ms):
+            continue
+        code = codes.get(raw)
+        if code is None:
+            try:
+                code = codes[raw] = events.pool.code(_json_string(raw))
+            except Exception:
+                continue
+        alters.append(code)
+        timestamps.append(timestamp_ms if timestamp_ms is not None else NO_TIMESTAMP)
+
+    # the likes of a member are added as a whole, a cancelled member leaves no events
+    events.add_likes(kind, alters, timestamps)
+
+
+def like_events_html(
+    html: bytes,
+    kind: int,
+    events: EventTable,
+    token: CancellationToken | None = None,
+) -> None:
+    """
+    Adds the likes of liked_posts.html or liked_comments.html to events as kind
+    token is checked for every like, see port.cancellation
+    """
     try:
-        liked_posts = []
+        names = []
         tree = etree.HTML(html)
         liked_post_class = "_3-95 _2pim _a6-h _a6-i"
         r = tree.xpath(f"//div[@class='{liked_post_class}']")
         for e in r:
-            liked_posts.append(e.text)
-
-        data_points = [
-            (alter_name, hashlib.sha256(alter_name.encode()).hexdigest(), count)
-            for alter_name, count in Counter(liked_posts).items()
-        ]
-        out = pd.DataFrame(data_points)
+            if token is not None:
+                token.check()
+            if e.text is not None:
+                names.append(e.text)
 
     except Exception as e:
         logger.error("Error: %s", e)
+        return
 
-    return out
-
-
-def liked_posts_comments_to_df_html(posts_html: io.BytesIO, comments_html: io.BytesIO) -> pd.DataFrame:
-
-    posts = extract_likes_html(posts_html)
-    comments =  extract_likes_html(comments_html)
-
-    out = pd.DataFrame()
-    if not posts.empty and not comments.empty:
-        try:
-            merged_df = pd.merge(posts, comments, on=[0, 1], how="outer").fillna(0)
-            merged_df.columns = ["Gebruikersnaam", "Hashed Gebruikersnaam", "Berichten met likes", "Reacties met likes"]
-            out = merged_df.sort_values("Berichten met likes", ascending=False).reset_index(drop=True)
-        except Exception as e:
-            logger.error("Error: %s", e)
-
-    if not posts.empty and comments.empty:
-        try:
-            posts.columns = ["Gebruikersnaam", "Hashed Gebruikersnaam", "Berichten met likes"]
-            out = posts.sort_values("Berichten met likes", ascending=False).reset_index(drop=True)
-        except Exception as e:
-            logger.error("Error: %s", e)
-
-    if posts.empty and not comments.empty:
-        try:
-            comments.columns = ["Gebruikersnaam", "Hashed Gebruikersnaam", "Reacties met likes"]
-            out = comments.sort_values("Reacties met likes", ascending=False).reset_index(drop=True)
-        except Exception as e:
-            logger.error("Error: %s", e)
-
-    return out
+    events.add_likes(kind, events.pool.codes(names), array("q", [NO_TIMESTAMP]) * len(names))
@@ -0,0 +1,368 @@
+"""
+Extractors for the Instagram DDP
+
+Each extractor declares the members it consumes and the tables it produces,
+see port.extractors. Extractors run, and their tables are shown in the
+consent form, in the order in which they are registered below.
+"""
+
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Iterator
+import hashlib
+import io
+import re
+import zipfile
+
+import pandas as pd
+
+import port.instagram as instagram
+import port.unzipddp as unzipddp
+from port.activity import MEDIA_KINDS, activity_tables, media_table
+from port.events import LIKED_COMMENT, LIKED_POST, likes_summary, message_summary
+from port.extractors import Extractor, FirstMemberExtractor, register
+from port.heavy_hitters import ExactCounter, SpaceSaving
+from port.validate import DDPFiletype
+
+# number of entries of a high volume log counted between two cancellation checks
+CHECK_EVERY = 4096
+
+# a media file: the kind of media and the year and month of the folder it is stored in, if any
+MEDIA_PATH = re.compile(r"(?:^|/)media/(posts|stories|reels)/(?:(\d{4})(\d{2})/)?")
+
+
+class PersonalInformationExtractor(FirstMemberExtractor):
+    """
+    Personal information together with the number of followers and following
+    """
+    name = "personal_information"
+    tables = {
+        "your_info": ("instagram_your_personal_info", False),
+        "your_info1": ("instagram_your_personal_info_empty", False),
+        "your_info2": ("instagram_your_personal_info_empty", False),
+    }
+
+    def __init__(self, context) -> None:
+        super().__init__(context)
+        self.pinfo: list[Any] | None = None
+        self.followers: Any = None
+        self.following: Any = None
+
+    def feed_missing(self) -> None:
+        # a missing member is processed as an empty member, as extract_file_from_zip would return
+        for pattern in self.patterns:
+            if pattern not in self.seen:
+                self.seen.append(pattern)
+                self.feed_pattern(pattern, b"")
+
+    def finish(self) -> dict[str, pd.DataFrame]:
+        self.feed_missing()
+        if not self.pinfo:
+            return {}
+
+        your_pinfo = self.pinfo + [self.followers, self.following]
+
+        return {
+            "your_info": pd.DataFrame(
+                [tuple(your_pinfo[0:4])],
+                columns=["Gebruikersnaam", "Hashed Gebruikersnaam", "Profielnaam", "Hashed Profielnaam"],
+            ),
+            "your_info1": pd.DataFrame([tuple(your_pinfo[4:6])], columns=["Gender", "Geboortedatum"]),
+            "your_info2": pd.DataFrame(
+                [tuple(your_pinfo[6:10])],
+                columns=["Profiel", "Hidden json pstring", "Volgers", "Volgend"],
+            ),
+        }
+
+    def get_state(self) -> Any:
+        return {"seen": self.seen, "pinfo": self.pinfo, "followers": self.followers, "following": self.following}
+
+    def set_state(self, state: Any) -> None:
+        self.seen = state["seen"]
+        self.pinfo = state["pinfo"]
+        self.followers = state["followers"]
+        self.following = state["following"]
+
+
+@register
+class PersonalInformationJsonExtractor(PersonalInformationExtractor):
+    ddp_filetype = DDPFiletype.JSON
+    patterns = ("personal_information.json", "followers_1.json", "following.json")
+
+    def feed_pattern(self, pattern: str, data: bytes) -> None:
+        # followers and following are only counted, their entries are not decoded
+        if pattern == "personal_information.json":
+            parsed = unzipddp.read_json_from_bytes(io.BytesIO(data))
+            self.pinfo = instagram.personal_information_to_list(parsed) if parsed else []
+        elif pattern == "followers_1.json":
+            self.followers = instagram.count_followers(data)
+        else:
+            self.following = instagram.count_following(data)
+
+
+@register
+class PersonalInformationHtmlExtractor(PersonalInformationExtractor):
+    ddp_filetype = DDPFiletype.HTML
+    patterns = ("personal_information.html", "followers_1.html", "following.html")
+
+    def feed_pattern(self, pattern: str, data: bytes) -> None:
+        if pattern == "personal_information.html":
+            self.pinfo = instagram.personal_information_to_list_html(io.BytesIO(data))
+        elif pattern == "followers_1.html":
+            self.followers = instagram.count_followers_html(data)
+        else:
+            self.following = instagram.count_followers_html(data)
+
+
+class MessagesExtractor(Extractor):
+    """
+    Summary of the messages per one-to-one chat
+    The messages are added to context.events, the summary is aggregated from them
+    The events are checkpointed with context.events, see run_extractors
+    """
+    name = "messages"
+    tables = {"your_messages": ("instagram_messages_summary", True)}
+
+    def wants(self, member: str) -> bool:
+        max_threads = self.context.filters.max_threads
+        if max_threads is not None and self.context.events.n_threads >= max_threads:
+            return False
+        return super().wants(member)
+
+    def finish(self) -> dict[str, pd.DataFrame]:
+        if not self.context.events.n_threads:
+            return {}
+
+        df = message_summary(self.context.events).iloc[:self.context.filters.max_threads]
+        df = df.sort_values("Aantal berichten", ascending=False).reset_index(drop=True)
+        return {"your_messages": df}
+
+
+@register
+class MessagesJsonExtractor(MessagesExtractor):
+    ddp_filetype = DDPFiletype.JSON
+    patterns = ("*messages/inbox/*/message_1.json",)
+    # every message is decoded and counted
+    cost_per_byte = 1 / 15e6
+
+    def feed(self, member: str, data: bytes) -> None:
+        filters = self.context.filters
+
+        # threads rejected on their participants are not decoded
+        n_participants = instagram.peek_participants(data)
+        if n_participants is not None and not filters.accepts_participants(n_participants):
+            return
+
+        thread = unzipddp.read_json_from_bytes(io.BytesIO(data))
+        instagram.message_events_json(thread, self.context.events, filters, self.token)
+
+
+@register
+class MessagesHtmlExtractor(MessagesExtractor):
+    ddp_filetype = DDPFiletype.HTML
+    patterns = ("*message_1.html*",)
+    # lxml parses and walks every message
+    cost_per_byte = 1 / 2e6
+
+    def feed(self, member: str, data: bytes) -> None:
+        instagram.message_events_html(data, self.context.events, self.context.filters, self.token)
+
+
+class LikesExtractor(FirstMemberExtractor):
+    """
+    Number of liked posts and liked comments per account
+    The likes are added to context.events, the table is aggregated from them
+    The events are checkpointed with context.events, see run_extractors
+    """
+    name = "likes"
+    tables = {"your_likes": ("instagram_your_likes", True)}
+    version = "2"
+
+    def finish(self) -> dict[str, pd.DataFrame]:
+        df = likes_summary(self.context.events)
+        return {"your_likes": df} if not df.empty else {}
+
+    def get_state(self) -> Any:
+        return {"seen": self.seen}
+
+    def set_state(self, state: Any) -> None:
+        self.seen = state["seen"]
+
+
+@register
+class LikesJsonExtractor(LikesExtractor):
+    ddp_filetype = DDPFiletype.JSON
+    patterns = ("liked_posts.json", "liked_comments.json")
+    kinds = {"liked_posts.json": LIKED_POST, "liked_comments.json": LIKED_COMMENT}
+    # the likes are scanned for, not parsed, see instagram.like_events_json
+    cost_per_byte = 1 / 30e6
+    streamable = True
+
+    def feed_pattern(self, pattern: str, data: bytes) -> None:
+        self.feed_pattern_stream(pattern, iter([data]))
+
+    def feed_pattern_stream(self, pattern: str, chunks: Iterator[bytes]) -> None:
+        instagram.like_events_json(chunks, self.kinds[pattern], self.context.events, self.context.filters, self.token)
+
+
+@register
+class LikesHtmlExtractor(LikesExtractor):
+    ddp_filetype = DDPFiletype.HTML
+    patterns = ("liked_posts.html", "liked_comments.html")
+    kinds = {"liked_posts.html": LIKED_POST, "liked_comments.html": LIKED_COMMENT}
+
+    def feed_pattern(self, pattern: str, data: bytes) -> None:
+        instagram.like_events_html(data, self.kinds[pattern], self.context.events, self.token)
+
+
+@register
+class ActivityExtractor(Extractor):
+    """
+    Activity over time, aggregated from the events the other extractors collected
+    Consumes no members and is registered after the extractors that collect events
+    """
+    name = "activity"
+    ddp_filetype = DDPFiletype.JSON
+    depends_on = ("messages", "likes")
+    tables = {
+        "your_messages_over_time": ("instagram_messages_over_time", True),
+        "your_likes_over_time": ("instagram_likes_over_time", True),
+    }
+
+    def finish(self) -> dict[str, pd.DataFrame]:
+        tables = activity_tables(self.context.events, self.context.activity_period)
+        out = {}
+        if "messages" in tables:
+            out["your_messages_over_time"] = tables["messages"]
+        if "likes" in tables:
+            out["your_likes_over_time"] = tables["likes"]
+        return out
+
+
+class TopAccountsExtractor(FirstMemberExtractor):
+    """
+    Ranks the accounts in a high volume activity log by their number of entries
+
+    The log is scanned for account names without parsing it into objects and
+    counted with SpaceSaving in context.top_k counters, so memory does not grow
+    with the length of the log. With context.exact_counts all accounts are counted.
+    The date range of the filters is not applied to these logs.
+    """
+    ddp_filetype = DDPFiletype.JSON
+    pattern: re.Pattern
+    table: str
+    cost_per_byte = 1 / 30e6
+    streamable = True
+
+    def __init__(self, context) -> None:
+        super().__init__(context)
+        if context.exact_counts:
+            self.counter: SpaceSaving | ExactCounter = ExactCounter()
+        else:
+            self.counter = SpaceSaving(context.top_k)
+
+    def feed_pattern(self, pattern: str, data: bytes) -> None:
+        self.count(instagram.iter_json_string_values(data, self.pattern))
+
+    def feed_pattern_stream(self, pattern: str, chunks: Iterator[bytes]) -> None:
+        self.count(instagram.iter_json_string_values_stream(chunks, self.pattern))
+
+    def count(self, accounts: Iterator[str]) -> None:
+        for i, account in enumerate(accounts):
+            if i % CHECK_EVERY == 0:
+                self.token.check()
+            self.counter.add(account)
+
+    def finish(self) -> dict[str, pd.DataFrame]:
+        top = self.counter.top(self.context.top_k)
+        if not top:
+            return {}
+
+        df = pd.DataFrame(top, columns=["Gebruikersnaam", "Aantal", "Foutmarge"])
+        df.insert(1, "Hashed Gebruikersnaam", [hashlib.sha256(a.encode()).hexdigest() for a in df["Gebruikersnaam"]])
+        if self.context.exact_counts:
+            df = df.drop(columns="Foutmarge")
+        return {self.table: df}
+
+    def get_state(self) -> Any:
+        return {"seen": self.seen, "counter": self.counter.get_state()}
+
+    def set_state(self, state: Any) -> None:
+        self.seen = state["seen"]
+        self.counter.set_state(state["counter"])
+
+
+@register
+class PostsViewedExtractor(TopAccountsExtractor):
+    name = "posts_viewed"
+    patterns = ("posts_viewed.json",)
+    pattern = instagram.AUTHOR_PATTERN
+    table = "your_posts_viewed"
+    tables = {"your_posts_viewed": ("instagram_posts_viewed", True)}
+
+
+@register
+class VideosWatchedExtractor(TopAccountsExtractor):
+    name = "videos_watched"
+    patterns = ("videos_watched.json",)
+    pattern = instagram.AUTHOR_PATTERN
+    table = "your_videos_watched"
+    tables = {"your_videos_watched": ("instagram_videos_watched", True)}
+
+
+class MediaActivityExtractor(Extractor):
+    """
+    Posts, stories and reels per period: the number of media files and their total size
+
+    Derived from the central directory alone, the media files are never read.
+    A file is dated by its date_time, or by its YYYYMM folder when that is another month.
+    """
+    name = "media_activity"
+    index_patterns = ("*media/posts/*", "*media/stories/*", "*media/reels/*")
+    tables = {"your_media_activity": ("instagram_media_activity", True)}
+
+    def __init__(self, context) -> None:
+        super().__init__(context)
+        self.kinds = array("b")
+        self.timestamps = array("q")
+        self.sizes = array("q")
+
+    def feed_info(self, info: zipfile.ZipInfo) -> None:
+        match = MEDIA_PATH.search(info.filename)
+        if match is None:
+            return
+
+        try:
+            stamp: datetime | None = datetime(*info.date_time, tzinfo=timezone.utc)
+        except ValueError:
+            # the DOS date of a member can be invalid
+            stamp = None
+        year, month = match.group(2), match.group(3)
+        if year is not None and 1 <= int(month) <= 12:
+            if stamp is None or (stamp.year, stamp.month) != (int(year), int(month)):
+                stamp = datetime(int(year), int(month), 1, tzinfo=timezone.utc)
+        if stamp is None:
+            return
+        timestamp_ms = int(stamp.timestamp() * 1000)
+        if not self.context.filters.in_date_range(timestamp_ms):
+            return
+
+        self.kinds.append(MEDIA_KINDS[match.group(1)])
+        self.timestamps.append(timestamp_ms)
+        self.sizes.append(info.file_size)
+
+    def finish(self) -> dict[str, pd.DataFrame]:
+        df = media_table(self.kinds, self.timestamps, self.sizes, self.context.activity_period)
+        if df.empty:
+            return {}
+        return {"your_media_activity": df}
+
+
+@register
+class MediaActivityJsonExtractor(MediaActivityExtractor):
+    ddp_filetype = DDPFiletype.JSON
+
+
+@register
+class MediaActivityHtmlExtractor(MediaActivityExtractor):
+    ddp_filetype = DDPFiletype.HTML
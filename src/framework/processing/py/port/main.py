@@ -1,19 +1,97 @@
 from collections.abc import Generator
+import contextvars
+
+from port.api import wire
+from port.api.commands import CommandBatch, CommandSystemDonate
 from port.script import process
+from port.session import Session, SessionConfig, configure_logging
+
+
+def is_tracking(command):
+    return isinstance(command, CommandSystemDonate) and command.key.endswith("-tracking")
 
 
 class ScriptWrapper(Generator):
-    def __init__(self, script):
+    """
+    Every step of the script runs in the contextvars context of its session,
+    so sessions interleaved in one interpreter do not share state
+
+    With batch, tracking donations are not sent on their own: the latest
+    tracking donation per key is held back and sent in a CommandBatch with
+    the next other command, or when the script ends. A tracking donation
+    holds the whole log of the session so far, so only the latest is needed.
+    """
+
+    def __init__(self, script, mode=wire.DICT, session=None, context=None, batch=False):
+        if mode not in wire.MODES:
+            raise ValueError(f"Unknown wire mode: {mode}")
         self.script = script
+        self.mode = mode
+        self.session = session
+        self.context = context if context is not None else contextvars.copy_context()
+        self.batch = batch
+        self.pending = {}
+        self.finished = False
 
     def send(self, data):
-        command = self.script.send(data)
-        return command.toDict()
+        try:
+            if self.batch:
+                command = self._next_batch(data)
+            else:
+                command = self.context.run(self.script.send, data)
+        except StopIteration:
+            self.close()
+            raise
+        return wire.encode(command, self.mode)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+    def _next_batch(self, data):
+        if self.finished:
+            raise StopIteration
+
+        while True:
+            try:
+                command = self.context.run(self.script.send, data)
+            except StopIteration:
+                self.finished = True
+                if not self.pending:
+                    raise
+                return self._flush(None)
+
+            if not is_tracking(command):
+                return self._flush(command)
+
+            # the script does not read the response to a donation
+            self.pending[command.key] = command
+            data = None
+
+    def _flush(self, command):
+        commands = list(self.pending.values())
+        self.pending = {}
+        if command is not None:
+            commands.append(command)
+        if len(commands) == 1:
+            return commands[0]
+        return CommandBatch(commands)
 
     def throw(self, type=None, value=None, traceback=None):
+        self.close()
         raise StopIteration
 
 
-def start(sessionId):
-    script = process(sessionId)
-    return ScriptWrapper(script)
+def start(sessionId, mode=wire.DICT, config=None, batch=False):
+    """
+    mode selects the wire encoding of the commands, see port.api.wire
+    config is the port.session.SessionConfig of the session
+    batch coalesces the tracking donations, see ScriptWrapper; the host must handle CommandBatch,
+    py_worker.js starts the script with it, see CommandRouter.onCommandBatch
+    """
+    configure_logging()
+    session = Session(sessionId, config if config is not None else SessionConfig())
+    context = contextvars.copy_context()
+    context.run(session.activate)
+    script = process(sessionId, session)
+    return ScriptWrapper(script, mode, session, context, batch)
@@ -0,0 +1,331 @@
+"""
+Contains an in-process metrics registry
+
+Counters, gauges and histograms, optionally with labels, that the extraction
+updates while it runs. A registry is exported as OpenMetrics text, for offline
+and server-side runs that are scraped, or as a JSON snapshot, which the script
+attaches to the tracking donation.
+
+Metrics are declared once at import time and updated on the registry of the
+current session (see port.session), REGISTRY outside of a session:
+
+    MEMBERS_READ = metrics.counter("port_members_read", "Members read from archives")
+    MEMBERS_READ.inc()
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+import json
+import math
+import threading
+import time
+
+# upper bounds of the buckets of a latency histogram, in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0)
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: dict[str, str] | None = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: dict[LabelValues, Any] = {}
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} has labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+    def _copy(self, value: Any) -> Any:
+        return value
+
+    def _items(self) -> list[tuple[LabelValues, Any]]:
+        """
+        A copy of the values, sorted by label values, taken under the lock
+        """
+        with self._lock:
+            items = [(key, self._copy(value)) for key, value in self._values.items()]
+        return sorted(items, key=lambda item: item[0])
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def snapshot(self) -> dict[str, Any]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("Counters only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for key, value in self._items():
+            yield f"{self.name}_total", _format_labels(self.labelnames, key), value
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "type": self.type,
+            "help": self.help,
+            "values": [{"labels": dict(zip(self.labelnames, k)), "value": v} for k, v in self._items()],
+        }
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for key, value in self._items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram(_Metric):
+    """
+    Cumulative buckets, their sum and count per label values
+    """
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def _copy(self, value: Any) -> Any:
+        return dict(value, buckets=list(value["buckets"]))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for key, state in self._items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, state["buckets"]):
+                cumulative += n
+                labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                yield f"{self.name}_bucket", labels, cumulative
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), state["count"]
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), state["sum"]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "type": self.type,
+            "help": self.help,
+            "buckets": [b if not math.isinf(b) else "+Inf" for b in self.buckets],
+            "values": [
+                {
+                    "labels": dict(zip(self.labelnames, k)),
+                    "buckets": list(s["buckets"]),
+                    "sum": s["sum"],
+                    "count": s["count"],
+                }
+                for k, s in self._items()
+            ],
+        }
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, cls: type, name: str, help: str, labelnames: tuple[str, ...], *args: Any) -> Any:
+        existing = self._metrics.get(name)
+        if existing is not None:
+            if type(existing) is not cls or existing.labelnames != labelnames:
+                raise ValueError(f"Metric {name} is already registered differently")
+            return existing
+        metric = self._metrics[name] = cls(name, help, labelnames, *args)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets)
+
+    def reset(self) -> None:
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def openmetrics(self) -> str:
+        """
+        The metrics in the OpenMetrics text format
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, Any]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def merge(self, snapshot: dict[str, Any]) -> None:
+        """
+        Adds the values of a snapshot, of another session or process, to this registry
+        """
+        for name, metric in snapshot.items():
+            for value in metric["values"]:
+                labels = value["labels"]
+                labelnames = tuple(labels)
+                help = metric.get("help", "")
+                if metric["type"] == "histogram":
+                    buckets = tuple(b for b in metric["buckets"] if b != "+Inf")
+                    target = self.histogram(name, help, labelnames, buckets)
+                    with target._lock:
+                        key = target._key(labels)
+                        state = target._values.setdefault(
+                            key, {"buckets": [0] * len(target.buckets), "sum": 0.0, "count": 0}
+                        )
+                        state["buckets"] = [a + b for a, b in zip(state["buckets"], value["buckets"])]
+                        state["sum"] += value["sum"]
+                        state["count"] += value["count"]
+                else:
+                    getattr(self, metric["type"])(name, help, labelnames).inc(value["value"], **labels)
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot())
+
+
+REGISTRY = Registry()
+
+_CURRENT_REGISTRY: ContextVar[Registry] = ContextVar("port_metrics", default=REGISTRY)
+
+
+def current_registry() -> Registry:
+    return _CURRENT_REGISTRY.get()
+
+
+def use_registry(registry: Registry) -> None:
+    """
+    Updates of the metrics in the calling context go to registry, see port.session
+    """
+    _CURRENT_REGISTRY.set(registry)
+
+
+class _Declared:
+    """
+    A metric declared at import time, resolved on the registry of the current context
+    A metric appears in a registry once it is updated
+    """
+
+    def __init__(self, kind: str, *args: Any) -> None:
+        self.kind = kind
+        self.args = args
+
+    def resolve(self) -> Any:
+        return getattr(current_registry(), self.kind)(*self.args)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        self.resolve().inc(amount, **labels)
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.resolve().dec(amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        self.resolve().set(value, **labels)
+
+    def observe(self, value: float, **labels: str) -> None:
+        self.resolve().observe(value, **labels)
+
+    def time(self, **labels: str) -> Any:
+        return self.resolve().time(**labels)
+
+
+def counter(name: str, help: str, labelnames: tuple[str, ...] = ()) -> Any:
+    return _Declared("counter", name, help, labelnames)
+
+
+def gauge(name: str, help: str, labelnames: tuple[str, ...] = ()) -> Any:
+    return _Declared("gauge", name, help, labelnames)
+
+
+def histogram(
+    name: str,
+    help: str,
+    labelnames: tuple[str, ...] = (),
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+) -> Any:
+    return _Declared("histogram", name, help, labelnames, buckets)
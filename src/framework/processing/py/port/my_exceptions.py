@@ -7,3 +7,17 @@ class FileNotFoundInZipError(Exception):
     """
     The File you are looking for is not present in a zipfile
     """
+
+
+class ExtractionCancelledError(BaseException):
+    """
+    Extraction was cancelled by the host or ran out of its time budget
+    Derives from BaseException, so the broad exception handlers of the
+    extraction functions do not swallow it
+    """
+
+
+class ServiceBusyError(Exception):
+    """
+    The job queue of the extraction service is full, the client should retry later
+    """
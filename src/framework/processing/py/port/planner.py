@@ -0,0 +1,150 @@
+"""
+Contains the cost-based extraction planner
+
+The uncompressed sizes of all members are known from the central directory
+before a single member is read. The planner assigns the members to the
+extractors that want them and estimates the duration of the extraction from
+the cost coefficients of the extractors. Per extractor it chooses to read
+members into memory or to stream them, and it chooses the number of threads
+that decompress members ahead of the extractors.
+
+The estimate and the actual timings are logged after every extraction, so the
+coefficients can be calibrated against real exports.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any
+import logging
+import os
+import sys
+import zipfile
+
+from port.validate import matches
+
+logger = logging.getLogger(__name__)
+
+# members larger than this are streamed to extractors that support it
+STREAMING_THRESHOLD_BYTES = 32 * 1024 * 1024
+
+# seconds per uncompressed byte to decompress a member
+DECOMPRESS_SECONDS_PER_BYTE = 1 / 200e6
+
+# maximum number of threads decompressing members ahead of the extractors
+MAX_WORKERS = 4
+
+# members per decompression thread, smaller archives are not worth the threads
+MEMBERS_PER_WORKER = 32
+
+# CPython in WebAssembly is slower than native CPython, the coefficients are measured natively
+PLATFORM_SLOWDOWN = 3.0 if sys.platform == "emscripten" else 1.0
+
+
+@dataclass
+class ExtractorPlan:
+    name: str
+    members: int = 0
+    bytes: int = 0
+    largest: int = 0
+    streaming: bool = False
+    eta_seconds: float = 0.0
+
+
+@dataclass
+class Plan:
+    """
+    The plan of a single extraction
+    """
+    members: int = 0
+    bytes: int = 0
+    json_members: int = 0
+    html_members: int = 0
+    workers: int = 1
+    extractors: dict[str, ExtractorPlan] = field(default_factory=dict)
+    eta_seconds: float = 0.0
+
+    def log(self) -> None:
+        logger.info(
+            "Plan: %s members (%s json, %s html), %s bytes, %s workers, eta %.1fs",
+            self.members, self.json_members, self.html_members, self.bytes, self.workers, self.eta_seconds,
+        )
+        for p in self.extractors.values():
+            logger.info(
+                "Plan %s: %s members, %s bytes, largest %s, %s, eta %.1fs",
+                p.name, p.members, p.bytes, p.largest, "streaming" if p.streaming else "in memory", p.eta_seconds,
+            )
+
+    def applies_to(self, extractors: list[Any]) -> bool:
+        return set(self.extractors) == {e.name for e in extractors}
+
+    def apply(self, extractors: list[Any]) -> None:
+        """
+        Sets the strategy of the plan on extractors, instances of the extractors it was made for
+        """
+        for extractor in extractors:
+            extractor.streaming = self.extractors[extractor.name].streaming
+
+    def log_actual(self, seconds: float, spent: dict[str, float]) -> None:
+        """
+        Logs the estimates next to the actual timings, input for calibrating the coefficients
+        """
+        logger.info("Plan estimated %.1fs, extraction took %.1fs", self.eta_seconds, seconds)
+        for name, p in self.extractors.items():
+            logger.info("Plan %s estimated %.2fs, took %.2fs", name, p.eta_seconds, spent.get(name, 0.0))
+
+
+def _workers(n_members: int) -> int:
+    if sys.platform == "emscripten":
+        # no threads in the browser
+        return 1
+    return max(1, min(MAX_WORKERS, os.cpu_count() or 1, n_members // MEMBERS_PER_WORKER))
+
+
+def plan_extraction(infos: list[zipfile.ZipInfo], extractors: list[Any]) -> Plan:
+    """
+    Plans the extraction of the members in infos by extractors and applies the
+    chosen strategy to the extractors (extractor.streaming)
+
+    Extractors declare their costs with cost_per_byte and cost_per_member (seconds),
+    and whether they can consume a member as a stream (streamable)
+    """
+    plan = Plan(workers=1)
+    n_wanted = 0
+    wanted_bytes = 0
+
+    for extractor in extractors:
+        plan.extractors[extractor.name] = ExtractorPlan(extractor.name)
+
+    for info in infos:
+        if info.is_dir():
+            continue
+        plan.members += 1
+        plan.bytes += info.file_size
+        if info.filename.endswith(".json"):
+            plan.json_members += 1
+        elif info.filename.endswith(".html"):
+            plan.html_members += 1
+
+        # FirstMemberExtractors take one member per pattern, the estimate counts all matches
+        interested = [e for e in extractors if any(matches(info.filename, p) for p in e.patterns)]
+        if interested:
+            n_wanted += 1
+            wanted_bytes += info.file_size
+        for extractor in interested:
+            p = plan.extractors[extractor.name]
+            p.members += 1
+            p.bytes += info.file_size
+            p.largest = max(p.largest, info.file_size)
+
+    plan.workers = _workers(n_wanted)
+
+    for extractor in extractors:
+        p = plan.extractors[extractor.name]
+        p.streaming = extractor.streamable and p.largest > STREAMING_THRESHOLD_BYTES
+        p.eta_seconds = PLATFORM_SLOWDOWN * (p.bytes * extractor.cost_per_byte + p.members * extractor.cost_per_member)
+
+    # decompression overlaps with the extractors when it runs in threads
+    decompress_seconds = PLATFORM_SLOWDOWN * wanted_bytes * DECOMPRESS_SECONDS_PER_BYTE / plan.workers
+    plan.eta_seconds = decompress_seconds + sum(p.eta_seconds for p in plan.extractors.values())
+    plan.apply(extractors)
+
+    return plan
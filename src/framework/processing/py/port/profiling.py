@@ -0,0 +1,193 @@
+"""
+Contains the opt-in profiling of an extraction
+
+With SessionConfig.profile set, the extraction of a session runs under a
+profiler and the profile is donated under the "{sessionId}-profile" key, so a
+slow donation can be analysed on the device that was slow. The profile is
+aggregated by function and holds only code locations (a path relative to its
+package, a line number and a function name), call counts and times: nothing
+of the export or of the file system of the participant.
+
+"cprofile" uses cProfile, which is available in Pyodide and counts every
+call. "sampling" samples the stack of the extracting thread from a thread of
+its own; it has a lower overhead but needs threads, so it is for CPython runs.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Iterator
+import cProfile
+import logging
+import platform
+import pstats
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CPROFILE = "cprofile"
+SAMPLING = "sampling"
+MODES = (CPROFILE, SAMPLING)
+
+# functions in a donated profile, by cumulative time
+PROFILE_TOP = 200
+# seconds between two samples of the sampling profiler
+SAMPLE_INTERVAL = 0.005
+
+
+def location(filename: str, line: int, function: str) -> str:
+    """
+    The location of a function without the directories above its package
+    """
+    if filename.startswith("<") or filename == "~":
+        return function
+    parts = filename.replace("\\", "/").split("/")
+    # .../site-packages/pandas/core/frame.py -> pandas/core/frame.py,
+    # .../lib/python3.11/json/decoder.py -> json/decoder.py
+    for i in range(len(parts) - 2, -1, -1):
+        if parts[i] in ("site-packages", "dist-packages") or parts[i].startswith("python3"):
+            parts = parts[i + 1:]
+            break
+        if parts[i] == "port":
+            parts = parts[i:]
+            break
+    else:
+        parts = parts[-1:]
+    return f"{'/'.join(parts)}:{line}({function})"
+
+
+class Profile:
+    """
+    The profile of an extraction, rows are filled when profiling stops
+    """
+
+    def __init__(self, mode: str | None) -> None:
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.mode = mode
+        self.seconds = 0.0
+        self.rows: list[dict[str, Any]] = []
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "seconds": self.seconds,
+            "python": platform.python_version(),
+            "platform": sys.platform,
+            "functions": self.rows,
+        }
+
+
+def _cprofile_rows(profiler: cProfile.Profile) -> list[dict[str, Any]]:
+    stats = pstats.Stats(profiler).stats  # type: ignore[attr-defined]
+    rows = [
+        {
+            "function": location(filename, line, function),
+            "calls": calls,
+            "primitive_calls": primitive_calls,
+            "self_seconds": round(self_seconds, 6),
+            "cumulative_seconds": round(cumulative_seconds, 6),
+        }
+        for (filename, line, function), (primitive_calls, calls, self_seconds, cumulative_seconds, _) in stats.items()
+    ]
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:PROFILE_TOP]
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread every SAMPLE_INTERVAL seconds
+
+    A function is counted once per sample in which it is on the stack
+    (cumulative) and once per sample in which it is on top (self).
+    The stack is walked up to boundary, the frame that started profiling.
+    """
+
+    def __init__(self, thread_id: int, boundary: Any = None, interval: float = SAMPLE_INTERVAL) -> None:
+        self.thread_id = thread_id
+        self.boundary = boundary
+        self.interval = interval
+        self.samples = 0
+        self.cumulative: Counter[tuple[str, int, str]] = Counter()
+        self.own: Counter[tuple[str, int, str]] = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="port-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            code = frame.f_code
+            self.own[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+            seen = set()
+            while frame is not None and frame is not self.boundary:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if key not in seen:
+                    seen.add(key)
+                    self.cumulative[key] += 1
+                frame = frame.f_back
+
+    def rows(self, seconds: float) -> list[dict[str, Any]]:
+        """
+        Samples are converted to seconds as a share of the wall time of seconds,
+        the sampler wakes up less often than every interval while C code holds the GIL
+        """
+        per_sample = seconds / self.samples if self.samples else 0.0
+        return [
+            {
+                "function": location(*key),
+                "samples": samples,
+                "self_seconds": round(self.own[key] * per_sample, 6),
+                "cumulative_seconds": round(samples * per_sample, 6),
+            }
+            for key, samples in self.cumulative.most_common(PROFILE_TOP)
+        ]
+
+
+@contextmanager
+def profiling(mode: str | None) -> Iterator[Profile]:
+    """
+    Profiles the body with mode, "cprofile", "sampling" or None for no profiling
+    """
+    if mode == SAMPLING and sys.platform == "emscripten":
+        logger.warning("Pyodide has no threads to sample from, profiling with %s", CPROFILE)
+        mode = CPROFILE
+
+    profile = Profile(mode)
+    if mode is None:
+        yield profile
+        return
+
+    start = time.perf_counter()
+    if mode == CPROFILE:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profile
+        finally:
+            profiler.disable()
+            profile.seconds = time.perf_counter() - start
+            profile.rows = _cprofile_rows(profiler)
+    else:
+        # the frame of the with statement, below the frames of contextmanager
+        sampler = SamplingProfiler(threading.get_ident(), sys._getframe(2))
+        sampler.start()
+        try:
+            yield profile
+        finally:
+            sampler.stop()
+            profile.seconds = time.perf_counter() - start
+            profile.rows = sampler.rows(profile.seconds)
+
+    logger.info("Profiled %s functions in %.1fs with %s", len(profile.rows), profile.seconds, mode)
@@ -0,0 +1,190 @@
+"""
+Contains the cross-run store of extractor results, for offline reprocessing
+
+Re-running the extraction over a collection of donated exports after one
+extractor changed should only redo that extractor. The tables of every
+extractor are stored on disk under a key derived from
+- the CRC32 and size of the members the extractor consumes or indexes, from the central directory
+- the version tag of the extractor, bumped when its output changes
+- the settings of the extraction (filters, activity period, top k)
+- the keys of the extractors it depends on
+
+On a later run an extractor whose key is found is not run; its tables are
+loaded from the store. The store is bounded in size, the least recently used
+entries are evicted first.
+
+Usage: python -m port.result_store STORE_DIR zip [zip ...] [--max-mb N]
+"""
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import zipfile
+
+import pandas as pd
+
+from port.validate import matches
+
+logger = logging.getLogger(__name__)
+
+# default maximum size of a store on disk
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+@dataclass
+class ResultStoreStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ResultStore:
+    """
+    Extractor results as pickled tables in a directory, one file per key
+    The modification time of an entry is its last use, see evict
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = ResultStoreStats()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.pkl"
+
+    def key(self, extractor: Any, infos: list[zipfile.ZipInfo], dependencies: list[str]) -> str:
+        members = sorted(
+            (info.filename, info.CRC, info.file_size)
+            for info in infos
+            if any(matches(info.filename, p) for p in extractor.patterns + extractor.index_patterns)
+        )
+        description = {
+            "extractor": f"{type(extractor).__module__}.{type(extractor).__qualname__}",
+            "version": extractor.version,
+            "context": extractor.context.key(),
+            "members": members,
+            "dependencies": dependencies,
+        }
+        return hashlib.sha256(json.dumps(description).encode()).hexdigest()
+
+    def keys(self, infos: list[zipfile.ZipInfo], extractors: list[Any]) -> dict[str, str]:
+        """
+        The key of every extractor, extractors are listed after the extractors they depend on
+        """
+        keys: dict[str, str] = {}
+        for extractor in extractors:
+            dependencies = [keys[name] for name in extractor.depends_on if name in keys]
+            keys[extractor.name] = self.key(extractor, infos, dependencies)
+        return keys
+
+    def load(self, key: str) -> dict[str, pd.DataFrame] | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                tables = pickle.load(f)
+            os.utime(path)
+            return tables
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error("Could not read result: %s", e)
+            return None
+
+    def save(self, key: str, tables: dict[str, pd.DataFrame]) -> None:
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(tables, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.stats.writes += 1
+
+    def lookup(
+        self, infos: list[zipfile.ZipInfo], extractors: list[Any]
+    ) -> tuple[dict[str, str], dict[str, dict[str, pd.DataFrame]]]:
+        """
+        Returns the keys of the extractors and the stored tables of the extractors that need not run
+
+        An extractor that runs needs the extractors it depends on to run as well,
+        they fill the shared state it reads (context.events)
+        """
+        keys = self.keys(infos, extractors)
+        found: dict[str, dict[str, pd.DataFrame]] = {}
+        for extractor in extractors:
+            tables = self.load(keys[extractor.name])
+            if tables is not None:
+                found[extractor.name] = tables
+
+        changed = True
+        while changed:
+            changed = False
+            for extractor in extractors:
+                if extractor.name in found:
+                    continue
+                for name in extractor.depends_on:
+                    if name in found:
+                        del found[name]
+                        changed = True
+
+        self.stats.hits += len(found)
+        self.stats.misses += len(extractors) - len(found)
+        return keys, found
+
+    def size(self) -> int:
+        return sum(path.stat().st_size for path in self.directory.glob("*.pkl"))
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the store fits in max_bytes
+        """
+        entries = sorted((path.stat().st_mtime, path.stat().st_size, path) for path in self.directory.glob("*.pkl"))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats.evictions += 1
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Reprocess exports, rerunning only the extractors whose code or input changed"
+    )
+    parser.add_argument("store", help="directory of the result store")
+    parser.add_argument("zips", nargs="+", help="exports to reprocess")
+    parser.add_argument(
+        "--max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="maximum size of the store"
+    )
+    args = parser.parse_args(argv)
+
+    import port.checkpoint as checkpoint
+    import port.script as script
+
+    logging.disable(logging.ERROR)
+
+    results = ResultStore(args.store, args.max_mb * 1024 * 1024)
+    for path in args.zips:
+        validation, _ = script.extract_instagram(path, store=checkpoint.MemoryCheckpointStore(), results=results)
+        print(json.dumps({"zip": path, "status": validation.status_code.id}))
+
+    print(json.dumps({**asdict(results.stats), "hit_rate": results.stats.hit_rate, "bytes": results.size()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
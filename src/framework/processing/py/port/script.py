@@ -1,27 +1,31 @@
 import logging
 import json
-import io
+import zipfile
 
 import pandas as pd
 
 import port.api.props as props
 from port.api.commands import (CommandSystemDonate, CommandUIRender)
 
+from port.archive import VirtualArchive, open_archive
+from port.cancellation import CancellationToken
+import port.checkpoint as checkpoint
+from port.extractors import ExtractionContext, extractors_for, run_extractors
+from port.filters import DEFAULT_FILTERS
 import port.instagram as instagram
-import port.unzipddp as unzipddp
+import port.instagram_extractors  # noqa: F401, registers the instagram extractors
+import port.metrics as metrics
+from port.planner import plan_extraction
+from port.profiling import profiling
+import port.session
 from port.validate import DDPFiletype
 
-LOG_STREAM = io.StringIO()
-
-logging.basicConfig(
-    #stream=LOG_STREAM,  # comment this line if you want the logs in std out
-    level=logging.INFO,  # change to DEBUG for debugging logs
-    format="%(asctime)s --- %(name)s --- %(levelname)s --- %(message)s",
-    datefmt="%Y-%m-%dT%H:%M:%S%z",
-)
-
+# The state of a session (logs, metrics, checkpoints, configuration) is held in
+# its port.session.Session, the configuration is set with port.session.SessionConfig
 LOGGER = logging.getLogger(__name__)
 
+STAGE_SECONDS = metrics.histogram("port_stage_seconds", "Seconds per stage of the donation flow", ("stage",))
+
 TABLE_TITLES = {
     "instagram_your_topics": props.Translatable(
         {
@@ -59,6 +63,36 @@ TABLE_TITLES = {
                 "nl": "Samenvatting van de berichten:",
             }
     ),
+    "instagram_messages_over_time": props.Translatable(
+            {
+                "en": "Your messages over time:",
+                "nl": "Jouw berichten door de tijd:",
+            }
+    ),
+    "instagram_likes_over_time": props.Translatable(
+            {
+                "en": "Your likes over time:",
+                "nl": "Jouw likes door de tijd:",
+            }
+    ),
+    "instagram_posts_viewed": props.Translatable(
+            {
+                "en": "Accounts whose posts you viewed most:",
+                "nl": "Accounts waarvan je de meeste berichten hebt bekeken:",
+            }
+    ),
+    "instagram_videos_watched": props.Translatable(
+            {
+                "en": "Accounts whose videos you watched most:",
+                "nl": "Accounts waarvan je de meeste video's hebt bekeken:",
+            }
+    ),
+    "instagram_media_activity": props.Translatable(
+            {
+                "en": "Your posts, stories and reels over time:",
+                "nl": "Jouw berichten, verhalen en reels door de tijd:",
+            }
+    ),
     "empty_result_set": props.Translatable(
         {
             "en": "We could not extract any data:",
@@ -68,12 +102,15 @@ TABLE_TITLES = {
 }
 
 
-def process(sessionId):
+def process(sessionId, session=None):
+    if session is None:
+        session = port.session.current()
+
     LOGGER.info("Starting the donation flow")
-    yield donate_logs(f"{sessionId}-tracking")
+    yield donate_logs(f"{sessionId}-tracking", session)
 
     platforms = [
-        ("Instagram", extract_instagram),
+        ("Instagram", extract_instagram, plan_instagram),
     ]
 
     # progress in %
@@ -83,51 +120,72 @@ def process(sessionId):
     progress = 0
 
     for platform in platforms:
-        platform_name, extraction_fun = platform
+        platform_name, extraction_fun, plan_fun = platform
         data = None
 
         # STEP 1: select the file
         progress += step_percentage
         while True:
             LOGGER.info("Prompt for file for %s", platform_name)
-            yield donate_logs(f"{sessionId}-tracking")
+            yield donate_logs(f"{sessionId}-tracking", session)
 
             promptFile = prompt_file("application/zip, text/plain", platform_name)
             fileResult = yield render_donation_page(platform_name, promptFile, progress)
 
             if fileResult.__type__ == "PayloadString":
-                validation, extractionResult = extraction_fun(fileResult.value)
+                plan = plan_fun(fileResult.value)
+
+                if plan is not None:
+                    LOGGER.info("Extraction of %s estimated at %.0fs", platform_name, plan.eta_seconds)
+                    yield donate_logs(f"{sessionId}-tracking", session)
+                    # answered as soon as it is shown, the page stays on screen during the extraction
+                    yield render_donation_page(
+                        platform_name, extraction_progress(platform_name), progress, plan.eta_seconds
+                    )
+
+                token = CancellationToken()
+                with profiling(session.config.profile) as profile:
+                    validation, extractionResult = extraction_fun(
+                        fileResult.value, token=token, plan=plan, session=session
+                    )
+                if profile.mode is not None:
+                    yield donate(f"{sessionId}-profile", json.dumps(profile.to_dict()))
+
+                if token.cancelled:
+                    LOGGER.info("Skipped during extraction %s", platform_name)
+                    yield donate_logs(f"{sessionId}-tracking", session)
+                    break
 
                 # Flow: Three paths
                 # 1: Extracted result: continue (regardless of validation)
                 # 2: No extracted result: valid package, generated empty df: continue
-                # 3: No extracted result: not a valid package, retry loop
+                # 3: No extracted result: not a valid package or key files with an unknown format, retry loop
 
                 if extractionResult:
                     LOGGER.info("Payload for %s", platform_name)
-                    yield donate_logs(f"{sessionId}-tracking")
+                    yield donate_logs(f"{sessionId}-tracking", session)
                     data = extractionResult
                     break
                 elif (validation.status_code.id == 0 and not extractionResult and validation.ddp_category is not None):
                     LOGGER.info("Valid zip for %s; No payload", platform_name)
-                    yield donate_logs(f"{sessionId}-tracking")
+                    yield donate_logs(f"{sessionId}-tracking", session)
                     data = return_empty_result_set()
                     break
-                elif validation.ddp_category is None:
+                elif validation.ddp_category is None or validation.status_code.id == 2:
                     LOGGER.info("Not a valid %s zip; No payload; prompt retry_confirmation", platform_name)
-                    yield donate_logs(f"{sessionId}-tracking")
+                    yield donate_logs(f"{sessionId}-tracking", session)
                     retry_result = yield render_donation_page(platform_name, retry_confirmation(platform_name), progress)
 
                     if retry_result.__type__ == "PayloadTrue":
                         continue
                     else:
                         LOGGER.info("Skipped during retry %s", platform_name)
-                        yield donate_logs(f"{sessionId}-tracking")
+                        yield donate_logs(f"{sessionId}-tracking", session)
                         #data = return_empty_result_set()
                         break
             else:
                 LOGGER.info("Skipped %s", platform_name)
-                yield donate_logs(f"{sessionId}-tracking")
+                yield donate_logs(f"{sessionId}-tracking", session)
                 break
 
         # STEP 2: ask for consent
@@ -135,18 +193,19 @@ def process(sessionId):
 
         if data is not None:
             LOGGER.info("Prompt consent; %s", platform_name)
-            yield donate_logs(f"{sessionId}-tracking")
+            yield donate_logs(f"{sessionId}-tracking", session)
 
-            prompt = prompt_consent(platform_name, data)
+            with STAGE_SECONDS.time(stage="consent"):
+                prompt = prompt_consent(platform_name, data)
             consent_result = yield render_donation_page(platform_name, prompt, progress)
 
             if consent_result.__type__ == "PayloadJSON":
                 LOGGER.info("Data donated; %s", platform_name)
-                yield donate_logs(f"{sessionId}-tracking")
+                yield donate_logs(f"{sessionId}-tracking", session)
                 yield donate(platform_name, consent_result.value)
             else:
                 LOGGER.info("Skipped ater reviewing consent: %s", platform_name)
-                yield donate_logs(f"{sessionId}-tracking")
+                yield donate_logs(f"{sessionId}-tracking", session)
 
     yield render_end_page()
 
@@ -189,139 +248,150 @@ def return_empty_result_set():
     return result
 
 
-def donate_logs(key):
-    log_string = LOG_STREAM.getvalue()  # read the log stream
+def donate_logs(key, session=None):
+    if session is None:
+        session = port.session.current()
+    log_string = session.log_stream.getvalue()  # read the log stream
 
     if log_string:
         log_data = log_string.split("\n")
     else:
         log_data = ["no logs"]
 
-    return donate(key, json.dumps(log_data))
+    if session.config.attach_metrics:
+        log_data.append(f"metrics {session.metrics.to_json()}")
 
+    return donate(key, json.dumps(log_data))
 
-def extract_instagram(instagram_zip):
 
-    validation = instagram.validate_zip(instagram_zip)
+def plan_instagram(instagram_zip, filters=DEFAULT_FILTERS):
+    """
+    Plans the extraction of instagram_zip from its central directory, see port.planner
+    The filetype is the one of the majority of the members; returns None if the zip cannot be read
+    """
+    try:
+        with STAGE_SECONDS.time(stage="plan"), open_archive(instagram_zip) as zf:
+            infos = zf.infolist()
+    except zipfile.BadZipFile as e:
+        LOGGER.error("BadZipFile:  %s", e)
+        return None
+
+    html_members = sum(1 for info in infos if info.filename.endswith(".html"))
+    json_members = sum(1 for info in infos if info.filename.endswith(".json"))
+    ddp_filetype = DDPFiletype.HTML if html_members > json_members else DDPFiletype.JSON
+
+    extractors = extractors_for(ddp_filetype, ExtractionContext(filters=filters))
+    plan = plan_extraction(infos, extractors)
+    plan.log()
+    return plan
+
+
+def extract_instagram(
+    instagram_zip, store=None, filters=DEFAULT_FILTERS, token=None, plan=None, results=None, session=None
+):
+    """
+    instagram_zip is the path to the zip, or a list of paths to the parts of a multi-part export;
+    the file prompt of process gives a single file, so parts are only passed by the headless host and the service
+    Cancelling token stops the extraction, the checkpoint is kept so it can be resumed
+    plan is made by plan_instagram, the extraction is planned again if it is for another filetype
+    results is a port.result_store.ResultStore for offline reprocessing, unchanged extractors are not run
+    session defaults to the current port.session.Session, its checkpoints are used when store is None
+    """
+    if session is None:
+        session = port.session.current()
+
+    if isinstance(instagram_zip, (list, tuple)):
+        # index the parts once, validation, fingerprint and extraction share the merged index
+        try:
+            instagram_zip = VirtualArchive(instagram_zip)
+        except zipfile.BadZipFile as e:
+            LOGGER.error("BadZipFile:  %s", e)
+
+    with STAGE_SECONDS.time(stage="validate"):
+        validation = instagram.validate_zip(instagram_zip)
     result = {}
 
     if validation.ddp_category is None:
-        pass
-    elif validation.ddp_category.ddp_filetype == DDPFiletype.JSON:
-        result = extract_instagram_json(instagram_zip)
-    elif validation.ddp_category.ddp_filetype == DDPFiletype.HTML:
-        result = extract_instagram_html(instagram_zip)
+        return validation, result
 
-    return validation, result
+    # the key files have an unknown format, the extractors would fail on them
+    if validation.status_code.id == 2:
+        LOGGER.info("Unexpected schema, version: %s", validation.deep_validation.schema_version)
+        return validation, result
 
+    if store is None:
+        store = session.checkpoints
+    key = f"{checkpoint.archive_fingerprint(instagram_zip)}-{filters.key()}"
+    cp = checkpoint.Checkpoint(store, key)
 
-##############################################################
-# Extract json
+    if token is None:
+        token = CancellationToken()
 
-def extract_instagram_json(instagram_zip):
-    result = {}
+    if validation.ddp_category.ddp_filetype == DDPFiletype.JSON:
+        result = extract_instagram_json(instagram_zip, cp, filters, token, plan, results, session)
+    elif validation.ddp_category.ddp_filetype == DDPFiletype.HTML:
+        result = extract_instagram_html(instagram_zip, cp, filters, token, plan, results, session)
 
-    #extracting personal information file
-    pinfo_bytes = unzipddp.extract_file_from_zip(instagram_zip, "personal_information.json")
-    pinfo_dict = unzipddp.read_json_from_bytes(pinfo_bytes)
+    # extraction completed, the partial results are no longer needed
+    if not token.cancelled:
+        cp.clear()
 
+    return validation, result
 
-    if pinfo_dict:
-        your_pinfo = instagram.personal_information_to_list(pinfo_dict)
 
-        #extracting followers file
-        followers_bytes = unzipddp.extract_file_from_zip(instagram_zip, "followers_1.json")
-        followers_dict = unzipddp.read_json_from_bytes(followers_bytes)
+def _run_registered_extractors(instagram_zip, ddp_filetype, cp, filters, token, plan=None, results=None, session=None):
+    """
+    Runs all registered extractors for ddp_filetype in a single pass over the zip
+    and titles the tables they produce
+    """
+    if token is None:
+        token = CancellationToken()
+    if session is None:
+        session = port.session.current()
+    context = ExtractionContext(
+        filters=filters,
+        activity_period=session.config.activity_period,
+        token=token,
+        time_budget=session.config.extractor_time_budget,
+    )
+    extractors = extractors_for(ddp_filetype, context)
 
-        #extracting following_dict file
-        following_bytes = unzipddp.extract_file_from_zip(instagram_zip, "following.json")
-        following_dict = unzipddp.read_json_from_bytes(following_bytes)
+    if plan is not None and plan.applies_to(extractors):
+        plan.apply(extractors)
+    else:
+        with open_archive(instagram_zip) as zf:
+            plan = plan_extraction(zf.infolist(), extractors)
+        plan.log()
 
-        your_pinfo.append(instagram.followers_to_list(followers_dict))
-        your_pinfo.append(instagram.following_to_list(following_dict))
+    with STAGE_SECONDS.time(stage="extract"):
+        tables = run_extractors(instagram_zip, extractors, cp, plan, results)
+    LOGGER.info("Extractor statuses: %s", context.statuses)
 
-        # df = pd.DataFrame([tuple(your_pinfo)], columns=["Gebruikersnaam", "Hashed Gebruikersnaam","Profielnaam","Hashed Profielnaam","Gender", "Geboortedatum", "Profiel", "Volgers", "Volgend"])
-        # result["your_info"] = {"data": df, "title": TABLE_TITLES["instagram_your_personal_info"], "adjustable": False}
-        df = pd.DataFrame([tuple(your_pinfo[0:4])], columns=["Gebruikersnaam", "Hashed Gebruikersnaam","Profielnaam","Hashed Profielnaam"])
-        result["your_info"] = {"data": df, "title": TABLE_TITLES["instagram_your_personal_info"], "adjustable": False}
-        df = pd.DataFrame([tuple(your_pinfo[4:6])], columns=["Gender", "Geboortedatum"])
-        result["your_info1"] = {"data": df, "title": TABLE_TITLES["instagram_your_personal_info_empty"], "adjustable": False}
-        df = pd.DataFrame([tuple(your_pinfo[6:10])], columns=["Profiel", "Hidden json pstring", "Volgers", "Volgend"])
-        result["your_info2"] = {"data": df, "title": TABLE_TITLES["instagram_your_personal_info_empty"], "adjustable": False}
-    # extracting messages
-    messages_list_dict = unzipddp.extract_messages_from_zip(instagram_zip)
-    your_messages = instagram.process_message_json(messages_list_dict)
+    result = {}
+    for extractor in extractors:
+        for key, (title, adjustable) in extractor.tables.items():
+            if key in tables:
+                result[key] = {"data": tables[key], "title": TABLE_TITLES[title], "adjustable": adjustable}
 
-    if your_messages:
-        df = pd.DataFrame(your_messages, columns=["Profielnaam","Hashed Profielnaam", "Aantal berichten", "Aantal woorden", "Aantal karakters"])
-        df = df.sort_values("Aantal berichten", ascending=False).reset_index(drop=True)
-        result["your_messages"] = {"data":  df, "title": TABLE_TITLES["instagram_messages_summary"]}
+    return result
 
-    # extracting liked_posts file
-    liked_posts_bytes = unzipddp.extract_file_from_zip(instagram_zip, "liked_posts.json")
-    liked_posts_dict = unzipddp.read_json_from_bytes(liked_posts_bytes)
 
-    liked_comments_bytes = unzipddp.extract_file_from_zip(instagram_zip, "liked_comments.json")
-    liked_comments_dict = unzipddp.read_json_from_bytes(liked_comments_bytes)
+##############################################################
+# Extract json
 
-    df = instagram.liked_posts_comments_to_df(liked_posts_dict, liked_comments_dict)
-    df = df.sort_values("Berichten met likes", ascending=False).reset_index(drop=True)
-    if not df.empty:
-        result["your_likes"] = {"data": df, "title": TABLE_TITLES["instagram_your_likes"]}
+def extract_instagram_json(
+    instagram_zip, cp=None, filters=DEFAULT_FILTERS, token=None, plan=None, results=None, session=None
+):
+    return _run_registered_extractors(instagram_zip, DDPFiletype.JSON, cp, filters, token, plan, results, session)
 
-    return result
 
 ##############################################################
 # Extract html
 
-def extract_instagram_html(instagram_zip):
-    result = {}
-
-    # extracting personal information file
-    pinfo_bytes = unzipddp.extract_file_from_zip(instagram_zip, "personal_information.html")
-    your_pinfo = instagram.personal_information_to_list_html(pinfo_bytes)
-
-    if your_pinfo:
-
-        # add n followers
-        followers_bytes = unzipddp.extract_file_from_zip(instagram_zip, "followers_1.html")
-        followers = instagram.followers_to_list_html(followers_bytes)
-        your_pinfo.append(followers)
-
-        # add n following
-        following_bytes = unzipddp.extract_file_from_zip(instagram_zip, "following.html")
-        following = instagram.followers_to_list_html(following_bytes)
-        your_pinfo.append(following)
-
-        #df = pd.DataFrame([tuple(your_pinfo)], columns=["Gebruikersnaam", "Hashed Gebruikersnaam","Profielnaam","Hashed Profielnaam","Gender", "Geboortedatum", "Profiel", "Volgers", "Volgend"])
-        #result["your_info"] = {"data": df, "title": TABLE_TITLES["instagram_your_personal_info"], "adjustable": False}
-
-        df = pd.DataFrame([tuple(your_pinfo[0:4])], columns=["Gebruikersnaam", "Hashed Gebruikersnaam","Profielnaam","Hashed Profielnaam"])
-        result["your_info"] = {"data": df, "title": TABLE_TITLES["instagram_your_personal_info"], "adjustable": False}
-        df = pd.DataFrame([tuple(your_pinfo[4:6])], columns=["Gender", "Geboortedatum"])
-        result["your_info1"] = {"data": df, "title": TABLE_TITLES["instagram_your_personal_info_empty"], "adjustable": False}
-        df = pd.DataFrame([tuple(your_pinfo[6:10])], columns=["Profiel", "Hidden json pstring", "Volgers", "Volgend"])
-        result["your_info2"] = {"data": df, "title": TABLE_TITLES["instagram_your_personal_info_empty"], "adjustable": False}
-
-    # extracting messages
-    your_messages = instagram.process_message_html(instagram_zip)
-
-    if your_messages:
-        df = pd.DataFrame(your_messages, columns=["Profielnaam","Hashed Profielnaam", "Aantal berichten", "Aantal woorden", "Aantal karakters"])
-        df = df.sort_values("Aantal berichten", ascending=False).reset_index(drop=True)
-        result["your_messages"] = {"data":  df, "title": TABLE_TITLES["instagram_messages_summary"]}
-
-    # extracting liked_posts file
-    liked_posts_bytes = unzipddp.extract_file_from_zip(instagram_zip, "liked_posts.html")
-    liked_comments_bytes = unzipddp.extract_file_from_zip(instagram_zip, "liked_comments.html")
-
-    df = instagram.liked_posts_comments_to_df_html(liked_posts_bytes, liked_comments_bytes)
-    if not df.empty:
-        df = df.sort_values("Berichten met likes", ascending=False).reset_index(drop=True)
-        if not df.empty:
-            result["your_likes"] = {"data": df, "title": TABLE_TITLES["instagram_your_likes"]}
-
-    return result
+def extract_instagram_html(
+    instagram_zip, cp=None, filters=DEFAULT_FILTERS, token=None, plan=None, results=None, session=None
+):
+    return _run_registered_extractors(instagram_zip, DDPFiletype.HTML, cp, filters, token, plan, results, session)
 
 ##########################################
 # Functions provided by Eyra did not change
@@ -331,9 +401,9 @@ def render_end_page():
     return CommandUIRender(page)
 
 
-def render_donation_page(platform, body, progress):
+def render_donation_page(platform, body, progress, eta_seconds=None):
     header = props.PropsUIHeader(props.Translatable({"en": platform, "nl": platform}))
-    footer = props.PropsUIFooter(progress)
+    footer = props.PropsUIFooter(progress, eta_seconds)
     page = props.PropsUIPageDonation(platform, header, body, footer)
     return CommandUIRender(page)
 
@@ -350,6 +420,16 @@ def retry_confirmation(platform):
     return props.PropsUIPromptConfirm(text, ok, cancel)
 
 
+def extraction_progress(platform):
+    text = props.Translatable(
+        {
+            "en": f"We are processing your {platform} file. Please keep this page open.",
+            "nl": f"We verwerken uw {platform} bestand. Houd deze pagina open."
+        }
+    )
+    return props.PropsUIPromptProgress(text)
+
+
 def prompt_file(extensions, platform):
     description = props.Translatable(
         {
@@ -0,0 +1,570 @@
+"""
+Local extraction service with a pool of warm workers
+
+Runs port.script.extract_instagram as a service, for server-side reprocessing
+and for participants whose browser cannot handle their export. Starting an
+interpreter and importing pandas and lxml for every job would dominate small
+jobs, so the worker processes are forked ahead of the jobs from a fork server
+that imported the extraction modules once. A worker runs one job at a time,
+every job in a port.session.Session of its own.
+
+- the job queue is bounded, a job that does not fit is rejected with 503 and Retry-After
+- a job that runs longer than the job timeout is stopped by killing its worker, 504
+- a worker is replaced after max_jobs jobs, which returns the memory it accumulated
+
+Endpoints
+    POST /extract   the export as the request body, or json {"paths": [...]} of exports under --root
+    GET  /health    the workers, the queue and the job counts of the pool
+    GET  /metrics   the metrics of the service and of all jobs as OpenMetrics text
+
+Usage: python -m port.service [--host H] [--port N] [--workers N] [--queue N] [--timeout S] [--max-jobs N] [--root DIR]
+       python -m port.service --check [zip ...]
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator
+import argparse
+import contextvars
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from port.metrics import Registry
+from port.my_exceptions import ServiceBusyError
+
+logger = logging.getLogger(__name__)
+
+# modules a worker has imported before its first job
+PRELOAD_MODULES = ["port.script"]
+# largest export accepted as a request body
+MAX_BODY_BYTES = 8 * 1024 * 1024 * 1024
+# bytes copied at a time from a request body to disk
+BODY_CHUNK_SIZE = 1024 * 1024
+# seconds a rejected client is asked to wait before it retries
+RETRY_AFTER_SECONDS = 5
+# seconds a worker gets to exit after it is asked to stop
+STOP_TIMEOUT = 10
+
+
+@dataclass
+class ServiceConfig:
+    # worker processes, each runs one job at a time
+    workers: int = os.cpu_count() or 1
+    # jobs waiting for a worker, further jobs are rejected
+    queue_size: int = 16
+    # seconds a job may run before its worker is killed, None is no limit
+    job_timeout: float | None = 600
+    # jobs after which a worker is replaced by a fresh one
+    max_jobs: int = 50
+    # directory under which exports may be referenced by path, None only accepts uploads
+    root: str | None = None
+
+
+@dataclass
+class Job:
+    id: int
+    paths: list[str]
+    status: int = 0
+    body: bytes = b""
+    done: threading.Event = field(default_factory=threading.Event)
+
+    def finish(self, status: int, body: bytes) -> None:
+        self.status = status
+        self.body = body
+        self.done.set()
+
+
+def _json(data: Any) -> bytes:
+    return json.dumps(data).encode()
+
+
+def run_job(job_id: str, paths: list[str]) -> tuple[int, bytes, dict[str, Any]]:
+    """
+    Extracts the export at paths, the parts of a multi-part export, in a session of its own
+    Returns the HTTP status, the response body and the metrics snapshot of the session
+
+    The tables are serialized as the consent form serializes them, with DataFrame.to_json()
+    """
+    import port.script as script
+    from port.session import Session
+
+    session = Session(job_id)
+    context = contextvars.copy_context()
+    context.run(session.activate)
+    try:
+        export = paths[0] if len(paths) == 1 else paths
+        validation, result = context.run(script.extract_instagram, export, session=session)
+    except Exception as e:
+        logger.error("Job %s failed: %s", job_id, e)
+        return 500, _json({"error": repr(e)}), session.metrics.snapshot()
+    finally:
+        session.close()
+
+    status_code = validation.status_code
+    body = {
+        "status": {"id": status_code.id, "description": status_code.description} if status_code else None,
+        "tables": {
+            key: {
+                "title": table["title"].translations,
+                "adjustable": table["adjustable"],
+                "data_frame": table["data"].to_json(),
+            }
+            for key, table in result.items()
+        },
+    }
+    return 200, _json(body), session.metrics.snapshot()
+
+
+def _worker(conn: Any) -> None:
+    """
+    Main of a worker process, runs the jobs it receives until it receives None
+    """
+    # the service stops its workers itself, ctrl-c in a terminal reaches the whole process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        conn.send(run_job(*message))
+
+
+def _context() -> Any:
+    """
+    Workers are forked from a fork server that imported PRELOAD_MODULES,
+    or spawned where there is no fork server and import them themselves
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(PRELOAD_MODULES)
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class _Worker:
+    """
+    A worker process and the thread that feeds it jobs from the queue of the pool
+    """
+
+    def __init__(self, pool: "WorkerPool", index: int) -> None:
+        self.pool = pool
+        self.process: Any = None
+        self.conn: Any = None
+        self.jobs = 0
+        self.thread = threading.Thread(target=self._run, name=f"port-service-worker-{index}", daemon=True)
+
+    def spawn(self) -> None:
+        conn, child_conn = self.pool.context.Pipe()
+        self.process = self.pool.context.Process(target=_worker, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = conn
+        self.jobs = 0
+
+    def stop(self, kill: bool = False) -> None:
+        if self.process is None:
+            return
+        if not kill:
+            try:
+                self.conn.send(None)
+            except OSError:
+                kill = True
+        if kill:
+            self.process.kill()
+        self.process.join(STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        self.process = None
+
+    def restart(self, reason: str) -> None:
+        self.pool.RESTARTS.inc(reason=reason)
+        self.stop(kill=reason != "recycled")
+        self.spawn()
+
+    def _run(self) -> None:
+        while True:
+            job = self.pool.queue.get()
+            if job is None:
+                return
+            self.run(job)
+
+    def run(self, job: Job) -> None:
+        timeout = self.pool.config.job_timeout
+        start = time.monotonic()
+        restart = None
+        try:
+            self.conn.send((f"job-{job.id}", job.paths))
+            if self.conn.poll(timeout):
+                status, body, snapshot = self.conn.recv()
+                self.pool.record(snapshot)
+                outcome = "ok" if status == 200 else "failed"
+            else:
+                status, body, outcome = 504, _json({"error": f"Job took longer than {timeout} seconds"}), "timeout"
+                restart = "timeout"
+        except (EOFError, OSError) as e:
+            logger.error("Worker of job %s exited: %s", job.id, e)
+            status, body, outcome = 500, _json({"error": "Worker exited"}), "crashed"
+            restart = "crashed"
+
+        self.pool.JOBS.inc(outcome=outcome)
+        self.pool.JOB_SECONDS.observe(time.monotonic() - start)
+        self.jobs += 1
+
+        # a worker that was killed is replaced before the job is answered, a worker
+        # that is recycled after, it exits on its own once it read None
+        if restart is not None:
+            self.restart(restart)
+        job.finish(status, body)
+        if self.jobs >= self.pool.config.max_jobs:
+            self.restart("recycled")
+
+
+class WorkerPool:
+    """
+    Worker processes fed from a bounded job queue
+    """
+
+    def __init__(self, config: ServiceConfig) -> None:
+        self.config = config
+        self.context = _context()
+        self.queue: queue.Queue[Job | None] = queue.Queue(maxsize=config.queue_size)
+        self.workers: list[_Worker] = []
+        self._ids = itertools.count(1)
+        # guards the metrics, the snapshots of the jobs are merged from the worker threads
+        self._lock = threading.Lock()
+
+        self.metrics = Registry()
+        self.JOBS = self.metrics.counter("port_service_jobs", "Jobs by outcome", ("outcome",))
+        self.JOB_SECONDS = self.metrics.histogram(
+            "port_service_job_seconds", "Seconds from sending a job to a worker to its result"
+        )
+        self.RESTARTS = self.metrics.counter(
+            "port_service_worker_restarts", "Workers replaced by a fresh one", ("reason",)
+        )
+        self.QUEUED = self.metrics.gauge("port_service_queued", "Jobs waiting for a worker")
+
+    def start(self) -> None:
+        self.workers = [_Worker(self, i) for i in range(self.config.workers)]
+        for worker in self.workers:
+            worker.spawn()
+        for worker in self.workers:
+            worker.thread.start()
+
+    def stop(self) -> None:
+        """
+        Lets the workers finish the queued jobs and stops them
+        """
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.thread.join()
+            worker.stop()
+
+    def full(self) -> bool:
+        return self.queue.full()
+
+    def submit(self, paths: list[str]) -> Job:
+        job = Job(next(self._ids), paths)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self.JOBS.inc(outcome="rejected")
+            raise ServiceBusyError(f"{self.config.queue_size} jobs are waiting")
+        return job
+
+    def record(self, snapshot: dict[str, Any]) -> None:
+        with self._lock:
+            self.metrics.merge(snapshot)
+
+    def openmetrics(self) -> str:
+        with self._lock:
+            self.QUEUED.set(self.queue.qsize())
+            return self.metrics.openmetrics()
+
+    def status(self) -> dict[str, Any]:
+        with self._lock:
+            jobs = {dict(v["labels"])["outcome"]: v["value"] for v in self.JOBS.snapshot()["values"]}
+            restarts = {dict(v["labels"])["reason"]: v["value"] for v in self.RESTARTS.snapshot()["values"]}
+        return {
+            "workers": [{"pid": w.process.pid if w.process else None, "jobs": w.jobs} for w in self.workers],
+            "queued": self.queue.qsize(),
+            "queue_size": self.config.queue_size,
+            "jobs": jobs,
+            "restarts": restarts,
+        }
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server: "ExtractionServer"
+
+    def _send(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str = "application/json",
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, headers: dict[str, str] | None = None) -> None:
+        self._send(status, _json({"error": message}), headers=headers)
+
+    def _busy(self, message: str) -> None:
+        # the body is not read, the connection cannot be reused
+        self.close_connection = True
+        self._error(503, message, {"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send(200, _json(self.server.pool.status()))
+        elif self.path == "/metrics":
+            content_type = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+            self._send(200, self.server.pool.openmetrics().encode(), content_type)
+        else:
+            self._error(404, "Not found")
+
+    def do_POST(self) -> None:
+        if self.path != "/extract":
+            self._error(404, "Not found")
+            return
+        if "Content-Length" not in self.headers:
+            self.close_connection = True
+            self._error(411, "Content-Length is required")
+            return
+        length = int(self.headers["Content-Length"])
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._error(413, f"Exports up to {MAX_BODY_BYTES} bytes are accepted")
+            return
+
+        pool = self.server.pool
+        # rejected before the body is read, an upload can be large
+        if pool.full():
+            self._busy(f"{pool.config.queue_size} jobs are waiting")
+            return
+
+        upload = None
+        try:
+            if self.headers.get_content_type() == "application/json":
+                paths = self._paths(json.loads(self.rfile.read(length)))
+            else:
+                upload = self._save_body(length)
+                paths = [upload]
+            job = pool.submit(paths)
+            job.done.wait()
+            self._send(job.status, job.body)
+        except ServiceBusyError as e:
+            self._busy(str(e))
+        except ValueError as e:
+            self._error(400, str(e))
+        finally:
+            if upload is not None:
+                os.unlink(upload)
+
+    def _paths(self, request: Any) -> list[str]:
+        """
+        The exports of a json request, they must be files under the root of the service
+        """
+        if self.server.root is None:
+            raise ValueError("This service only accepts uploads")
+        if not isinstance(request, dict) or not isinstance(request.get("paths"), list) or not request["paths"]:
+            raise ValueError('Expected {"paths": [...]}')
+
+        paths = []
+        for path in request["paths"]:
+            resolved = (self.server.root / str(path)).resolve()
+            if not resolved.is_relative_to(self.server.root) or not resolved.is_file():
+                raise ValueError(f"No export at {path}")
+            paths.append(str(resolved))
+        return paths
+
+    def _save_body(self, length: int) -> str:
+        fd, path = tempfile.mkstemp(suffix=".zip", prefix="port-service-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                remaining = length
+                while remaining > 0:
+                    chunk = self.rfile.read(min(BODY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ValueError("Request body ended early")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return path
+
+
+class ExtractionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], pool: WorkerPool) -> None:
+        super().__init__(address, ServiceHandler)
+        self.pool = pool
+        self.root = Path(pool.config.root).resolve() if pool.config.root else None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+@contextmanager
+def running(config: ServiceConfig, host: str = "127.0.0.1", port: int = 0) -> Iterator[ExtractionServer]:
+    """
+    Runs the service in a background thread, port 0 picks a free port
+    """
+    pool = WorkerPool(config)
+    pool.start()
+    server = ExtractionServer((host, port), pool)
+    thread = threading.Thread(target=server.serve_forever, name="port-service", daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        pool.stop()
+
+
+def post_export(url: str, path: str) -> tuple[int, dict[str, Any]]:
+    """
+    Uploads the export at path, returns the HTTP status and the decoded response
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    request = urllib.request.Request(f"{url}/extract", data=data, headers={"Content-Type": "application/zip"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def get_health(url: str) -> dict[str, Any]:
+    with urllib.request.urlopen(f"{url}/health") as response:
+        return json.loads(response.read())
+
+
+def check(zips: list[str], workers: int = 2) -> dict[str, Any]:
+    """
+    Runs the service on a free localhost port and checks that
+    - every export gives the tables of an in-process extraction, while workers are recycled
+    - a burst larger than the workers and the queue is partly rejected with 503
+    - a job over the timeout gets 504 and its worker is replaced
+    """
+    import port.checkpoint as checkpoint
+    import port.script as script
+
+    expected = {}
+    for path in zips:
+        _, result = script.extract_instagram(path, store=checkpoint.MemoryCheckpointStore())
+        expected[path] = {key: table["data"].to_json() for key, table in result.items()}
+
+    def tables(response: dict[str, Any]) -> dict[str, str]:
+        return {key: table["data_frame"] for key, table in response.get("tables", {}).items()}
+
+    jobs = zips * 2
+    with running(ServiceConfig(workers=workers, queue_size=len(jobs), max_jobs=2)) as server:
+        with ThreadPoolExecutor(len(jobs)) as executor:
+            responses = list(executor.map(lambda path: post_export(server.url, path), jobs))
+        health = get_health(server.url)
+    differs = [
+        path for path, (status, response) in zip(jobs, responses)
+        if status != 200 or tables(response) != expected[path]
+    ]
+
+    largest = max(zips, key=os.path.getsize)
+    with running(ServiceConfig(workers=1, queue_size=1, job_timeout=None)) as server:
+        with ThreadPoolExecutor(8) as executor:
+            burst = sorted(status for status, _ in executor.map(lambda _: post_export(server.url, largest), range(8)))
+
+    with running(ServiceConfig(workers=1, queue_size=1, job_timeout=0.001)) as server:
+        pid = get_health(server.url)["workers"][0]["pid"]
+        timeout_status, _ = post_export(server.url, largest)
+        timeout_health = get_health(server.url)
+
+    return {
+        "jobs": len(jobs),
+        "differs": differs,
+        "recycled": health["restarts"].get("recycled", 0),
+        "burst_statuses": {status: burst.count(status) for status in set(burst)},
+        "timeout_status": timeout_status,
+        "timeout_worker_replaced": timeout_health["workers"][0]["pid"] != pid,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    defaults = ServiceConfig()
+    parser = argparse.ArgumentParser(description="Run extract_instagram as a local HTTP service with warm workers")
+    parser.add_argument("zips", nargs="*", help="exports for --check, generated when omitted")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="0 picks a free port")
+    parser.add_argument("--workers", type=int, default=defaults.workers)
+    parser.add_argument(
+        "--queue", type=int, default=defaults.queue_size, help="jobs waiting for a worker before jobs are rejected"
+    )
+    parser.add_argument("--timeout", type=float, default=defaults.job_timeout, help="seconds a job may run")
+    parser.add_argument("--max-jobs", type=int, default=defaults.max_jobs, help="jobs after which a worker is replaced")
+    parser.add_argument("--root", help="directory under which exports may be referenced by path")
+    parser.add_argument("--check", action="store_true", help="check the service on a free localhost port and exit")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.check:
+        logging.disable(logging.ERROR)
+        from port.headless import generate_export
+        with tempfile.TemporaryDirectory() as tmp:
+            zips = args.zips or [generate_export(os.path.join(tmp, f"export{i}.zip"), seed=i) for i in range(3)]
+            print(json.dumps(check(zips, args.workers), indent=2))
+        return
+
+    config = ServiceConfig(args.workers, args.queue, args.timeout, args.max_jobs, args.root)
+    pool = WorkerPool(config)
+    pool.start()
+    server = ExtractionServer((args.host, args.port), pool)
+    logger.info("Serving on %s with %s workers", server.url, config.workers)
+    # shutdown waits for serve_forever to return, so it cannot run in the handler itself
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Contains the per-session context of the donation flow
+
+A process can host many sessions at once: interleaved generators in one
+interpreter, or sessions in the threads of a pool. Everything a session
+changes while it runs is held in its Session: the captured log lines, the
+metrics, the checkpoints and the configuration. Module state is shared by
+all sessions and is either constant or a cache keyed by content.
+
+port.start runs every step of the generator of a session inside the
+contextvars context of the session, so code that does not get the session
+passed (module loggers, module metrics) finds it with current().
+"""
+
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import io
+import logging
+
+import port.api.props as props
+from port.checkpoint import DEFAULT_STORE, CheckpointStore, MemoryCheckpointStore
+from port.metrics import REGISTRY, Registry, use_registry
+
+LOG_FORMAT = "%(asctime)s --- %(name)s --- %(levelname)s --- %(message)s"
+LOG_DATEFMT = "%Y-%m-%dT%H:%M:%S%z"
+
+
+@dataclass
+class SessionConfig:
+    # "M" for activity per month, "W" for activity per week
+    activity_period: str = "M"
+    # seconds each extractor may run before it is stopped with its partial results, None is no limit
+    extractor_time_budget: float | None = 300
+    # attach a snapshot of the metrics of the session to the tracking donation; this changes what the
+    # participant donates, enable it only where the consent covers performance data
+    attach_metrics: bool = False
+    # collect the log lines of the session in its log stream, they are donated with the tracking donation
+    capture_logs: bool = False
+    # profile the extraction with "cprofile" or "sampling" and donate the profile, see port.profiling
+    profile: str | None = None
+
+
+@dataclass
+class Session:
+    session_id: str = ""
+    config: SessionConfig = field(default_factory=SessionConfig)
+    log_stream: io.StringIO = field(default_factory=io.StringIO)
+    metrics: Registry = field(default_factory=Registry)
+    # checkpoints survive a retry within the session
+    checkpoints: CheckpointStore = field(default_factory=MemoryCheckpointStore)
+    # repaired mojibake escape runs, see port.unzipddp.repair_mojibake
+    mojibake_memo: dict[bytes, bytes] = field(default_factory=dict)
+    # rendered props and serialized consent tables, see port.api.props
+    props_cache: props.PropsCache = field(default_factory=props.PropsCache)
+
+    def activate(self) -> None:
+        """
+        Makes this the current session of the calling context
+        """
+        use_registry(self.metrics)
+        props.use_cache(self.props_cache)
+        _CURRENT.set(self)
+
+    def close(self) -> None:
+        """
+        Drops what the session left in the caches of the process, called when the session ends
+        """
+        self.mojibake_memo.clear()
+        self.props_cache.clear()
+
+
+# the session of code run outside port.start, for example a script run offline
+DEFAULT_SESSION = Session(metrics=REGISTRY, checkpoints=DEFAULT_STORE, props_cache=props.DEFAULT_CACHE)
+
+_CURRENT: ContextVar[Session] = ContextVar("port_session", default=DEFAULT_SESSION)
+
+
+def current() -> Session:
+    return _CURRENT.get()
+
+
+class SessionLogHandler(logging.Handler):
+    """
+    Writes the records of the port loggers to the log stream of the current session
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        session = current()
+        if not session.config.capture_logs:
+            return
+        try:
+            session.log_stream.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+
+_handler = SessionLogHandler()
+_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATEFMT))
+logging.getLogger("port").addHandler(_handler)
+logging.getLogger("port").setLevel(logging.INFO)
+
+
+def configure_logging() -> None:
+    """
+    Logs of all sessions to stderr, unless the host configured logging itself
+    """
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, datefmt=LOG_DATEFMT)
@@ -8,8 +8,12 @@ import logging
 import zipfile
 import json
 import io
+import re
+import codecs
 
+from port.archive import open_archive
 from port.my_exceptions import FileNotFoundInZipError
+from port.session import current
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +27,7 @@ def extract_file_from_zip(zfile: str, file_to_extract: str) -> io.BytesIO:
     #print('\n')
 
     try:
-        with zipfile.ZipFile(zfile, "r") as zf:
+        with open_archive(zfile) as zf:
             file_found = False
 
             for f in zf.namelist():
@@ -61,7 +65,7 @@ def extract_messages_from_zip(zfile: str) -> list[Any]:
     found_chats = []
 
     try:
-        with zipfile.ZipFile(zfile, "r") as zf:
+        with open_archive(zfile) as zf:
             file_found = False
 
             for f in zf.namelist():
@@ -86,47 +90,195 @@ def extract_messages_from_zip(zfile: str) -> list[Any]:
     finally:
         return found_chats
 
+
+class JsonDecoder:
+    """
+    Interface for json decoding backends
+    loads receives bytes without BOM in the given encoding
+    """
+    name = ""
+
+    def loads(self, json_bytes: bytes, encoding: str) -> Any:
+        raise NotImplementedError
+
+
+class StdlibJsonDecoder(JsonDecoder):
+    name = "json"
+
+    def loads(self, json_bytes: bytes, encoding: str) -> Any:
+        # json.loads decodes utf-8, utf-16 and utf-32 bytes itself
+        return json.loads(json_bytes)
+
+
+class OrjsonDecoder(JsonDecoder):
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+        self._orjson = orjson
+
+    def loads(self, json_bytes: bytes, encoding: str) -> Any:
+        if encoding != "utf8":
+            return self._orjson.loads(json_bytes.decode(encoding))
+        return self._orjson.loads(json_bytes)
+
+
+class UjsonDecoder(JsonDecoder):
+    name = "ujson"
+
+    def __init__(self) -> None:
+        import ujson
+        self._ujson = ujson
+
+    def loads(self, json_bytes: bytes, encoding: str) -> Any:
+        return self._ujson.loads(json_bytes.decode(encoding))
+
+
+# in order of preference
+JSON_DECODERS: list[type[JsonDecoder]] = [OrjsonDecoder, UjsonDecoder, StdlibJsonDecoder]
+
+_json_decoder: JsonDecoder | None = None
+
+
+def available_json_decoders() -> list[JsonDecoder]:
+    out = []
+    for decoder in JSON_DECODERS:
+        try:
+            out.append(decoder())
+        except ImportError:
+            pass
+    return out
+
+
+def get_json_decoder() -> JsonDecoder:
+    """
+    Returns the json decoder in use, the fastest available by default
+    """
+    global _json_decoder
+    if _json_decoder is None:
+        _json_decoder = available_json_decoders()[0]
+        logger.debug("Using json decoder: %s", _json_decoder.name)
+    return _json_decoder
+
+
+def set_json_decoder(decoder: JsonDecoder | None) -> None:
+    """
+    Sets the json decoder, None restores the default
+    """
+    global _json_decoder
+    _json_decoder = decoder
+
+
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+]
+
+
+def sniff_encoding(json_bytes: bytes) -> tuple[str, int]:
+    """
+    Determines the encoding from the BOM, returns the encoding and the length of the BOM
+    Without BOM the encoding is utf8
+    """
+    for bom, encoding in BOMS:
+        if json_bytes.startswith(bom):
+            return encoding, len(bom)
+    return "utf8", 0
+
+
+# Instagram escapes every byte of utf-8 encoded text as a separate code point: "é" is stored as "\u00c3\u00a9"
+# An escaped backslash followed by "u00c3" is text, so the escapes must follow an even number of backslashes:
+# group 1 holds the preceding backslash pairs, group 2 the run of escapes
+MOJIBAKE_PATTERN = re.compile(rb"(?<!\\)((?:\\\\)*)((?:\\u00[89a-fA-F][0-9a-fA-F])+)")
+# escape runs kept in the memo of a session, see port.session.Session.mojibake_memo
+MOJIBAKE_MEMO_SIZE = 100_000
+
+
+def _repair_escape_run(run: bytes) -> bytes:
+    raw = bytes(int(run[i + 4:i + 6], 16) for i in range(0, len(run), 6))
+    try:
+        raw.decode("utf8")
+        # the escaped bytes are valid utf-8, embed them as is
+        return raw
+    except UnicodeDecodeError:
+        return run
+
+
+def repair_mojibake(json_bytes: bytes) -> bytes:
+    """
+    Repairs the text of an Instagram json document before it is parsed
+
+    Runs of \u0080-\u00ff escapes that together form valid utf-8 are replaced by
+    those utf-8 bytes, so every string in the document decodes to the correct text
+    in a single pass. Repairs of repeated runs (names) are memoized in the current
+    session, so they do not outlive it.
+    """
+    if b"\\u00" not in json_bytes:
+        return json_bytes
+
+    memo = current().mojibake_memo
+
+    def repair(m: re.Match) -> bytes:
+        backslashes, run = m.groups()
+        repaired = memo.get(run)
+        if repaired is None:
+            repaired = _repair_escape_run(run)
+            if len(memo) >= MOJIBAKE_MEMO_SIZE:
+                memo.clear()
+            memo[run] = repaired
+        return backslashes + repaired
+
+    return MOJIBAKE_PATTERN.sub(repair, json_bytes)
+
+
 def _json_reader_bytes(json_bytes: bytes, encoding: str) -> Any:
-    json_bytes_stream = io.BytesIO(json_bytes)
-    stream = io.TextIOWrapper(json_bytes_stream, encoding=encoding)
-    result = json.load(stream)
-    return result
+    return get_json_decoder().loads(json_bytes, encoding)
 
 
 def _json_reader_file(json_file: str, encoding: str) -> Any:
-    with open(json_file, 'r', encoding=encoding) as f:
-        result = json.load(f)
-    return result
+    with open(json_file, 'rb') as f:
+        json_bytes = f.read()
+    encoding, bom_length = sniff_encoding(json_bytes)
+    json_bytes = json_bytes[bom_length:]
+    if encoding == "utf8":
+        json_bytes = repair_mojibake(json_bytes)
+    return get_json_decoder().loads(json_bytes, encoding)
 
 
 def _read_json(json_input: Any, json_reader: Callable[[Any, str], Any]) -> dict[Any, Any] | list[Any]:
     """
     Dunder function that read json_input and applies json_reader
-    Performs several checks (see code) and tries different encodings
+    Performs several checks (see code)
+    The encoding of bytes is sniffed from the BOM, so the json is parsed exactly once
     """
 
     out: dict[Any, Any] | list[Any] = {}
 
-    encodings = ["utf8", "utf-8-sig"]
-    for encoding in encodings:
-        try:
-            result = json_reader(json_input, encoding)
-
-            if not isinstance(result, (dict, list)):
-                raise TypeError("Did not convert bytes to a list or dict, but to another type instead")
-
-            out = result
-            logger.debug("Succesfully converted json bytes with encoding: %s", encoding)
-            break
-
-        except json.JSONDecodeError:
-            logger.error("Cannot decode json with encoding: %s", encoding)
-        except TypeError as e:
-            logger.error("%s, could not convert json bytes", e)
-            break
-        except Exception as e:
-            logger.error("%s, could not convert json bytes", e)
-            break
+    encoding = "utf8"
+    if isinstance(json_input, bytes):
+        encoding, bom_length = sniff_encoding(json_input)
+        json_input = json_input[bom_length:]
+        if encoding == "utf8":
+            json_input = repair_mojibake(json_input)
+
+    try:
+        result = json_reader(json_input, encoding)
+
+        if not isinstance(result, (dict, list)):
+            raise TypeError("Did not convert bytes to a list or dict, but to another type instead")
+
+        out = result
+        logger.debug("Succesfully converted json bytes with encoding: %s", encoding)
+
+    except (json.JSONDecodeError, ValueError):
+        logger.error("Cannot decode json with encoding: %s", encoding)
+    except TypeError as e:
+        logger.error("%s, could not convert json bytes", e)
+    except Exception as e:
+        logger.error("%s, could not convert json bytes", e)
 
     return out
 
@@ -3,11 +3,19 @@ Contains classes to deal with input validation of DDPs
 """
 from dataclasses import dataclass, field
 from enum import Enum
-
+from fnmatch import fnmatch
+from typing import Any
+import json
 import logging
+import zipfile
 
 logger = logging.getLogger(__name__)
 
+# number of decompressed bytes deep validation may read from a DDP
+DEEP_VALIDATION_BYTES = 64 * 1024
+# bytes decompressed at a time while looking for MemberSchema.after
+PREFIX_CHUNK_BYTES = 16 * 1024
+
 
 class Language(Enum):
     """ Languages Enum """
@@ -42,6 +50,181 @@ class StatusCode:
     message: str
 
 
+def matches(member: str, pattern: str) -> bool:
+    """
+    Patterns without a "/" are matched against the file name, others against the full member path
+    """
+    if "/" not in pattern:
+        member = member.rsplit("/", 1)[-1]
+    return fnmatch(member, pattern)
+
+
+@dataclass
+class MemberSchema:
+    """
+    The expected start of a key member of a DDP
+
+    pattern: fnmatch pattern of the member, see matches
+    version: the schema version reported when the member has this schema
+    root: the first non whitespace byte, b"{" or b"[" for json, b"<" for html
+    markers: keys or html classes that all occur in the first prefix_bytes of the member
+    samples: number of members checked when the pattern matches several members
+    after: the prefix starts after the first occurrence of after, b"</head>" skips the style sheet
+        at the start of html members; members without it are checked from their start
+    """
+    pattern: str
+    version: str
+    root: bytes
+    markers: tuple[bytes, ...] = ()
+    prefix_bytes: int = 4096
+    samples: int = 1
+    after: bytes = b""
+
+    def accepts(self, prefix: bytes) -> bool:
+        # a byte order mark and whitespace may precede the root
+        return prefix.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(self.root) and all(m in prefix for m in self.markers)
+
+
+@dataclass
+class MemberCheck:
+    """
+    Result of the deep validation of a single member
+    status: "ok", "unexpected_schema", "unreadable", "missing" or "skipped" (byte budget spent)
+    """
+    pattern: str
+    member: str | None
+    status: str
+    version: str | None = None
+    bytes_read: int = 0
+
+
+@dataclass
+class DeepValidation:
+    """
+    Results of the deep validation of the key members of a DDP
+    """
+    checks: list[MemberCheck] = field(default_factory=list)
+    bytes_read: int = 0
+
+    @property
+    def schema_version(self) -> str:
+        """
+        The versions of the members that were recognized, "unknown" if none were
+        """
+        versions = sorted({c.version for c in self.checks if c.version is not None})
+        return "+".join(versions) if versions else "unknown"
+
+    @property
+    def failed(self) -> bool:
+        """
+        True if members were read and none of them had a known schema
+        """
+        read = [c for c in self.checks if c.status in ("ok", "unexpected_schema", "unreadable")]
+        return bool(read) and all(c.status != "ok" for c in read)
+
+
+def _read_prefix(
+    zf: Any, info: zipfile.ZipInfo, n: int, after: bytes = b"", limit: int = 0
+) -> tuple[bytes | None, int]:
+    """
+    Decompresses only the first n bytes of a member, or the n bytes after the first occurrence of after
+
+    Returns the prefix and the number of bytes decompressed, at most limit when after is given.
+    The prefix is None when after is not found within limit; when the member does not contain
+    it, the prefix is the first n bytes.
+    """
+    with zf.open(info) as f:
+        start = f.read(n)
+        if not after:
+            return start, len(start)
+
+        read = len(start)
+        window = start
+        while True:
+            i = window.find(after)
+            if i >= 0:
+                prefix = window[i + len(after):]
+                if len(prefix) < n:
+                    rest = f.read(n - len(prefix))
+                    read += len(rest)
+                    prefix += rest
+                return prefix[:n], read
+            # leave room for the n bytes after the marker
+            room = limit - read - n
+            if room <= 0:
+                return None, read
+            chunk = f.read(min(PREFIX_CHUNK_BYTES, room))
+            if not chunk:
+                return start, read
+            read += len(chunk)
+            window = window[-len(after):] + chunk
+
+
+def deep_validate(zf: Any, schemas: list[MemberSchema], byte_budget: int = DEEP_VALIDATION_BYTES) -> DeepValidation:
+    """
+    Checks the start of the key members of an opened DDP against their expected schemas
+
+    Only the first bytes of every member are decompressed, in total at most byte_budget.
+    For schemas with an after marker the bytes up to the marker count to byte_budget as well.
+    Members that fit in their prefix are read completely and json members are parsed,
+    so small truncated members are detected as well.
+    Schemas with the same pattern are alternatives, the first that accepts the member wins.
+    """
+    result = DeepValidation()
+    infos = [info for info in zf.infolist() if not info.is_dir()]
+
+    by_pattern: dict[str, list[MemberSchema]] = {}
+    for schema in schemas:
+        by_pattern.setdefault(schema.pattern, []).append(schema)
+
+    for pattern, alternatives in by_pattern.items():
+        candidates = [info for info in infos if matches(info.filename, pattern)]
+        if not candidates:
+            result.checks.append(MemberCheck(pattern, None, "missing"))
+            continue
+
+        # spread the samples over the matching members
+        n_samples = min(max(s.samples for s in alternatives), len(candidates))
+        step = len(candidates) / n_samples
+        sample = [candidates[int(i * step)] for i in range(n_samples)]
+        prefix_bytes = max(s.prefix_bytes for s in alternatives)
+        after = next((s.after for s in alternatives if s.after), b"")
+
+        for info in sample:
+            n = min(prefix_bytes, info.file_size)
+            if result.bytes_read + n > byte_budget:
+                result.checks.append(MemberCheck(pattern, info.filename, "skipped"))
+                continue
+
+            try:
+                prefix, read = _read_prefix(zf, info, n, after, byte_budget - result.bytes_read)
+                result.bytes_read += read
+                if prefix is None:
+                    result.checks.append(MemberCheck(pattern, info.filename, "skipped", bytes_read=read))
+                    continue
+                if read < n:
+                    raise EOFError("member is shorter than its declared size")
+                if info.file_size <= prefix_bytes and alternatives[0].root in (b"{", b"["):
+                    json.loads(prefix)
+            except Exception as e:
+                logger.info("Deep validation could not read %s: %s", info.filename, e)
+                result.checks.append(MemberCheck(pattern, info.filename, "unreadable", bytes_read=n))
+                continue
+
+            schema = next((s for s in alternatives if s.accepts(prefix)), None)
+            if schema is None:
+                result.checks.append(MemberCheck(pattern, info.filename, "unexpected_schema", bytes_read=read))
+            else:
+                result.checks.append(MemberCheck(pattern, info.filename, "ok", schema.version, read))
+
+    logger.info("Deep validation read %s bytes, schema version: %s", result.bytes_read, result.schema_version)
+    for check in result.checks:
+        if check.status != "ok":
+            logger.info("Deep validation of %s: %s", check.member or check.pattern, check.status)
+
+    return result
+
+
 @dataclass
 class ValidateInput:
     """
@@ -52,6 +235,7 @@ class ValidateInput:
     ddp_categories: list[DDPCategory]
     status_code: StatusCode | None = None
     ddp_category: DDPCategory | None = None
+    deep_validation: DeepValidation | None = None
 
     ddp_categories_lookup: dict[str, DDPCategory] = field(init=False)
     status_codes_lookup: dict[int, StatusCode] = field(init=False)
@@ -0,0 +1,32 @@
+"""
+Multi-part exports, see port.archive.VirtualArchive
+"""
+
+import zipfile
+
+from port import script
+from port.headless import generate_export
+import port.checkpoint as checkpoint
+
+
+def test_split_export_extracts_as_one(tmp_path):
+    whole = generate_export(str(tmp_path / "export.zip"), n_threads=10, n_messages=20, n_likes=100)
+
+    # the members in order over two parts, the second part repeats the personal information
+    parts = [str(tmp_path / f"part{i}.zip") for i in range(2)]
+    with zipfile.ZipFile(whole) as zf:
+        infos = zf.infolist()
+        half = len(infos) // 2
+        with zipfile.ZipFile(parts[0], "w") as first, zipfile.ZipFile(parts[1], "w") as second:
+            for i, info in enumerate(infos):
+                data = zf.read(info)
+                (first if i < half else second).writestr(info, data)
+                if i < half and info.filename.startswith("personal_information/"):
+                    second.writestr(info, data)
+
+    _, expected = script.extract_instagram(whole, store=checkpoint.MemoryCheckpointStore())
+    _, result = script.extract_instagram(parts, store=checkpoint.MemoryCheckpointStore())
+
+    assert result.keys() == expected.keys()
+    for key in expected:
+        assert result[key]["data"].equals(expected[key]["data"]), key
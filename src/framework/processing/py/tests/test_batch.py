@@ -0,0 +1,57 @@
+"""
+Batched script runs through the headless host, see port.main.ScriptWrapper and port.headless
+"""
+
+import json
+
+import pytest
+
+from port.api import wire
+from port.api.commands import CommandSystemDonate
+from port.headless import ISOLATION_CONFIG, HostScript, _outcome, generate_export, run_session
+from port.main import ScriptWrapper
+
+
+def script():
+    yield CommandSystemDonate("1-tracking", json.dumps(["a"]))
+    yield CommandSystemDonate("1-tracking", json.dumps(["a", "b"]))
+    yield CommandSystemDonate("1-data", json.dumps({"n": 1}))
+    yield CommandSystemDonate("1-tracking", json.dumps(["a", "b", "c"]))
+
+
+def decode(command, mode):
+    if mode == wire.JSON:
+        return json.loads(command)
+    if mode == wire.BINARY:
+        return wire.decode_binary(command)
+    return command
+
+
+def test_batch_holds_the_latest_tracking_donation():
+    for mode in wire.MODES:
+        wrapper = ScriptWrapper(script(), mode, batch=True)
+        commands = [decode(wrapper.send(None), mode), decode(wrapper.send(None), mode)]
+
+        assert commands[0] == {
+            "__type__": "CommandBatch",
+            "commands": [
+                {"__type__": "CommandSystemDonate", "key": "1-tracking", "json_string": '["a", "b"]'},
+                {"__type__": "CommandSystemDonate", "key": "1-data", "json_string": '{"n": 1}'},
+            ],
+        }
+        # flushed when the script ends
+        assert commands[1] == {"__type__": "CommandSystemDonate", "key": "1-tracking", "json_string": '["a", "b", "c"]'}
+        with pytest.raises(StopIteration):
+            wrapper.send(None)
+
+
+def test_batched_run_round_trips_through_host(tmp_path):
+    host = HostScript(generate_export(str(tmp_path / "export.zip"), n_threads=5, n_messages=20, n_likes=50))
+
+    batched = run_session("0", host, batch=True, config=ISOLATION_CONFIG)
+    unbatched = run_session("0", host, batch=False, config=ISOLATION_CONFIG)
+
+    assert batched.error is None and unbatched.error is None
+    assert any(c.command == "CommandBatch" for c in batched.commands)
+    assert len(batched.commands) < len(unbatched.commands)
+    assert _outcome(batched)["donations"] == _outcome(unbatched)["donations"]
@@ -0,0 +1,90 @@
+"""
+The checks of the command line tools of port, run on generated exports
+"""
+
+import json
+import zipfile
+
+import pytest
+
+from port import benchmark, script, service
+from port.cancellation import CancellationToken
+from port.headless import HostScript, check_isolation, generate_export
+import port.checkpoint as checkpoint
+
+FOLLOWER_DIV = '<div class="pam _3-95 _2ph- _a6-g uiBoxWhite noborder"><div><a href="#">follower{}</a></div></div>'
+
+
+class InterruptingStore(checkpoint.MemoryCheckpointStore):
+    """
+    Cancels token at the n-th save, as if the worker were stopped there
+    """
+
+    def __init__(self, n: int) -> None:
+        super().__init__()
+        self.n = n
+        self.token = CancellationToken()
+
+    def save(self, key, state):
+        super().save(key, state)
+        self.n -= 1
+        if self.n == 0:
+            self.token.cancel("interrupted")
+
+
+@pytest.fixture(scope="module")
+def export(tmp_path_factory):
+    path = tmp_path_factory.mktemp("exports") / "export.zip"
+    return generate_export(str(path), n_threads=20, n_messages=20, n_likes=200)
+
+
+def test_follower_counts_equal_parsing(export, tmp_path):
+    indented = str(tmp_path / "indented.zip")
+    with zipfile.ZipFile(export) as zf, zipfile.ZipFile(indented, "w") as out:
+        for name in ("followers_and_following/followers_1.json", "followers_and_following/following.json"):
+            out.writestr(name, json.dumps(json.loads(zf.read(name)), indent=4))
+
+    html = str(tmp_path / "html.zip")
+    with zipfile.ZipFile(html, "w") as out:
+        divs = "".join(FOLLOWER_DIV.format(i) for i in range(25))
+        out.writestr("followers_and_following/followers_1.html", f"<html><body><main>{divs}</main></body></html>")
+        out.writestr("followers_and_following/following.html", "<html><body><main></main></body></html>")
+
+    for path in (export, indented, html):
+        rows = benchmark.follower_counts(path, repeat=1)
+        assert len(rows) == 2
+        assert all(row["equal"] for row in rows), rows
+    assert sorted(row["count"] for row in rows) == ["0", "25"]
+
+
+@pytest.mark.parametrize("n_saves", [1, 4, 9])
+def test_resumed_extraction_equals_extraction(export, monkeypatch, n_saves):
+    monkeypatch.setattr(checkpoint, "MEMBER_BATCH_SIZE", 3)
+    _, expected = script.extract_instagram(export, store=checkpoint.MemoryCheckpointStore())
+
+    store = InterruptingStore(n_saves)
+    _, interrupted = script.extract_instagram(export, store=store, token=store.token)
+    assert store.token.cancelled and not interrupted
+    _, resumed = script.extract_instagram(export, store=store)
+
+    assert resumed.keys() == expected.keys()
+    for key in expected:
+        assert resumed[key]["data"].equals(expected[key]["data"]), key
+
+
+def test_service(tmp_path):
+    zips = [generate_export(str(tmp_path / f"export{i}.zip"), n_threads=10, n_messages=20, seed=i) for i in range(2)]
+    report = service.check(zips)
+
+    assert report["differs"] == []
+    assert report["recycled"] > 0
+    assert set(report["burst_statuses"]) == {200, 503}
+    assert report["timeout_status"] == 504
+    assert report["timeout_worker_replaced"]
+
+
+def test_sessions_are_isolated(tmp_path):
+    zips = [generate_export(str(tmp_path / f"export{i}.zip"), n_threads=10, n_messages=20, seed=i) for i in range(4)]
+    report = check_isolation([HostScript(path) for path in zips], concurrency=2)
+    assert report["interleaved_differs"] == []
+    assert report["threaded_differs"] == []
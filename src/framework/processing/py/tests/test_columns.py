@@ -0,0 +1,22 @@
+"""
+The string pool of the event tables, see port.columns
+"""
+
+import hashlib
+
+import numpy as np
+
+from port.columns import StringPool
+
+
+def test_hashes_are_the_sha256_of_the_strings():
+    pool = StringPool()
+    codes = pool.codes(["alter", "", None, "alter"])
+
+    hashes = pool.take_hashes(np.asarray(codes))
+    assert hashes.tolist() == [
+        hashlib.sha256(b"alter").hexdigest(),
+        hashlib.sha256(b"").hexdigest(),
+        "",
+        hashlib.sha256(b"alter").hexdigest(),
+    ]
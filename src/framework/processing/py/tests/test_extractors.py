@@ -0,0 +1,63 @@
+"""
+Running extractors over an archive, see port.extractors.run_extractors
+"""
+
+import zipfile
+
+import pandas as pd
+
+from port.extractors import ExtractionContext, Extractor, run_extractors
+
+
+class CountingExtractor(Extractor):
+    """
+    Counts the members it is fed, raises on the member fail_on when it is given
+    """
+    patterns = ("*.json",)
+    fail_on: str | None = None
+
+    def __init__(self, context: ExtractionContext) -> None:
+        super().__init__(context)
+        self.n = 0
+
+    def feed(self, member: str, data: bytes) -> None:
+        if member == self.fail_on:
+            raise ValueError("broken member")
+        self.n += 1
+
+    def finish(self) -> dict[str, pd.DataFrame]:
+        return {table: pd.DataFrame({"n": [self.n]}) for table in self.tables}
+
+
+class Failing(CountingExtractor):
+    name = "failing"
+    tables = {"failing_table": ("failing", True)}
+    fail_on = "member3.json"
+
+
+class Dependent(CountingExtractor):
+    name = "dependent"
+    patterns = ()
+    depends_on = ("failing",)
+    tables = {"dependent_table": ("dependent", True)}
+
+
+class Complete(CountingExtractor):
+    name = "complete"
+    tables = {"complete_table": ("complete", True)}
+
+
+def test_failed_extractor_adds_no_tables(tmp_path):
+    path = str(tmp_path / "export.zip")
+    with zipfile.ZipFile(path, "w") as zf:
+        for i in range(6):
+            zf.writestr(f"member{i}.json", "{}")
+
+    context = ExtractionContext()
+    extractors = [Failing(context), Dependent(context), Complete(context)]
+    tables = run_extractors(path, extractors)
+
+    assert list(tables) == ["complete_table"]
+    assert tables["complete_table"]["n"].tolist() == [6]
+    assert extractors[0].n == 3
+    assert context.statuses == {"failing": "failed", "dependent": "failed", "complete": "ok"}
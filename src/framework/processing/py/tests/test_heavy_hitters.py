@@ -0,0 +1,57 @@
+"""
+The counters of the top accounts extractors, see port.heavy_hitters
+"""
+
+import random
+
+import pytest
+
+from port.heavy_hitters import ExactCounter, SpaceSaving
+
+
+def stream(seed, n=20_000):
+    # account names with a heavy tail, as in posts_viewed.json
+    r = random.Random(seed)
+    return [f"account{int(r.paretovariate(1.1)) % 2000}" for _ in range(n)]
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("capacity", [20, 100])
+def test_space_saving_bounds(seed, capacity):
+    approximate, exact = SpaceSaving(capacity), ExactCounter()
+    items = stream(seed)
+    for item in items:
+        approximate.add(item)
+        exact.add(item)
+
+    n = len(items)
+    assert approximate.n == exact.n == n
+    assert len(approximate.counts) <= capacity
+
+    for item, count, error in approximate.top():
+        # the reported count is an upper bound, the true count is at least count - error
+        assert count - error <= exact.counts[item] <= count
+        assert error <= n / capacity
+
+    # every item above n / capacity is tracked
+    tracked = set(approximate.counts)
+    assert all(item in tracked for item, count in exact.counts.items() if count > n / capacity)
+
+    # the top items are found in the same order
+    assert [item for item, _, _ in approximate.top(3)] == [item for item, _, _ in exact.top(3)]
+
+
+def test_space_saving_state_resumes():
+    items = stream(0, 5_000)
+    whole, first = SpaceSaving(50), SpaceSaving(50)
+    for item in items:
+        whole.add(item)
+    for item in items[:2_000]:
+        first.add(item)
+
+    resumed = SpaceSaving(50)
+    resumed.set_state(first.get_state())
+    for item in items[2_000:]:
+        resumed.add(item)
+
+    assert resumed.get_state() == whole.get_state()
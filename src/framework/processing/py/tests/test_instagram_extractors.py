@@ -0,0 +1,40 @@
+"""
+The Instagram extractors, see port.instagram_extractors
+"""
+
+import zipfile
+
+from port.extractors import ExtractionContext, run_extractors
+from port.instagram_extractors import MediaActivityJsonExtractor
+
+
+def test_media_activity_reads_the_central_directory_only(tmp_path, monkeypatch):
+    path = str(tmp_path / "export.zip")
+    with zipfile.ZipFile(path, "w") as zf:
+        members = [
+            # dated by their modification time
+            ("media/posts/202203/a.jpg", (2022, 3, 5, 12, 0, 0), 1_000_000),
+            ("media/posts/202203/b.jpg", (2022, 3, 20, 12, 0, 0), 500_000),
+            # the folder is another month than the modification time, the folder wins
+            ("media/stories/202204/c.mp4", (2023, 1, 1, 0, 0, 0), 2_000_000),
+            # without folder
+            ("media/reels/d.mp4", (2022, 4, 2, 0, 0, 0), 3_000_000),
+            ("your_topics.json", (2022, 4, 2, 0, 0, 0), 10),
+        ]
+        for name, date_time, size in members:
+            zf.writestr(zipfile.ZipInfo(name, date_time), b"x" * size)
+
+    def no_reads(self, name, *args, **kwargs):
+        raise AssertionError(f"{name} was read")
+
+    monkeypatch.setattr(zipfile.ZipFile, "open", no_reads)
+    monkeypatch.setattr(zipfile.ZipFile, "read", no_reads)
+
+    tables = run_extractors(path, [MediaActivityJsonExtractor(ExtractionContext())])
+
+    df = tables["your_media_activity"]
+    assert df.values.tolist() == [
+        ["2022-03", "Berichten", 2, 1.5],
+        ["2022-04", "Verhalen", 1, 2.0],
+        ["2022-04", "Reels", 1, 3.0],
+    ]
@@ -0,0 +1,91 @@
+"""
+Validation and extraction of html exports, see port.instagram and port.instagram_extractors
+"""
+
+import zipfile
+
+import pytest
+
+from port import instagram, script
+from port.checkpoint import MemoryCheckpointStore
+
+ROW = "<div class='pam _3-95 _2ph- _a6-g uiBoxWhite noborder'>{}</div>"
+# real exports start with a style sheet longer than the prefix that is validated
+HEAD = "<head><meta charset='utf-8'><style>{}</style></head>".format("._a6-g{margin:0;padding:0}\n" * 1000)
+
+
+def html_export(path, head):
+    def page(body):
+        return f"<html>{head}<body>{body}</body></html>"
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(
+            "personal_information/personal_information.html",
+            page(
+                "<table><tr><td class='_2pin _a6_q'>Username<div><div>me_user</div></div></td></tr>"
+                "<tr><td class='_2pin _a6_q'>Name<div><div>Me Name</div></div></td></tr>"
+                "<tr><td class='_2pin _a6_q'>Gender<div><div>male</div></div></td></tr></table>"
+            ),
+        )
+        followers = "".join(ROW.format(f"<div>follower{i}</div>") for i in range(37))
+        zf.writestr("followers_and_following/followers_1.html", page(followers))
+        zf.writestr("followers_and_following/following.html", page(followers[:len(followers) // 2]))
+        for t in range(3):
+            messages = "".join(
+                ROW.format(
+                    f"<div class='_3-95 _2pim _a6-h _a6-i'>{'Me' if m % 2 else f'alter{t}'}</div>"
+                    f"<div class='_3-95 _a6-p'><div><div></div><div>message {m} here</div></div></div>"
+                    f"<div class='_3-94 _a6-o'>Jan 0{m % 9 + 1}, 2022 1:00 pm</div>"
+                )
+                for m in range(10 + 2 * t)
+            )
+            zf.writestr(
+                f"messages/inbox/alter{t}_{t}/message_1.html",
+                page(f"<div class='_3-8y _3-95 _a70a'><div class='_a70e'>alter{t}</div></div>{messages}"),
+            )
+        like = "<div class='_3-95 _2pim _a6-h _a6-i'>account{}</div><div><div>Jan 01, 2022 1:00 pm</div></div>"
+        likes = "".join(ROW.format(like.format(i % 4)) for i in range(20))
+        zf.writestr("likes/liked_posts.html", page(likes))
+        zf.writestr("likes/liked_comments.html", page(likes[:len(likes) // 2]))
+        for name in ("index.html", "your_topics.html", "stories.html"):
+            zf.writestr(name, page(""))
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def exports(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("exports")
+    return html_export(directory / "head.zip", HEAD), html_export(directory / "no_head.zip", "")
+
+
+def test_validation_checks_the_body(exports):
+    with_head, without_head = exports
+    assert len(HEAD) > 16384
+
+    for path in exports:
+        validation = instagram.validate_zip(path, byte_budget=1 << 20)
+        assert validation.status_code.id == 0
+        assert [check.status for check in validation.deep_validation.checks] == ["ok"] * 5
+        assert validation.deep_validation.schema_version == "current"
+
+    # with the default budget the head counts as well, members beyond it are skipped
+    validation = instagram.validate_zip(with_head)
+    assert validation.status_code.id == 0
+    assert validation.deep_validation.checks[0].status == "ok"
+    assert {check.status for check in validation.deep_validation.checks} <= {"ok", "skipped"}
+
+
+def test_extraction(exports):
+    with_head, without_head = exports
+    _, expected = script.extract_instagram(without_head, store=MemoryCheckpointStore())
+    _, tables = script.extract_instagram(with_head, store=MemoryCheckpointStore())
+
+    assert tables.keys() == expected.keys()
+    for key in expected:
+        assert tables[key]["data"].equals(expected[key]["data"]), key
+
+    assert tables["your_info"]["data"]["Gebruikersnaam"].tolist() == ["me_user"]
+    assert tables["your_info2"]["data"][["Volgers", "Volgend"]].values.tolist() == [["37", "18"]]
+    assert tables["your_messages"]["data"]["Profielnaam"].tolist() == ["alter2", "alter1", "alter0"]
+    assert tables["your_likes"]["data"]["Berichten met likes"].sum() == 20
+    assert tables["your_likes"]["data"]["Reacties met likes"].sum() == 10
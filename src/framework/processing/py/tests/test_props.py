@@ -0,0 +1,73 @@
+"""
+The toDict() cache of the props, see port.api.props
+"""
+
+import contextvars
+
+import pandas as pd
+
+import port.api.props as props
+from port.session import Session
+
+
+def consent_table(data_frame):
+    title = props.Translatable({"en": "Likes", "nl": "Likes"})
+    return props.PropsUIPromptConsentFormTable("likes", title, data_frame)
+
+
+def in_session(session, f):
+    def run():
+        session.activate()
+        return f()
+    return contextvars.copy_context().run(run)
+
+
+def test_equal_props_are_serialized_once():
+    def render():
+        data_frame = pd.DataFrame({"account": ["a", "b"], "likes": [2, 1]})
+        table = consent_table(data_frame)
+        # equal content, different objects
+        page = props.PropsUIPromptConsentForm([table], [])
+        first = page.toDict()
+        assert props.PropsUIPromptConsentForm([consent_table(data_frame)], []).toDict() is first
+        return first, data_frame
+
+    first, data_frame = in_session(Session(), render)
+    assert first["tables"][0]["data_frame"] == data_frame.to_json()
+
+
+def test_mutated_frames_are_serialized_again():
+    def render():
+        data_frame = pd.DataFrame({"account": ["a", "b"], "likes": [2, 1]})
+        table = consent_table(data_frame)
+        before = table.toDict()["data_frame"]
+
+        # a change of shape is noticed
+        data_frame["comments"] = [0, 3]
+        after_shape = table.toDict()["data_frame"]
+
+        # a change of values has to be marked
+        data_frame.loc[0, "likes"] = 7
+        props.mark_frame_changed(data_frame)
+        after_values = table.toDict()["data_frame"]
+        return before, after_shape, after_values, data_frame
+
+    before, after_shape, after_values, data_frame = in_session(Session(), render)
+    assert "comments" not in before
+    assert "comments" in after_shape and '"0":2' in after_shape
+    assert after_values == data_frame.to_json() and '"0":7' in after_values
+
+
+def test_sessions_have_their_own_cache():
+    first, second = Session(), Session()
+    data_frame = pd.DataFrame({"account": ["a"], "likes": [1]})
+
+    in_session(first, lambda: consent_table(data_frame).toDict())
+    in_session(second, lambda: consent_table(data_frame).toDict())
+    # the translatable, the serialized frame and the table
+    assert len(first.props_cache) == 3 and len(second.props_cache) == 3
+
+    second.close()
+    assert len(first.props_cache) == 3 and len(second.props_cache) == 0
+    first.close()
+    assert len(first.props_cache) == 0
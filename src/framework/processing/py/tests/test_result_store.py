@@ -0,0 +1,95 @@
+"""
+The cross-run store of extractor results, see port.result_store
+"""
+
+import os
+import zipfile
+
+import pandas as pd
+
+from port.extractors import ExtractionContext, Extractor
+from port.result_store import ResultStore
+
+
+class Source(Extractor):
+    name = "source"
+    patterns = ("source.json",)
+
+
+class Dependent(Extractor):
+    """
+    Reads the state Source fills, so it needs Source to run whenever it runs
+    """
+    name = "dependent"
+    patterns = ("dependent.json",)
+    depends_on = ("source",)
+
+
+class Independent(Extractor):
+    name = "independent"
+    patterns = ("independent.json",)
+
+
+def infos(path, **contents):
+    members = {"source.json": "[1]", "dependent.json": "[2]", "independent.json": "[3]"}
+    members.update({f"{name}.json": content for name, content in contents.items()})
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    with zipfile.ZipFile(path) as zf:
+        return zf.infolist()
+
+
+def extractors():
+    context = ExtractionContext()
+    return [Source(context), Dependent(context), Independent(context)]
+
+
+def save_all(store, keys):
+    for name, key in keys.items():
+        store.save(key, {f"{name}_table": pd.DataFrame({"name": [name]})})
+
+
+def test_lookup_runs_the_dependencies_of_changed_extractors(tmp_path):
+    store = ResultStore(tmp_path / "store")
+
+    keys, found = store.lookup(infos(tmp_path / "0.zip"), extractors())
+    assert found == {}
+    save_all(store, keys)
+
+    _, found = store.lookup(infos(tmp_path / "1.zip"), extractors())
+    assert set(found) == {"source", "dependent", "independent"}
+    assert found["source"]["source_table"]["name"].tolist() == ["source"]
+
+    # dependent runs again, so source has to run as well
+    _, found = store.lookup(infos(tmp_path / "2.zip", dependent="[4]"), extractors())
+    assert set(found) == {"independent"}
+
+    # the key of source is part of the key of dependent
+    _, found = store.lookup(infos(tmp_path / "3.zip", source="[5]"), extractors())
+    assert set(found) == {"independent"}
+
+    assert store.stats.hits == 5
+    assert store.stats.misses == 7
+
+
+def test_evict_removes_the_least_recently_used(tmp_path):
+    store = ResultStore(tmp_path / "store")
+    keys, _ = store.lookup(infos(tmp_path / "0.zip"), extractors())
+    save_all(store, keys)
+
+    # saved in the order of the extractors, source is the oldest entry
+    for age, key in zip((300, 200, 100), keys.values()):
+        path = store._path(key)
+        os.utime(path, (path.stat().st_atime, path.stat().st_mtime - age))
+    # loading an entry is a use
+    assert store.load(keys["source"]) is not None
+
+    size = store._path(keys["dependent"]).stat().st_size
+    store.max_bytes = store.size() - size
+    store.evict()
+
+    assert store.stats.evictions == 1
+    assert not store._path(keys["dependent"]).exists()
+    assert store._path(keys["source"]).exists() and store._path(keys["independent"]).exists()
+    assert store.size() <= store.max_bytes
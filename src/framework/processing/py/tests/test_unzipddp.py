@@ -0,0 +1,32 @@
+"""
+Repair of the mojibake in Instagram json, see port.unzipddp.repair_mojibake
+"""
+
+import json
+
+import pytest
+
+from port.unzipddp import repair_mojibake
+
+BACKSLASH = b"\\"
+# "é" as Instagram stores it, one escape per byte of its utf-8 encoding
+E_ACUTE = BACKSLASH + b"u00c3" + BACKSLASH + b"u00a9"
+
+
+@pytest.mark.parametrize(
+    "document, text",
+    [
+        (b'"caf' + E_ACUTE + b'"', "café"),
+        # an escaped backslash followed by u00c3 is text, not an escape
+        (b'"' + BACKSLASH * 2 + b"u00c3" + BACKSLASH * 2 + b'u00a9"', "\\u00c3\\u00a9"),
+        (b'"' + BACKSLASH * 4 + b'u00c3"', "\\\\u00c3"),
+        (b'"' + BACKSLASH * 2 + b"u00c3" + BACKSLASH + b'u00a9"', "\\u00c3\u00a9"),
+        # an escaped backslash followed by an escape
+        (b'"' + BACKSLASH * 2 + E_ACUTE + b'"', "\\é"),
+        (b'"' + BACKSLASH * 4 + E_ACUTE + BACKSLASH * 2 + b'u00a9"', "\\\\é\\u00a9"),
+        # escapes that do not form utf-8 are kept
+        (b'"' + BACKSLASH + b'u00e9"', "é"),
+    ],
+)
+def test_repair_mojibake(document, text):
+    assert json.loads(repair_mojibake(document)) == text
@@ -0,0 +1,58 @@
+"""
+The wire encodings of commands, see port.api.wire
+"""
+
+import json
+
+import pandas as pd
+import pytest
+
+import port.api.props as props
+from port.api import wire
+from port.api.commands import CommandSystemDonate, CommandUIRender
+
+
+def consent_page():
+    def table(id, data_frame):
+        return props.PropsUIPromptConsentFormTable(id, props.Translatable({"en": id, "nl": id}), data_frame)
+
+    tables = [
+        table("messages", pd.DataFrame({"Profielnaam": ["café", 'say "hi"', "\\u00c3"], "Aantal": [3, 2, 1]})),
+        table("empty", pd.DataFrame({"Gebruikersnaam": []})),
+        # a value that looks like a reference to a segment
+        table("segment", pd.DataFrame({"__segment__": [0]})),
+    ]
+    body = props.PropsUIPromptConsentForm(tables, [])
+    header = props.PropsUIHeader(props.Translatable({"en": "Instagram", "nl": "Instagram"}))
+    page = props.PropsUIPageDonation("Instagram", header, body, props.PropsUIFooter(50, 12.5))
+    return CommandUIRender(page)
+
+
+def expected(command):
+    """
+    The command as the host sees it, with the embedded documents parsed
+    """
+    def parse(value):
+        if isinstance(value, dict):
+            return {k: json.loads(v) if k in wire.RAW_JSON_KEYS else parse(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [parse(v) for v in value]
+        return value
+    return parse(command.toDict())
+
+
+@pytest.mark.parametrize("command", [consent_page(), CommandSystemDonate("1-data", json.dumps({"n": "é"}))])
+def test_binary_round_trip(command):
+    buffer = wire.encode_binary(command)
+    assert buffer[:4] == wire.MAGIC
+    assert wire.decode_binary(buffer) == expected(command)
+    assert json.loads(wire.encode_json(command)) == expected(command)
+
+
+def test_binary_segments():
+    buffer = wire.encode_binary(consent_page())
+    # the skeleton and one segment per table
+    assert int.from_bytes(buffer[4:8], "little") == 4
+
+    with pytest.raises(ValueError):
+        wire.decode_binary(b"PCB0" + buffer[4:])
@@ -1,4 +1,5 @@
 let pyScript
+let wireMode = 'dict'
 
 onmessage = (event) => {
   const { eventType } = event.data
@@ -10,7 +11,10 @@ onmessage = (event) => {
       break
 
     case 'firstRunCycle':
-      pyScript = self.pyodide.runPython(`port.start(${event.data.sessionId})`)
+      // wireMode 'json' or 'binary' returns every command as a single buffer, see port/api/wire.py
+      wireMode = event.data.wireMode ?? 'dict'
+      // tracking donations arrive in a CommandBatch with the next command, see CommandRouter.onCommandBatch
+      pyScript = self.pyodide.runPython(`port.start(${event.data.sessionId}, "${wireMode}", batch=True)`)
       runCycle(null)
       break
 
@@ -31,13 +35,37 @@ function runCycle (payload) {
   scriptEvent = pyScript.send(payload)
   self.postMessage({
     eventType: 'runCycleDone',
-    scriptEvent: scriptEvent.toJs({
-      create_proxies: false,
-      dict_converter: Object.fromEntries
-    })
+    scriptEvent: wireMode === 'dict'
+      ? scriptEvent.toJs({
+        create_proxies: false,
+        dict_converter: Object.fromEntries
+      })
+      : decodeCommand(scriptEvent.toJs())
   })
 }
 
+function decodeCommand (buffer) {
+  const decoder = new TextDecoder()
+  if (wireMode === 'json') {
+    return JSON.parse(decoder.decode(buffer))
+  }
+
+  // binary: MAGIC, segment count and length prefixed segments, little endian uint32
+  const view = new DataView(buffer.buffer, buffer.byteOffset, buffer.byteLength)
+  const segments = []
+  let offset = 8
+  for (let i = 0; i < view.getUint32(4, true); i++) {
+    const size = view.getUint32(offset, true)
+    segments.push(buffer.subarray(offset + 4, offset + 4 + size))
+    offset += 4 + size
+  }
+  return JSON.parse(decoder.decode(segments[0]), (key, value) =>
+    value !== null && typeof value === 'object' && '__segment__' in value
+      ? JSON.parse(decoder.decode(segments[value.__segment__]))
+      : value
+  )
+}
+
 function unwrap (response) {
   console.log('[ProcessingWorker] unwrap response: ' + JSON.stringify(response.payload))
   return new Promise((resolve) => {
@@ -75,10 +75,11 @@ export function isPayloadJSON (arg: any): arg is PayloadJSON {
 
 export type Command =
   CommandUI |
-  CommandSystem
+  CommandSystem |
+  CommandBatch
 
 export function isCommand (arg: any): arg is Command {
-  return isCommandUI(arg) || isCommandSystem(arg)
+  return isCommandUI(arg) || isCommandSystem(arg) || isCommandBatch(arg)
 }
 
 export type CommandSystem =
@@ -111,3 +112,13 @@ export interface CommandUIRender {
 export function isCommandUIRender (arg: any): arg is CommandUIRender {
   return isInstanceOf<CommandUIRender>(arg, 'CommandUIRender', ['page']) && isPropsUIPage(arg.page)
 }
+
+export interface CommandBatch {
+  __type__: 'CommandBatch'
+  commands: Array<CommandSystem | CommandUI>
+}
+export function isCommandBatch (arg: any): arg is CommandBatch {
+  return isInstanceOf<CommandBatch>(arg, 'CommandBatch', ['commands']) &&
+    Array.isArray(arg.commands) &&
+    arg.commands.every((command: any) => isCommandSystem(command) || isCommandUI(command))
+}
@@ -335,6 +335,7 @@ export function isPropsUIHeader (arg: any): arg is PropsUIHeader {
 export interface PropsUIFooter {
   __type__: 'PropsUIFooter'
   progressPercentage: number
+  etaSeconds?: number
 }
 export function isPropsUIFooter (arg: any): arg is PropsUIFooter {
   return isInstanceOf<PropsUIFooter>(arg, 'PropsUIFooter', ['progressPercentage'])
@@ -5,7 +5,8 @@ export type PropsUIPrompt =
   PropsUIPromptFileInput |
   PropsUIPromptRadioInput |
   PropsUIPromptConsentForm |
-  PropsUIPromptConfirm
+  PropsUIPromptConfirm |
+  PropsUIPromptProgress
 
 export function isPropsUIPrompt (arg: any): arg is PropsUIPrompt {
   return isPropsUIPromptFileInput(arg) ||
@@ -23,6 +24,14 @@ export function isPropsUIPromptConfirm (arg: any): arg is PropsUIPromptConfirm {
   return isInstanceOf<PropsUIPromptConfirm>(arg, 'PropsUIPromptConfirm', ['text', 'ok', 'cancel'])
 }
 
+export interface PropsUIPromptProgress {
+  __type__: 'PropsUIPromptProgress'
+  text: Text
+}
+export function isPropsUIPromptProgress (arg: any): arg is PropsUIPromptProgress {
+  return isInstanceOf<PropsUIPromptProgress>(arg, 'PropsUIPromptProgress', ['text'])
+}
+
 export interface PropsUIPromptFileInput {
   __type__: 'PropsUIPromptFileInput'
   description: Text
@@ -4,13 +4,14 @@ import TextBundle from '../../../../text_bundle'
 import { Translator } from '../../../../translator'
 import { Translatable } from '../../../../types/elements'
 import { PropsUIPageDonation } from '../../../../types/pages'
-import { isPropsUIPromptConfirm, isPropsUIPromptConsentForm, isPropsUIPromptFileInput, isPropsUIPromptRadioInput } from '../../../../types/prompts'
+import { isPropsUIPromptConfirm, isPropsUIPromptConsentForm, isPropsUIPromptFileInput, isPropsUIPromptProgress, isPropsUIPromptRadioInput } from '../../../../types/prompts'
 import { ReactFactoryContext } from '../../factory'
 import { ForwardButton } from '../elements/button'
 import { Title2 } from '../elements/text'
 import { Confirm } from '../prompts/confirm'
 import { ConsentForm } from '../prompts/consent_form'
 import { FileInput } from '../prompts/file_input'
+import { ProgressPrompt } from '../prompts/progress'
 import { RadioInput } from '../prompts/radio_input'
 import { Footer } from './templates/footer'
 // import LogoSvg from '../../../../../assets/images/logo.svg'
@@ -24,7 +25,7 @@ export const DonationPage = (props: Props): JSX.Element => {
   // render to top of the page on reload
   window.scrollTo(0, 0)
 
-  const { title, forwardButton } = prepareCopy(props)
+  const { title, forwardButton, eta } = prepareCopy(props)
   // const { platform, locale, resolve } = props
   const { locale, resolve } = props
 
@@ -43,6 +44,9 @@ export const DonationPage = (props: Props): JSX.Element => {
     if (isPropsUIPromptRadioInput(body)) {
       return <RadioInput {...body} {...context} />
     }
+    if (isPropsUIPromptProgress(body)) {
+      return <ProgressPrompt {...body} {...context} />
+    }
     throw new TypeError('Unknown body type')
   }
 
@@ -52,7 +56,12 @@ export const DonationPage = (props: Props): JSX.Element => {
 
   const footer: JSX.Element = (
     <Footer
-      middle={<Progress percentage={props.footer.progressPercentage} />}
+      middle={
+        <div className='flex flex-row items-center gap-4'>
+          <Progress percentage={props.footer.progressPercentage} />
+          {eta !== undefined && <div className='flex-shrink-0 text-label font-label text-grey1'>{eta}</div>}
+        </div>
+      }
       right={
         <div className='flex flex-row'>
           <div className='flex-grow' />
@@ -80,15 +89,24 @@ export const DonationPage = (props: Props): JSX.Element => {
 interface Copy {
   title: string
   forwardButton: string
+  eta?: string
 }
 
-function prepareCopy ({ header: { title }, locale }: Props): Copy {
+function prepareCopy ({ header: { title }, footer: { etaSeconds }, locale }: Props): Copy {
   return {
     title: Translator.translate(title, locale),
-    forwardButton: Translator.translate(forwardButtonLabel(), locale)
+    forwardButton: Translator.translate(forwardButtonLabel(), locale),
+    eta: etaSeconds !== undefined ? Translator.translate(etaLabel(etaSeconds), locale) : undefined
   }
 }
 
+const etaLabel = (etaSeconds: number): Translatable => {
+  const minutes = Math.max(1, Math.round(etaSeconds / 60))
+  return new TextBundle()
+    .add('en', `≈ ${minutes} min`)
+    .add('nl', `≈ ${minutes} min`)
+}
+
 const forwardButtonLabel = (): Translatable => {
   return new TextBundle()
     .add('en', 'Skip')
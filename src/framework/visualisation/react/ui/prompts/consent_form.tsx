@@ -71,7 +71,8 @@ export const ConsentForm = (props: Props): JSX.Element => {
     const adjustable = tableData.adjustable
     const title = Translator.translate(tableData.title, props.locale)
     const deletedRowCount = 0
-    const dataFrame = JSON.parse(tableData.data_frame)
+    // a string with the dict wire mode, already parsed with the json and binary wire modes
+    const dataFrame = typeof tableData.data_frame === 'string' ? JSON.parse(tableData.data_frame) : tableData.data_frame
     const headCells = columnNames(dataFrame).map((column: string) => headCell(dataFrame, column))
     const head: PropsUITableHead = { __type__: 'PropsUITableHead', cells: headCells }
     const body: PropsUITableBody = { __type__: 'PropsUITableBody', rows: rows(dataFrame) }
@@ -0,0 +1,30 @@
+import * as React from 'react'
+import { Weak } from '../../../../helpers'
+import { ReactFactoryContext } from '../../factory'
+import { PropsUIPromptProgress } from '../../../../types/prompts'
+import { Translator } from '../../../../translator'
+import { BodyLarge } from '../elements/text'
+
+type Props = Weak<PropsUIPromptProgress> & ReactFactoryContext
+
+export const ProgressPrompt = (props: Props): JSX.Element => {
+  const { resolve } = props
+  const { text } = prepareCopy(props)
+
+  // answered once shown: the script works while the page stays on screen until its next render
+  React.useEffect(() => {
+    resolve?.({ __type__: 'PayloadVoid', value: undefined })
+  }, [])
+
+  return <BodyLarge text={text} margin='mb-4' />
+}
+
+interface Copy {
+  text: string
+}
+
+function prepareCopy ({ text, locale }: Props): Copy {
+  return {
+    text: Translator.translate(text, locale)
+  }
+}
@@ -0,0 +1,48 @@
+import CommandRouter from '../framework/command_router'
+import { CommandBatch, CommandSystem, CommandUI, Response } from '../framework/types/commands'
+import { System, VisualisationEngine } from '../framework/types/modules'
+
+function router (sent: CommandSystem[], rendered: CommandUI[]): CommandRouter {
+  const system: System = { send: (command) => { sent.push(command) } }
+  const visualisationEngine: VisualisationEngine = {
+    start: () => {},
+    render: async (command) => {
+      rendered.push(command)
+      const response: Response = { __type__: 'Response', command, payload: { __type__: 'PayloadTrue', value: true } }
+      return await Promise.resolve(response)
+    },
+    terminate: () => {}
+  }
+  return new CommandRouter(system, visualisationEngine)
+}
+
+// a batch as port.start(sessionId, batch=True) yields it, see port/main.py
+const batch: CommandBatch = {
+  __type__: 'CommandBatch',
+  commands: [
+    { __type__: 'CommandSystemDonate', key: '1-tracking', json_string: '["a", "b"]' },
+    { __type__: 'CommandSystemDonate', key: '1-data', json_string: '{"n": 1}' },
+    { __type__: 'CommandUIRender', page: { __type__: 'PropsUIPageEnd' } }
+  ]
+}
+
+test('a batch donates in order and is answered by its render', async () => {
+  const sent: CommandSystem[] = []
+  const rendered: CommandUI[] = []
+  const response: Response = await router(sent, rendered).onCommand(batch)
+
+  expect(sent.map((command) => command.key)).toEqual(['1-tracking', '1-data'])
+  expect(rendered).toEqual([batch.commands[2]])
+  expect(response.payload).toEqual({ __type__: 'PayloadTrue', value: true })
+})
+
+test('a batch of donations only is answered with a void payload', async () => {
+  const sent: CommandSystem[] = []
+  const rendered: CommandUI[] = []
+  const donations: CommandBatch = { __type__: 'CommandBatch', commands: batch.commands.slice(0, 2) }
+  const response: Response = await router(sent, rendered).onCommand(donations)
+
+  expect(sent.length).toBe(2)
+  expect(rendered.length).toBe(0)
+  expect(response.payload.__type__).toBe('PayloadVoid')
+})